@@ -0,0 +1,30 @@
+-- CreateTable
+CREATE TABLE "IngestionJob" (
+    "id" TEXT NOT NULL,
+    "documentId" TEXT NOT NULL,
+    "projectId" TEXT NOT NULL,
+    "bucket" TEXT NOT NULL,
+    "key" TEXT NOT NULL,
+    "fileType" TEXT NOT NULL,
+    "status" TEXT NOT NULL DEFAULT 'queued',
+    "attempts" INTEGER NOT NULL DEFAULT 0,
+    "chunksDone" INTEGER NOT NULL DEFAULT 0,
+    "chunksTotal" INTEGER,
+    "error" TEXT,
+    "timings" JSONB,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+    "startedAt" TIMESTAMP(3),
+    "finishedAt" TIMESTAMP(3),
+
+    CONSTRAINT "IngestionJob_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "IngestionJob_documentId_key" ON "IngestionJob"("documentId");
+
+-- CreateIndex
+CREATE INDEX "IngestionJob_status_createdAt_idx" ON "IngestionJob"("status", "createdAt");
+
+-- AddForeignKey
+ALTER TABLE "IngestionJob" ADD CONSTRAINT "IngestionJob_documentId_fkey" FOREIGN KEY ("documentId") REFERENCES "Document"("id") ON DELETE CASCADE ON UPDATE CASCADE;
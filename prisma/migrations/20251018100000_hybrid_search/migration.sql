@@ -0,0 +1,68 @@
+-- AlterTable: full-text vector of each chunk, kept up to date by Postgres
+ALTER TABLE "DocumentChunk" ADD COLUMN "contentTsv" tsvector GENERATED ALWAYS AS (to_tsvector('english', "content")) STORED;
+
+-- CreateIndex
+CREATE INDEX "DocumentChunk_contentTsv_idx" ON "DocumentChunk" USING gin ("contentTsv");
+
+-- Hybrid retrieval: full-text and vector candidates for a project, fused by
+-- reciprocal rank (score = Σ weight / (rrf_k + rank)) in one round trip.
+--
+-- The full-text side ORs the query's terms, so exact identifiers (APNs, loan
+-- numbers, tenant names, UCC-1 file numbers) rank a chunk highly even when
+-- the rest of the question doesn't appear in it; ts_rank_cd favours chunks
+-- matching more (and closer) terms.
+CREATE FUNCTION retrieve_document_chunks_hybrid(
+    query_embedding vector(768),
+    query_text text,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100,
+    candidate_count int DEFAULT 40,
+    rrf_k int DEFAULT 60,
+    full_text_weight float DEFAULT 1.0,
+    semantic_weight float DEFAULT 1.0
+)
+RETURNS TABLE (id text, content text, similarity float, score float)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    q tsquery := replace(plainto_tsquery('english', query_text)::text, ' & ', ' | ')::tsquery;
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, candidate_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    WITH full_text AS (
+        SELECT c.id, row_number() OVER (ORDER BY ts_rank_cd(c."contentTsv", q) DESC) AS rank_ix
+        FROM "DocumentChunk" c
+        WHERE c."projectId" = retrieve_document_chunks_hybrid.project_id
+          AND c."contentTsv" @@ q
+        ORDER BY rank_ix
+        LIMIT candidate_count
+    ),
+    semantic AS (
+        SELECT c.id, row_number() OVER (ORDER BY c.embedding <=> query_embedding) AS rank_ix
+        FROM "DocumentChunk" c
+        WHERE c."projectId" = retrieve_document_chunks_hybrid.project_id
+          AND c.embedding IS NOT NULL
+        ORDER BY c.embedding <=> query_embedding
+        LIMIT candidate_count
+    ),
+    fused AS (
+        SELECT coalesce(f.id, s.id) AS id,
+               coalesce(full_text_weight / (rrf_k + f.rank_ix), 0.0)
+             + coalesce(semantic_weight / (rrf_k + s.rank_ix), 0.0) AS score
+        FROM full_text f
+        FULL OUTER JOIN semantic s ON f.id = s.id
+        ORDER BY score DESC
+        LIMIT match_count
+    )
+    SELECT c.id, c.content, (1 - (c.embedding <=> query_embedding))::float AS similarity, fused.score::float
+    FROM fused
+    JOIN "DocumentChunk" c ON c.id = fused.id
+    ORDER BY fused.score DESC;
+END;
+$$;
@@ -0,0 +1,145 @@
+-- The retrieval RPCs also return each row's embedding, so the app can drop
+-- near-duplicate chunks (MMR) when packing the prompt without re-embedding
+-- anything. Changing a function's result type needs DROP + CREATE.
+DROP FUNCTION IF EXISTS retrieve_document_chunks(vector, float, int, text, int);
+DROP FUNCTION IF EXISTS retrieve_tasks(vector, float, int, text, int);
+DROP FUNCTION IF EXISTS retrieve_messages(vector, float, int, text, int);
+DROP FUNCTION IF EXISTS retrieve_document_chunks_hybrid(vector, text, int, text, int, int, int, float, float);
+
+CREATE FUNCTION retrieve_document_chunks(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (id text, content text, similarity float, embedding vector(768))
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    SELECT c.id, c.content, (1 - (c.embedding <=> query_embedding))::float AS similarity, c.embedding
+    FROM "DocumentChunk" c
+    WHERE c."projectId" = retrieve_document_chunks.project_id
+      AND 1 - (c.embedding <=> query_embedding) > match_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+CREATE FUNCTION retrieve_tasks(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (id text, content text, similarity float, embedding vector(768))
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    SELECT t.id, t.content, (1 - (t.embedding <=> query_embedding))::float AS similarity, t.embedding
+    FROM "Task" t
+    WHERE t."projectId" = retrieve_tasks.project_id
+      AND 1 - (t.embedding <=> query_embedding) > match_threshold
+    ORDER BY t.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+CREATE FUNCTION retrieve_messages(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    conversation_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (id text, content text, similarity float, embedding vector(768))
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    SELECT m.id, m.content, (1 - (m.embedding <=> query_embedding))::float AS similarity, m.embedding
+    FROM "Message" m
+    WHERE m."conversationId" = retrieve_messages.conversation_id
+      AND 1 - (m.embedding <=> query_embedding) > match_threshold
+    ORDER BY m.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+CREATE FUNCTION retrieve_document_chunks_hybrid(
+    query_embedding vector(768),
+    query_text text,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100,
+    candidate_count int DEFAULT 40,
+    rrf_k int DEFAULT 60,
+    full_text_weight float DEFAULT 1.0,
+    semantic_weight float DEFAULT 1.0
+)
+RETURNS TABLE (id text, content text, similarity float, score float, embedding vector(768))
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    q tsquery := replace(plainto_tsquery('english', query_text)::text, ' & ', ' | ')::tsquery;
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, candidate_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    WITH full_text AS (
+        SELECT c.id, row_number() OVER (ORDER BY ts_rank_cd(c."contentTsv", q) DESC) AS rank_ix
+        FROM "DocumentChunk" c
+        WHERE c."projectId" = retrieve_document_chunks_hybrid.project_id
+          AND c."contentTsv" @@ q
+        ORDER BY rank_ix
+        LIMIT candidate_count
+    ),
+    semantic AS (
+        SELECT c.id, row_number() OVER (ORDER BY c.embedding <=> query_embedding) AS rank_ix
+        FROM "DocumentChunk" c
+        WHERE c."projectId" = retrieve_document_chunks_hybrid.project_id
+          AND c.embedding IS NOT NULL
+        ORDER BY c.embedding <=> query_embedding
+        LIMIT candidate_count
+    ),
+    fused AS (
+        SELECT coalesce(f.id, s.id) AS id,
+               coalesce(full_text_weight / (rrf_k + f.rank_ix), 0.0)
+             + coalesce(semantic_weight / (rrf_k + s.rank_ix), 0.0) AS score
+        FROM full_text f
+        FULL OUTER JOIN semantic s ON f.id = s.id
+        ORDER BY score DESC
+        LIMIT match_count
+    )
+    SELECT c.id, c.content, (1 - (c.embedding <=> query_embedding))::float AS similarity,
+           fused.score::float, c.embedding
+    FROM fused
+    JOIN "DocumentChunk" c ON c.id = fused.id
+    ORDER BY fused.score DESC;
+END;
+$$;
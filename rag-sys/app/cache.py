@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Small key/value caches for the chat path (query embeddings, routing
+# decisions), selected by CACHE_BACKEND:
+#
+#   memory  per-process LRU with a TTL (default)
+#   redis   any Redis-compatible server at CACHE_REDIS_URL, shared by every
+#           worker; needs `pip install redis`
+#
+# Values must be JSON-serialisable. Every cache counts its hits and misses
+# in app.metrics as cache.<name>.hits / cache.<name>.misses. A backend that
+# fails is treated as a miss; caching never fails a request.
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form of a query."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _SPACE.sub(" ", text).strip(" \t\n.?!")
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class Cache(ABC):
+    def __init__(self, name: str, ttl_s: float):
+        self.name = name
+        self.ttl_s = ttl_s
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def _set(self, key: str, value: Any) -> None:
+        ...
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            value = await self._get(key)
+        except Exception as e:
+            logger.warning("cache %s get failed: %r", self.name, e)
+            value = None
+        self.record(value is not None)
+        return value
+
+    def record(self, hit: bool) -> None:
+        metrics.incr(f"cache.{self.name}.lookups")
+        metrics.incr(f"cache.{self.name}.{'hits' if hit else 'misses'}")
+
+    async def set(self, key: str, value: Any) -> None:
+        try:
+            await self._set(key, value)
+        except Exception as e:
+            logger.warning("cache %s set failed: %r", self.name, e)
+
+
+class MemoryCache(Cache):
+    def __init__(self, name: str, ttl_s: float, max_items: int):
+        super().__init__(name, ttl_s)
+        self.max_items = max_items
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def _get(self, key: str) -> Optional[Any]:
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    async def _set(self, key: str, value: Any) -> None:
+        self._items[key] = (time.monotonic() + self.ttl_s, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+
+class RedisCache(Cache):
+    def __init__(self, name: str, ttl_s: float, client):
+        super().__init__(name, ttl_s)
+        self._client = client
+        self._prefix = f"rag:{name}:"
+
+    async def _get(self, key: str) -> Optional[Any]:
+        raw = await self._client.get(self._prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    async def _set(self, key: str, value: Any) -> None:
+        await self._client.set(self._prefix + key, json.dumps(value), ex=max(1, int(self.ttl_s)))
+
+
+_redis = None
+_caches: Dict[str, Cache] = {}
+# data versions for the memory backend; one small int per scope, never evicted
+_versions: Dict[str, int] = {}
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        try:
+            import redis.asyncio as aioredis  # type: ignore
+        except ImportError:  # pragma: no cover
+            raise RuntimeError("redis is required for CACHE_BACKEND=redis; `pip install redis`. ")
+        _redis = aioredis.from_url(settings.CACHE_REDIS_URL)
+    return _redis
+
+
+def get_cache(name: str, ttl_s: float, max_items: int) -> Cache:
+    """The named cache, created on first use with the configured backend."""
+    if name not in _caches:
+        backend = settings.CACHE_BACKEND.lower()
+        if backend == "redis":
+            _caches[name] = RedisCache(name, ttl_s, _redis_client())
+        elif backend == "memory":
+            _caches[name] = MemoryCache(name, ttl_s, max_items)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND: {settings.CACHE_BACKEND}")
+    return _caches[name]
+
+
+def warn_if_unshared_versions() -> None:
+    """Data versions only reach other workers through redis; with the memory
+    backend, a write handled by one process leaves every other process's
+    answer and vector caches stale until their TTL."""
+    if settings.CACHE_BACKEND.lower() == "redis":
+        return
+    for flag in ("ANSWER_CACHE_ENABLED", "VECTOR_CACHE_ENABLED"):
+        if getattr(settings, flag):
+            logger.warning(
+                "%s is on with CACHE_BACKEND=memory: invalidation is per process, so other "
+                "workers can serve stale results; use CACHE_BACKEND=redis when running more than one",
+                flag,
+            )
+
+
+async def data_version(scope: str) -> int:
+    """Current version of `scope` (e.g. a project's data); cache entries
+    that embed it in their key are invalidated by bump_data_version()."""
+    if settings.CACHE_BACKEND.lower() == "redis":
+        try:
+            return int(await _redis_client().get(f"rag:version:{scope}") or 0)
+        except Exception as e:
+            logger.warning("data version lookup for %s failed: %r", scope, e)
+            return -1
+    return _versions.get(scope, 0)
+
+
+async def bump_data_version(scope: str) -> None:
+    if settings.CACHE_BACKEND.lower() == "redis":
+        try:
+            await _redis_client().incr(f"rag:version:{scope}")
+        except Exception as e:
+            logger.warning("data version bump for %s failed: %r", scope, e)
+        return
+    _versions[scope] = _versions.get(scope, 0) + 1
+
+
+def hit_rates() -> Dict[str, float]:
+    rates = {}
+    for name in _caches:
+        rates[name] = round(metrics.ratio(f"cache.{name}.hits", f"cache.{name}.lookups"), 3)
+    return rates
+
+
+async def close_caches() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
@@ -3,6 +3,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 from types import SimpleNamespace
 import os
+import tempfile
 import logging
 
 load_dotenv(Path(__file__).with_suffix('.env'))   # loads your .env
@@ -12,6 +13,157 @@ settings = SimpleNamespace(
     SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY"),
     GROQ_API_KEY         = os.getenv("GROQ_API_KEY"),
     DATABASE_URL         = os.getenv("DATABASE_URL"),
+
+    # embeddings: "nomic-api" (hosted) or "local" (in-process sentence-transformers, CPU);
+    # the vector columns are vector(768), so local models must produce 768-d vectors
+    EMBEDDING_BACKEND    = os.getenv("EMBEDDING_BACKEND", "nomic-api"),
+    NOMIC_API_KEY        = os.getenv("NOMIC_API_KEY"),
+    LOCAL_EMBED_MODEL    = os.getenv("LOCAL_EMBED_MODEL", "nomic-ai/nomic-embed-text-v1.5"),
+    LOCAL_EMBED_DEVICE   = os.getenv("LOCAL_EMBED_DEVICE", "cpu"),
+    # dynamic batching: requests arriving within this window are encoded together
+    LOCAL_EMBED_MAX_BATCH = int(os.getenv("LOCAL_EMBED_MAX_BATCH", "32")),
+    LOCAL_EMBED_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBED_MAX_WAIT_MS", "5")),
+
+    # chat path I/O: shared async clients; per-call limits so one slow call
+    # can't hold up a whole turn
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50")),
+    LLM_TIMEOUT_S        = float(os.getenv("LLM_TIMEOUT_S", "60")),
+    LLM_MAX_RETRIES      = int(os.getenv("LLM_MAX_RETRIES", "2")),
+    ROUTER_TIMEOUT_S     = float(os.getenv("ROUTER_TIMEOUT_S", "5")),
+    SUPABASE_TIMEOUT_S   = float(os.getenv("SUPABASE_TIMEOUT_S", "10")),
+    RETRIEVAL_TIMEOUT_S  = float(os.getenv("RETRIEVAL_TIMEOUT_S", "8")),
+    TOOL_TIMEOUT_S       = float(os.getenv("TOOL_TIMEOUT_S", "10")),
+
+    # HNSW candidate list size per retrieval query (pgvector hnsw.ef_search):
+    # higher = better recall under the project/conversation filter, slower
+    HNSW_EF_SEARCH       = int(os.getenv("HNSW_EF_SEARCH", "100")),
+
+    # document retrieval: "hybrid" (full-text + vector, reciprocal rank fusion) or "vector"
+    RETRIEVAL_MODE       = os.getenv("RETRIEVAL_MODE", "hybrid"),
+    HYBRID_CANDIDATES    = int(os.getenv("HYBRID_CANDIDATES", "40")),
+    HYBRID_RRF_K         = int(os.getenv("HYBRID_RRF_K", "60")),
+    HYBRID_FULL_TEXT_WEIGHT = float(os.getenv("HYBRID_FULL_TEXT_WEIGHT", "1.0")),
+    HYBRID_SEMANTIC_WEIGHT = float(os.getenv("HYBRID_SEMANTIC_WEIGHT", "1.0")),
+    # most queries accepted by POST /retrieval/batch
+    RETRIEVAL_BATCH_MAX  = int(os.getenv("RETRIEVAL_BATCH_MAX", "16")),
+
+    # prompt context packing: token budget for retrieved chunks (~4 chars/token),
+    # MMR relevance/diversity trade-off, and similarity above which a chunk
+    # counts as a duplicate of one already packed
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+    CONTEXT_MMR_LAMBDA   = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+    CONTEXT_DEDUP_SIM    = float(os.getenv("CONTEXT_DEDUP_SIM", "0.95")),
+
+    # chat-path caches: "memory" (per-process LRU) or "redis" (shared, CACHE_REDIS_URL)
+    CACHE_BACKEND        = os.getenv("CACHE_BACKEND", "memory"),
+    CACHE_REDIS_URL      = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+    QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048")),
+    QUERY_EMBED_CACHE_TTL_S = float(os.getenv("QUERY_EMBED_CACHE_TTL_S", "86400")),
+    ROUTE_CACHE_ENABLED  = os.getenv("ROUTE_CACHE_ENABLED", "true").lower() == "true",
+    ROUTE_CACHE_SIZE     = int(os.getenv("ROUTE_CACHE_SIZE", "2048")),
+    ROUTE_CACHE_TTL_S    = float(os.getenv("ROUTE_CACHE_TTL_S", "3600")),
+    # reuse the routing decision of a recent query whose embedding is at least
+    # this similar (1 = exact normalized-text matches only)
+    ROUTE_CACHE_SIM      = float(os.getenv("ROUTE_CACHE_SIM", "0.95")),
+
+    # project-scoped answer cache: reuse an answer for a query at least this
+    # similar, as long as the project's documents/tasks haven't changed since.
+    # Off by default with the memory backend, whose invalidation only reaches
+    # the process that did the write
+    ANSWER_CACHE_ENABLED = os.getenv(
+        "ANSWER_CACHE_ENABLED", str(os.getenv("CACHE_BACKEND", "memory").lower() == "redis")
+    ).lower() == "true",
+    ANSWER_CACHE_SIM     = float(os.getenv("ANSWER_CACHE_SIM", "0.97")),
+    ANSWER_CACHE_TTL_S   = float(os.getenv("ANSWER_CACHE_TTL_S", "21600")),
+    ANSWER_CACHE_SIZE    = int(os.getenv("ANSWER_CACHE_SIZE", "4096")),
+    ANSWER_CACHE_PER_PROJECT = int(os.getenv("ANSWER_CACHE_PER_PROJECT", "256")),
+    ANSWER_CACHE_PROJECTS = int(os.getenv("ANSWER_CACHE_PROJECTS", "256")),
+
+    # in-process per-project copy of document-chunk/task embeddings, searched
+    # with numpy instead of the retrieve_* RPCs ("float32" or "float16")
+    VECTOR_CACHE_ENABLED = os.getenv("VECTOR_CACHE_ENABLED", "false").lower() == "true",
+    VECTOR_CACHE_MAX_MB  = float(os.getenv("VECTOR_CACHE_MAX_MB", "512")),
+    VECTOR_CACHE_DTYPE   = os.getenv("VECTOR_CACHE_DTYPE", "float32"),
+    VECTOR_CACHE_TTL_S   = float(os.getenv("VECTOR_CACHE_TTL_S", "900")),
+
+    # per-conversation chat history: token budget for past turns in each prompt,
+    # sessions kept in memory, and optional summarizing of turns that fall out
+    CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500")),
+    CHAT_SESSIONS_MAX    = int(os.getenv("CHAT_SESSIONS_MAX", "512")),
+    CHAT_SESSION_IDLE_S  = float(os.getenv("CHAT_SESSION_IDLE_S", "1800")),
+    CHAT_SUMMARY_ENABLED = os.getenv("CHAT_SUMMARY_ENABLED", "false").lower() == "true",
+    CHAT_SUMMARY_MODEL   = os.getenv("CHAT_SUMMARY_MODEL", "llama-3.1-8b-instant"),
+
+    # start every source's retrieval alongside routing and drop the ones the
+    # router rejects: lower latency for up to 3 extra RPCs per turn
+    SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true",
+
+    # answer model tiers: "auto" (small model for simple lookups, large otherwise;
+    # see app/routing/model_policy.py), or "large" / "small" to pin one
+    MODEL_TIERING        = os.getenv("MODEL_TIERING", "auto"),
+    CHAT_LARGE_MODEL     = os.getenv("CHAT_LARGE_MODEL", "llama-3.3-70b-versatile"),
+    CHAT_SMALL_MODEL     = os.getenv("CHAT_SMALL_MODEL", "llama-3.1-8b-instant"),
+    TIER_SMALL_MAX_QUERY_WORDS = int(os.getenv("TIER_SMALL_MAX_QUERY_WORDS", "25")),
+    TIER_SMALL_MAX_CONTEXT_TOKENS = int(os.getenv("TIER_SMALL_MAX_CONTEXT_TOKENS", "2500")),
+    # redo a small-model answer with the large model when it comes back empty
+    # or says the (non-empty) context doesn't answer the question
+    TIER_ESCALATE        = os.getenv("TIER_ESCALATE", "true").lower() == "true",
+
+    # chat source routing: "hybrid" (local classifier, LLM when unsure), "llm" or "local"
+    ROUTER_MODE          = os.getenv("ROUTER_MODE", "hybrid"),
+    # prototype similarity above HIGH includes a source, below LOW excludes it;
+    # anything in between is left to the LLM router
+    ROUTER_SIM_HIGH      = float(os.getenv("ROUTER_SIM_HIGH", "0.78")),
+    ROUTER_SIM_LOW       = float(os.getenv("ROUTER_SIM_LOW", "0.55")),
+
+    # ingestion
+    EMBED_BATCH_SIZE     = int(os.getenv("EMBED_BATCH_SIZE", "64")),
+    INGEST_QUEUE_SIZE    = int(os.getenv("INGEST_QUEUE_SIZE", "4")),
+
+    # chat messages are embedded and written behind the response, in batches
+    MESSAGE_EMBED_BATCH_SIZE = int(os.getenv("MESSAGE_EMBED_BATCH_SIZE", "32")),
+    MESSAGE_FLUSH_INTERVAL_S = float(os.getenv("MESSAGE_FLUSH_INTERVAL_S", "1.0")),
+    MESSAGE_QUEUE_MAX    = int(os.getenv("MESSAGE_QUEUE_MAX", "10000")),
+
+    # document parsing (process pool)
+    PARSER_WORKERS       = int(os.getenv("PARSER_WORKERS", str(min(os.cpu_count() or 2, 4)))),
+    PARSER_TASKS_PER_CHILD = int(os.getenv("PARSER_TASKS_PER_CHILD", "25")),
+    PARSER_TIMEOUT_S     = float(os.getenv("PARSER_TIMEOUT_S", "600")),
+    # per-format concurrency caps, e.g. "docx=1,ocr=2"; unlisted formats share the pool
+    PARSER_LIMITS        = os.getenv("PARSER_LIMITS", "docx=1,ocr=2,pdf=2"),
+    # build docling's .docx pipeline in each parser worker before its first job
+    DOCLING_PRELOAD      = os.getenv("DOCLING_PRELOAD", "true").lower() == "true",
+    # docling pipeline options to switch off (attribute names on the pipeline options)
+    DOCLING_DISABLED_STAGES = os.getenv(
+        "DOCLING_DISABLED_STAGES",
+        "do_picture_classification,do_picture_description,generate_picture_images",
+    ),
+
+    # OCR (images, multi-frame TIFFs and PDF pages without a text layer)
+    # tesseract processes per parsing file; 0 = the cores divided by the
+    # parser slots that can OCR at once (PARSER_LIMITS ocr + pdf), since each
+    # of those runs its own pool
+    OCR_WORKERS          = int(os.getenv("OCR_WORKERS", "0")),
+    OCR_DPI              = int(os.getenv("OCR_DPI", "300")),
+    OCR_BINARIZE         = os.getenv("OCR_BINARIZE", "true").lower() == "true",
+    OCR_LANG             = os.getenv("OCR_LANG", "eng"),
+    # PDF pages with less extractable text than this are treated as scans
+    OCR_MIN_TEXT_CHARS   = int(os.getenv("OCR_MIN_TEXT_CHARS", "20")),
+
+    # ingestion job queue ("IngestionJob" table)
+    INGEST_WORKERS       = int(os.getenv("INGEST_WORKERS", "2")),
+    JOB_POLL_S           = float(os.getenv("JOB_POLL_S", "2")),
+    JOB_MAX_ATTEMPTS     = int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    # a running job whose worker hasn't checked in for this long is assumed
+    # orphaned and re-queued; live jobs check in every JOB_HEARTBEAT_S
+    JOB_STALE_S          = float(os.getenv("JOB_STALE_S", "900")),
+    JOB_HEARTBEAT_S      = float(os.getenv("JOB_HEARTBEAT_S", "60")),
+
+    # storage downloads for ingestion are streamed into this dir and always removed
+    INGEST_TMP_DIR       = os.getenv("INGEST_TMP_DIR", os.path.join(tempfile.gettempdir(), "rag-ingest")),
+    INGEST_MAX_FILE_MB   = float(os.getenv("INGEST_MAX_FILE_MB", "200")),
+    DOWNLOAD_CHUNK_KB    = int(os.getenv("DOWNLOAD_CHUNK_KB", "256")),
+    DOWNLOAD_TIMEOUT_S   = float(os.getenv("DOWNLOAD_TIMEOUT_S", "120")),
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -1,7 +1,8 @@
 from prisma import Prisma
 from .config import settings
 import os
-from supabase import create_client
+from supabase import AClient, AClientOptions, acreate_client, create_client
+from gotrue import AsyncMemoryStorage
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,4 +21,31 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 supabase = create_client(
     SUPABASE_URL,
     SUPABASE_KEY,
-)
\ No newline at end of file
+)
+
+# Async client for the chat path (retrieval RPCs). Its PostgREST client keeps
+# one pooled httpx session, so created once at startup and shared.
+async_supabase: AClient | None = None
+
+
+async def connect_supabase() -> AClient:
+    global async_supabase
+    if async_supabase is None:
+        async_supabase = await acreate_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=AClientOptions(
+                storage=AsyncMemoryStorage(),
+                auto_refresh_token=False,
+                persist_session=False,
+                postgrest_client_timeout=settings.SUPABASE_TIMEOUT_S,
+            ),
+        )
+    return async_supabase
+
+
+async def disconnect_supabase() -> None:
+    global async_supabase
+    if async_supabase is not None:
+        await async_supabase.postgrest.aclose()
+        async_supabase = None
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, NamedTuple
+from urllib.parse import quote
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Files are streamed from Supabase Storage straight to disk in
+# DOWNLOAD_CHUNK_KB pieces (hashing as we go) rather than downloaded into
+# memory and copied to a temp file. A path on disk is what the parser pool
+# needs anyway, since parsing runs in another process.
+
+
+class FileTooLarge(ValueError):
+    pass
+
+
+class DownloadedFile(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+def _object_url(bucket: str, key: str) -> str:
+    return f"{settings.SUPABASE_URL}/storage/v1/object/{quote(bucket)}/{quote(key)}"
+
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {settings.SUPABASE_SERVICE_ROLE_KEY}",
+        "apikey": settings.SUPABASE_SERVICE_ROLE_KEY,
+    }
+
+
+@asynccontextmanager
+async def download_to_tempfile(bucket: str, key: str, suffix: str = "") -> AsyncIterator[DownloadedFile]:
+    """Stream an object to a temp file that is deleted when the block exits."""
+    tmp_dir = Path(settings.INGEST_TMP_DIR)
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(suffix=suffix, dir=tmp_dir)
+    path = Path(name)
+    max_bytes = int(settings.INGEST_MAX_FILE_MB * 1024 * 1024)
+    try:
+        hasher = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as fh:
+            async with httpx.AsyncClient(timeout=settings.DOWNLOAD_TIMEOUT_S) as client:
+                async with client.stream("GET", _object_url(bucket, key), headers=_headers()) as resp:
+                    resp.raise_for_status()
+                    declared = int(resp.headers.get("content-length") or 0)
+                    if declared > max_bytes:
+                        raise FileTooLarge(f"{key} is {declared} bytes; limit is {max_bytes}")
+                    async for piece in resp.aiter_bytes(settings.DOWNLOAD_CHUNK_KB * 1024):
+                        size += len(piece)
+                        if size > max_bytes:
+                            raise FileTooLarge(f"{key} exceeds the {max_bytes} byte limit")
+                        hasher.update(piece)
+                        fh.write(piece)
+        yield DownloadedFile(path, size, hasher.hexdigest())
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def sweep_stale_downloads(max_age_s: float) -> int:
+    """Remove temp files left behind by a process that died mid-ingest."""
+    tmp_dir = Path(settings.INGEST_TMP_DIR)
+    if not tmp_dir.is_dir():
+        return 0
+    cutoff = time.time() - max_age_s
+    removed = 0
+    for entry in tmp_dir.iterdir():
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                entry.unlink()
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info("removed %s stale ingestion temp files", removed)
+    return removed
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Sequence
+
+from app.cache import get_cache, text_key
+from app.config import settings
+from app.database import db
+from app.embedding.providers import get_embedding_provider
+from app.embedding.store import (
+    batched,
+    content_hash,
+    load_cached_embeddings,
+    save_cached_embeddings,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def embed_texts(texts: Sequence[str], task_type: str) -> List[List[float]]:
+    """Embed `texts`, going through the persistent EmbeddingCache.
+
+    Only texts whose (model, task_type, sha256) isn't cached yet are sent to
+    the embedding provider; their vectors are written back to the cache.
+    Meant for text that gets embedded again (document chunks on re-ingest,
+    task content); one-off text such as chat queries and messages should use
+    embed_uncached so it doesn't cost a table round trip and row each.
+    """
+    provider = get_embedding_provider()
+    hashes = [content_hash(t) for t in texts]
+    cached: Dict[str, List[float]] = {}
+    for batch in batched(list(dict.fromkeys(hashes)), settings.EMBED_BATCH_SIZE):
+        cached.update(await load_cached_embeddings(db, provider.model, task_type, batch))
+
+    missing = {h: t for h, t in zip(hashes, texts) if h not in cached}
+    hits = sum(h in cached for h in hashes)
+    if missing:
+        vectors = await provider.embed(list(missing.values()), task_type)
+        fresh = dict(zip(missing.keys(), vectors))
+        await save_cached_embeddings(db, provider.model, task_type, fresh.items())
+        cached.update(fresh)
+    logger.debug("embed_texts: %s/%s from cache", hits, len(texts))
+    return [cached[h] for h in hashes]
+
+
+async def embed_uncached(texts: Sequence[str], task_type: str) -> List[List[float]]:
+    """Embed `texts` with the provider directly, bypassing EmbeddingCache."""
+    if not texts:
+        return []
+    return await get_embedding_provider().embed(list(texts), task_type)
+
+
+async def embed_query(text: str) -> List[float]:
+    """Embed a chat query, reusing the vector of any earlier query with the
+    same normalized text (see app.cache)."""
+    return (await embed_queries([text]))[0]
+
+
+async def embed_queries(texts: Sequence[str]) -> List[List[float]]:
+    """embed_query for several queries; the uncached ones are embedded in a
+    single provider call."""
+    provider = get_embedding_provider()
+    cache = get_cache("query_embedding", settings.QUERY_EMBED_CACHE_TTL_S, settings.QUERY_EMBED_CACHE_SIZE)
+    keys = [f"{provider.model}:{text_key(t)}" for t in texts]
+    vectors = [await cache.get(key) for key in keys]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        fresh = await embed_uncached([texts[i] for i in missing], "search_query")
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+            await cache.set(keys[i], vector)
+    return vectors
@@ -1,17 +1,27 @@
 from __future__ import annotations
 
+import csv
 from pathlib import Path
-from typing import Callable, Dict, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List
 from semantic_text_splitter import TextSplitter
-import pandas as pd
 from docling.document_converter import DocumentConverter
-import re
+
+from app.config import settings
+from app.embedding.ocr import Image, Page, iter_frames, ocr_pages, rasterize_pdf_page
 
 max_characters = 1000
 splitter = TextSplitter(max_characters)
 
+# Extractors are generators: each yields one page / slide / sheet / block of
+# text at a time so a document never has to sit in memory as one string.
+Segments = Iterator[str]
+
 # ──────────────────────────  Common helpers  ────────────────────────────
 
+# segments built from many small pieces (docx paragraphs, text lines) are
+# cut at roughly this many characters
+_TEXT_BLOCK = 64 * 1024
+
 def _clean(text: str) -> str:
   return " ".join(text.split())
 
@@ -22,13 +32,20 @@ try:
 except ImportError:  # pragma: no cover
   pdfplumber = None
 
-def _parse_pdf(path: Path) -> str:
-  out: List[str] = []
+def _pdf_pages(pdf) -> Iterator[Page]:
+  for page in pdf.pages:
+    txt = _clean(page.extract_text() or "")
+    # no usable text layer → scanned page, hand the rendered image to OCR
+    if len(txt) < settings.OCR_MIN_TEXT_CHARS:
+      yield rasterize_pdf_page(page)
+    else:
+      yield txt
+    page.close()  # drop per-page layout caches
+
+def _parse_pdf(path: Path) -> Segments:
   with pdfplumber.open(path) as pdf:
-    for i, page in enumerate(pdf.pages, 1):
-      txt = page.extract_text() or ""
-      out.append(f"{_clean(txt)}")
-    return "\n\n".join(out)
+    for txt in ocr_pages(_pdf_pages(pdf)):
+      yield _clean(txt)
 
 # ──────────────────────────  PowerPoint  ────────────────────────────────
 
@@ -37,44 +54,161 @@ try:
 except ImportError:  # pragma: no cover
   Presentation = None  # type: ignore
 
-def _parse_pptx(path: Path) -> str:
+def _parse_pptx(path: Path) -> Segments:
   if Presentation is None:  # pragma: no cover
     raise RuntimeError("python-pptx is required for .pptx parsing; `pip install python-pptx`. ")
   prs = Presentation(path)
-  slides: List[str] = []
-  for idx, slide in enumerate(prs.slides, 1):
+  for slide in prs.slides:
     texts = [
       shape.text.strip()
       for shape in slide.shapes
       if hasattr(shape, "text") and shape.text.strip()
     ]
-    slides.append(f"{_clean(' '.join(texts))}")
-  return "\n\n".join(slides)
+    yield _clean(' '.join(texts))
 
 # ──────────────────────────  Excel / CSV  ───────────────────────────────
 
+# Spreadsheets bypass the TextSplitter: rows are streamed from a read-only
+# iterator and packed into chunks that end on a row boundary, each starting
+# with the sheet name and the header row, so a chunk is always a readable
+# table and memory doesn't depend on sheet size.
+
+try:
+  import openpyxl  # type: ignore
+except ImportError:  # pragma: no cover
+  openpyxl = None  # type: ignore
+
 try:
   import pandas as pd  # type: ignore
 except ImportError:  # pragma: no cover
   pd = None  # type: ignore
 
-def _parse_excel(path: Path) -> str:
+def _cell(value: Any) -> str:
+  if value is None:
+    return ""
+  # empty cells from read_excel(header=None) are float NaN (or NaT / pd.NA)
+  if pd is not None and pd.api.types.is_scalar(value) and pd.isna(value):
+    return ""
+  return _clean(str(value)).replace("|", "\\|")
+
+def _md_row(cells: List[str]) -> str:
+  return "| " + " | ".join(cells) + " |"
+
+def _row_chunks(title: str, rows: Iterable[Iterable[Any]]) -> Iterator[str]:
+  header: List[str] | None = None
+  prefix = ""
+  body: List[str] = []
+  size = 0
+  emitted = False
+  for row in rows:
+    cells = [_cell(v) for v in row]
+    while cells and not cells[-1]:
+      cells.pop()
+    if not cells:
+      continue
+    if header is None:
+      header = cells
+      prefix = f"{title}\n{_md_row(header)}\n{_md_row(['---'] * len(header))}\n"
+      continue
+    cells += [""] * (len(header) - len(cells))
+    line = _md_row(cells)
+    if body and len(prefix) + size + len(line) > max_characters:
+      yield prefix + "\n".join(body)
+      body, size, emitted = [], 0, True
+    if len(prefix) + len(line) > max_characters:
+      # one row wider than a whole chunk: split the row, keep the header on each piece
+      for piece in splitter.chunks(line):
+        yield prefix + piece
+      emitted = True
+      continue
+    body.append(line)
+    size += len(line) + 1
+  if body:
+    yield prefix + "\n".join(body)
+  elif header is not None and not emitted:
+    yield prefix.rstrip()  # header-only sheet
+
+def _chunk_xlsx(path: Path) -> Iterator[str]:
+  if openpyxl is None:  # pragma: no cover
+    raise RuntimeError("openpyxl is required for Excel parsing; `pip install openpyxl`. ")
+  wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+  try:
+    for ws in wb.worksheets:
+      yield from _row_chunks(f"[sheet {ws.title}]", ws.iter_rows(values_only=True))
+  finally:
+    wb.close()
+
+def _chunk_xls(path: Path) -> Iterator[str]:
+  # legacy .xls has no streaming reader; xlrd loads one sheet at a time
   if pd is None:  # pragma: no cover
-    raise RuntimeError("pandas + openpyxl are required for Excel parsing; `pip install pandas openpyxl`. ")
-
-  if path.suffix.lower() == ".csv":
-    df = pd.read_csv(path)
-    df.dropna(how="all", inplace=True)
-    return f"[csv]\n{df.to_markdown(index=False)}"
-
-  all_sheets = pd.read_excel(path, sheet_name=None)
-  for df in all_sheets.values():
-    df.replace("", pd.NA, inplace=True)
-    df.dropna(how="all", inplace=True)
-  out: List[str] = []
-  for name, df in all_sheets.items():
-    out.append(f"[sheet {name}]\n{df.to_markdown(index=False)}")
-  return "\n\n".join(out)
+    raise RuntimeError("pandas + xlrd are required for .xls parsing; `pip install pandas xlrd`. ")
+  for name in pd.ExcelFile(path).sheet_names:
+    df = pd.read_excel(path, sheet_name=name, header=None)
+    yield from _row_chunks(f"[sheet {name}]", df.itertuples(index=False, name=None))
+    del df
+
+def _chunk_csv(path: Path) -> Iterator[str]:
+  with path.open(newline="", encoding="utf-8-sig", errors="replace") as fh:
+    try:
+      dialect = csv.Sniffer().sniff(fh.read(8192), delimiters=",;\t|")
+    except csv.Error:
+      dialect = csv.excel
+    fh.seek(0)
+    yield from _row_chunks("[csv]", csv.reader(fh, dialect))
+
+# ──────────────────────────  Word (docling)  ────────────────────────────
+
+# Docling builds its pipeline on first use, which costs seconds; keep one
+# converter per process (i.e. per parser worker) and reuse it.
+_docling_converter: DocumentConverter | None = None
+
+def _build_docling_converter() -> DocumentConverter:
+  from docling.datamodel.base_models import InputFormat
+  from docling.document_converter import WordFormatOption
+
+  option = WordFormatOption()
+  pipeline_options = option.pipeline_cls.get_default_options()
+  for stage in filter(None, (s.strip() for s in settings.DOCLING_DISABLED_STAGES.split(","))):
+    if hasattr(pipeline_options, stage):
+      setattr(pipeline_options, stage, False)
+  option.pipeline_options = pipeline_options
+
+  converter = DocumentConverter(
+    allowed_formats=[InputFormat.DOCX],
+    format_options={InputFormat.DOCX: option},
+  )
+  converter.initialize_pipeline(InputFormat.DOCX)
+  return converter
+
+def get_docling_converter() -> DocumentConverter:
+  global _docling_converter
+  if _docling_converter is None:
+    _docling_converter = _build_docling_converter()
+  return _docling_converter
+
+def _iter_docling_text(document: Any) -> Iterator[str]:
+  # walk the document tree in reading order instead of exporting the whole
+  # thing to a dict first; table text lives on the cells
+  for item, _level in document.iterate_items():
+    text = getattr(item, "text", None)
+    if text:
+      yield text
+    for cell in getattr(getattr(item, "data", None), "table_cells", None) or []:
+      if cell.text:
+        yield cell.text
+
+def _parse_docx(path: Path) -> Segments:
+  result = get_docling_converter().convert(str(path))
+  block: List[str] = []
+  size = 0
+  for text in _iter_docling_text(result.document):
+    block.append(text)
+    size += len(text)
+    if size >= _TEXT_BLOCK:
+      yield _clean(" ".join(block))
+      block, size = [], 0
+  if block:
+    yield _clean(" ".join(block))
 
 # ──────────────────────────  Text / Markdown  ───────────────────────────
 
@@ -85,63 +219,38 @@ except ImportError:  # pragma: no cover
 
 _MD = markdown_it.MarkdownIt("commonmark") if markdown_it else None  # type: ignore
 
-def _parse_docx(path: Path) -> str:
-    # 1. Parse with Docling
-    converter = DocumentConverter()
-    result = converter.convert(str(path))
-
-    # 2. Export to a nested dict
-    doc_dict = result.document.export_to_dict()
-
-    # 3. Recursively extract every "text" field
-    def _collect_text(obj: Any, out: List[str]) -> None:
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                if k == "text" and isinstance(v, str):
-                    out.append(v)
-                else:
-                    _collect_text(v, out)
-        elif isinstance(obj, list):
-            for item in obj:
-                _collect_text(item, out)
-
-    pieces: List[str] = []
-    _collect_text(doc_dict, pieces)
-
-    # 4. Join and collapse whitespace
-    full = " ".join(pieces)
-    cleaned = re.sub(r"\s+", " ", full).strip()
-    return cleaned
-
-def _parse_text(path: Path) -> str:
-  raw = path.read_text(encoding="utf-8", errors="ignore")
-  if path.suffix.lower() in {".md", ".markdown"} and _MD is not None:
-    return _clean(_MD.render(raw))
-  return _clean(raw)
+def _parse_text(path: Path) -> Segments:
+  markdown = path.suffix.lower() in {".md", ".markdown"} and _MD is not None
+  with path.open(encoding="utf-8", errors="ignore") as fh:
+    block: List[str] = []
+    size = 0
+    for line in fh:
+      block.append(line)
+      size += len(line)
+      # only cut on blank lines so markdown blocks stay intact
+      if size >= _TEXT_BLOCK and not line.strip():
+        raw = "".join(block)
+        yield _clean(_MD.render(raw) if markdown else raw)
+        block, size = [], 0
+    if block:
+      raw = "".join(block)
+      yield _clean(_MD.render(raw) if markdown else raw)
 
 # ──────────────────────────  Images (OCR)  ──────────────────────────────
 
-try:
-  from PIL import Image  # type: ignore
-  import pytesseract  # type: ignore
-except ImportError:  # pragma: no cover
-  Image = None  # type: ignore
-  pytesseract = None  # type: ignore
-
-def _parse_image(path: Path, lang: str = "eng") -> str:
-  if Image is None or pytesseract is None:  # pragma: no cover
+def _parse_image(path: Path) -> Segments:
+  if Image is None:  # pragma: no cover
     raise RuntimeError("pillow + pytesseract are required for OCR; `pip install pillow pytesseract`. ")
-  img = Image.open(path)
-  return _clean(pytesseract.image_to_string(img, lang=lang))
+  with Image.open(path) as img:
+    # multi-frame TIFFs yield one segment per frame, OCR'd in parallel
+    for txt in ocr_pages(iter_frames(img)):
+      yield _clean(txt)
 
 # ──────────────────────────  Dispatch table  ────────────────────────────
 
-_EXTRACTOR_MAP: Dict[str, Callable[[Path], str]] = {
+_EXTRACTOR_MAP: Dict[str, Callable[[Path], Segments]] = {
     ".pdf":  _parse_pdf,
     ".pptx": _parse_pptx,
-    ".xlsx": _parse_excel,
-    ".xls":  _parse_excel,
-    ".csv":  _parse_excel,
     ".txt":  _parse_text,
     ".md":   _parse_text,
     ".markdown": _parse_text,
@@ -149,24 +258,56 @@ _EXTRACTOR_MAP: Dict[str, Callable[[Path], str]] = {
     ".jpg":  _parse_image,
     ".jpeg": _parse_image,
     ".tiff": _parse_image,
+    ".tif":  _parse_image,
     ".docx": _parse_docx,
 }
 
+# extractors that already emit finished, row-aligned chunks
+_CHUNK_EXTRACTOR_MAP: Dict[str, Callable[[Path], Iterator[str]]] = {
+    ".xlsx": _chunk_xlsx,
+    ".xls":  _chunk_xls,
+    ".csv":  _chunk_csv,
+}
+
+# ──────────────────────────  Splitting  ─────────────────────────────────
+
+def _split_stream(segments: Iterable[str]) -> Iterator[str]:
+  """Split a stream of segments, carrying the unfinished tail chunk forward.
+
+  Only about two chunks' worth of text plus the current segment is ever held,
+  and chunks may still span page / slide boundaries as before.
+  """
+  carry = ""
+  for segment in segments:
+    if not segment:
+      continue
+    carry = f"{carry}\n\n{segment}" if carry else segment
+    if len(carry) < 2 * max_characters:
+      continue
+    chunks = splitter.chunks(carry)
+    yield from chunks[:-1]
+    carry = chunks[-1] if chunks else ""
+  if carry:
+    yield from splitter.chunks(carry)
+
 # ──────────────────────────  Public API  ────────────────────────────────
 
-def get_extractor(fileType: str | None = None) -> Callable[[Path], str]:
+def get_extractor(fileType: str | None = None) -> Callable[[Path], Segments]:
   ext = fileType.lower()
-  func = _EXTRACTOR_MAP.get(ext)
+  func = _EXTRACTOR_MAP.get(ext) or _CHUNK_EXTRACTOR_MAP.get(ext)
   if func is None:
     raise ValueError(f"Unsupported file type: {ext}")
   return func
-from pathlib import Path
 
-def extract_chunks(path: str | Path) -> list[str]:
+def iter_chunks(path: str | Path) -> Iterator[str]:
     path = Path(path)
     ext  = path.suffix.lower()            # e.g. ".pdf", ".pptx", ".csv", etc.
+    if ext in _CHUNK_EXTRACTOR_MAP:
+        return _CHUNK_EXTRACTOR_MAP[ext](path)
     extractor = _EXTRACTOR_MAP.get(ext)
     if extractor is None:
         raise ValueError(f"Unsupported file extension: {ext}")
-    text = extractor(path)
-    return splitter.chunks(text)
\ No newline at end of file
+    return _split_stream(extractor(path))
+
+def extract_chunks(path: str | Path) -> list[str]:
+    return list(iter_chunks(path))
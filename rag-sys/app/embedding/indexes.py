@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import List
+
+# HNSW indexes behind the retrieve_* RPCs (migration 20251018090000).
+# Index name → table; only these can be inspected or rebuilt through the
+# admin endpoints.
+VECTOR_INDEXES = {
+    "DocumentChunk_embedding_hnsw_idx": "DocumentChunk",
+    "Task_embedding_hnsw_idx": "Task",
+    "Message_embedding_hnsw_idx": "Message",
+}
+
+_NAMES = ", ".join(f"'{name}'" for name in VECTOR_INDEXES)
+
+
+async def vector_index_stats(client) -> List[dict]:
+    """Size, validity, usage and build parameters of each vector index."""
+    return await client.query_raw(
+        f'''
+        SELECT s.indexrelname AS name,
+               s.relname AS "table",
+               pg_relation_size(s.indexrelid) AS "sizeBytes",
+               pg_size_pretty(pg_relation_size(s.indexrelid)) AS size,
+               c.reltuples::bigint AS "tableRows",
+               s.idx_scan AS scans,
+               i.indisvalid AS valid,
+               pg_get_indexdef(s.indexrelid) AS definition
+        FROM pg_stat_user_indexes s
+        JOIN pg_index i ON i.indexrelid = s.indexrelid
+        JOIN pg_class c ON c.oid = s.relid
+        WHERE s.indexrelname IN ({_NAMES})
+        ORDER BY s.indexrelname
+        '''
+    )
+
+
+async def rebuild_vector_index(client, name: str) -> None:
+    """REINDEX one vector index without blocking reads or writes.
+
+    Worth doing after a bulk load or a large delete: HNSW graphs don't shrink
+    and lose recall as deleted tuples pile up. Also repairs an index left
+    invalid by an interrupted build.
+    """
+    if name not in VECTOR_INDEXES:
+        raise KeyError(name)
+    await client.execute_raw(f'REINDEX INDEX CONCURRENTLY "{name}"')
@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import mimetypes
+import time
+import uuid
+from typing import List, Optional
+
+from app.config import settings
+from app.database import db
+from app.embedding.download import FileTooLarge, download_to_tempfile, sweep_stale_downloads
+from app.embedding.pipeline import ingest_file
+from app.embedding.store import document_state, existing_chunk_hashes
+from app.routing.answer_cache import invalidate_project
+
+logger = logging.getLogger(__name__)
+
+# Ingestion jobs live in the "IngestionJob" table (one row per document) and
+# are worked by INGEST_WORKERS tasks inside this process. Workers claim rows
+# with FOR UPDATE SKIP LOCKED, so several app instances can share the table.
+#
+#   queued ─▶ running ─▶ succeeded
+#                 └────▶ queued (retry, attempts < JOB_MAX_ATTEMPTS) / failed
+#
+# A failed attempt leaves the document as it was: ingest_file deletes the
+# chunks it wrote and clears the new file hash, so the retry can't be
+# skipped as "unchanged".
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+async def enqueue_job(
+    project_id: str,
+    document_id: str,
+    bucket: str,
+    key: str,
+    file_type: str,
+) -> dict:
+    """Queue ingestion for a document.
+
+    Idempotent on `document_id`: while a job for the document is queued or
+    running it is returned unchanged; a finished or failed one is re-queued.
+    """
+    rows = await db.query_raw(
+        '''
+        INSERT INTO "IngestionJob"
+          (id, "documentId", "projectId", bucket, key, "fileType", status, "updatedAt")
+        VALUES
+          ($1, $2, $3, $4, $5, $6, 'queued', now())
+        ON CONFLICT ("documentId") DO UPDATE SET
+          "projectId" = EXCLUDED."projectId",
+          bucket = EXCLUDED.bucket,
+          key = EXCLUDED.key,
+          "fileType" = EXCLUDED."fileType",
+          status = 'queued',
+          attempts = 0,
+          error = NULL,
+          "updatedAt" = now()
+        WHERE "IngestionJob".status NOT IN ('queued', 'running')
+        RETURNING *
+        ''',
+        str(uuid.uuid4()), document_id, project_id, bucket, key, file_type,
+    )
+    if rows:
+        job_runner.wake()
+        return rows[0]
+    return await get_job_by_document(document_id)
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    rows = await db.query_raw('SELECT * FROM "IngestionJob" WHERE id = $1', job_id)
+    return rows[0] if rows else None
+
+
+async def get_job_by_document(document_id: str) -> Optional[dict]:
+    rows = await db.query_raw('SELECT * FROM "IngestionJob" WHERE "documentId" = $1', document_id)
+    return rows[0] if rows else None
+
+
+async def retry_job(job_id: str) -> Optional[dict]:
+    """Put a failed job back on the queue; other states are returned as-is."""
+    rows = await db.query_raw(
+        '''
+        UPDATE "IngestionJob"
+        SET status = 'queued', attempts = 0, error = NULL, "updatedAt" = now()
+        WHERE id = $1 AND status = 'failed'
+        RETURNING *
+        ''',
+        job_id,
+    )
+    if rows:
+        job_runner.wake()
+        return rows[0]
+    return await get_job(job_id)
+
+
+def job_status(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "document_id": job["documentId"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "chunks_done": job["chunksDone"],
+        "chunks_total": job["chunksTotal"],
+        "error": job["error"],
+        "timings": job["timings"],
+        "created_at": job["createdAt"],
+        "started_at": job["startedAt"],
+        "finished_at": job["finishedAt"],
+    }
+
+
+# ──────────────────────────  Worker side  ───────────────────────────────
+
+async def _claim_next() -> Optional[dict]:
+    # orphaned jobs (process died mid-run, so no heartbeat for JOB_STALE_S)
+    # go back on the queue first, minus whatever chunks their dead attempt
+    # managed to write
+    await db.execute_raw(
+        '''
+        WITH orphaned AS (
+          UPDATE "IngestionJob"
+          SET status = 'queued', "updatedAt" = now()
+          WHERE status = 'running'
+            AND "updatedAt" < now() - make_interval(secs => $1)
+          RETURNING "documentId", "startedAt"
+        )
+        DELETE FROM "DocumentChunk" c
+        USING orphaned o
+        WHERE c."documentId" = o."documentId" AND c."createdAt" >= o."startedAt"
+        ''',
+        settings.JOB_STALE_S,
+    )
+    rows = await db.query_raw(
+        '''
+        UPDATE "IngestionJob"
+        SET status = 'running',
+            attempts = attempts + 1,
+            "chunksDone" = 0,
+            "chunksTotal" = NULL,
+            error = NULL,
+            "startedAt" = now(),
+            "finishedAt" = NULL,
+            "updatedAt" = now()
+        WHERE id = (
+          SELECT id FROM "IngestionJob"
+          WHERE status = 'queued'
+          ORDER BY "createdAt"
+          FOR UPDATE SKIP LOCKED
+          LIMIT 1
+        )
+        RETURNING *
+        '''
+    )
+    return rows[0] if rows else None
+
+
+async def _report_progress(job_id: str, done: int, total: Optional[int]) -> None:
+    await db.execute_raw(
+        '''
+        UPDATE "IngestionJob"
+        SET "chunksDone" = $2, "chunksTotal" = $3, "updatedAt" = now()
+        WHERE id = $1
+        ''',
+        job_id, done, total,
+    )
+
+
+async def _process(job: dict) -> dict:
+    timings: dict[str, float] = {}
+    stage_start = time.perf_counter()
+
+    def _lap(stage: str) -> None:
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[stage] = round((now - stage_start) * 1000, 1)
+        stage_start = now
+
+    # 1 ── stream the object from Storage into a temp file (removed on exit)
+    suffix = mimetypes.guess_extension(job["fileType"]) or ""
+    async with download_to_tempfile(job["bucket"], job["key"], suffix) as download:
+        print(f"[DEBUG] job {job['id']}: downloaded {download.size} bytes to {download.path}")
+        _lap("download_ms")
+
+        # 2 ── skip files whose every chunk already came from these exact bytes
+        state = await document_state(db, job["documentId"], download.sha256)
+        if state["total"] and state["current"] == state["total"]:
+            print(f"[DEBUG] job {job['id']}: file unchanged, skipping")
+            return {"chunks": state["total"], "timings": timings, "skipped": True}
+
+        # 3 ── extract → embed → store, streamed batch by batch; only chunks
+        #      that changed since the last version are embedded
+        async def on_progress(done: int, total: Optional[int]) -> None:
+            await _report_progress(job["id"], done, total)
+
+        existing = await existing_chunk_hashes(db, job["documentId"])
+        stats = await ingest_file(
+            download.path, job["projectId"], job["documentId"], download.sha256, existing, on_progress,
+        )
+        _lap("ingest_ms")
+    print(
+        f"[DEBUG] job {job['id']}: {stats['chunks_new']} new, {stats['chunks_kept']} unchanged, "
+        f"{stats['chunks_deleted']} removed"
+    )
+
+    timings["total_ms"] = round(sum(timings.values()), 1)
+    for stage in ("parse_ms", "embed_ms", "store_ms", "first_chunk_stored_ms"):
+        timings[stage] = stats[stage]
+    for count in ("chunks_new", "chunks_kept", "chunks_deleted"):
+        timings[count] = stats[count]
+    return {"chunks": stats["chunks_processed"], "timings": timings, "skipped": False}
+
+
+async def _finish(job: dict, result: dict) -> None:
+    await db.execute_raw(
+        '''
+        UPDATE "IngestionJob"
+        SET status = 'succeeded', "chunksDone" = $2, "chunksTotal" = $2,
+            timings = $3::jsonb, "finishedAt" = now(), "updatedAt" = now()
+        WHERE id = $1
+        ''',
+        job["id"], result["chunks"], json.dumps(result["timings"]),
+    )
+    if not result["skipped"]:
+        await invalidate_project(job["projectId"])
+
+
+async def _fail(job: dict, error: str, requeue: bool) -> None:
+    # ingest_file has already removed whatever chunks the attempt wrote
+    await db.execute_raw(
+        '''
+        UPDATE "IngestionJob"
+        SET status = $2, error = $3, "chunksDone" = 0,
+            "finishedAt" = CASE WHEN $2 = 'failed' THEN now() END,
+            "updatedAt" = now()
+        WHERE id = $1
+        ''',
+        job["id"], QUEUED if requeue else FAILED, error,
+    )
+    # chunks written (and now removed) by this attempt may have been read
+    await invalidate_project(job["projectId"])
+
+
+async def _heartbeat(job_id: str) -> None:
+    # progress is only reported after a stored batch; a download, a slow
+    # parser (docling returns a .docx only at the end) or slow embedding
+    # would otherwise look like a dead worker to _claim_next
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_S)
+        try:
+            await db.execute_raw(
+                '''
+                UPDATE "IngestionJob" SET "updatedAt" = now()
+                WHERE id = $1 AND status = 'running'
+                ''',
+                job_id,
+            )
+        except Exception as e:
+            logger.warning("heartbeat for job %s failed: %s", job_id, e)
+
+
+async def _run_one(job: dict) -> None:
+    print(f"[DEBUG] job {job['id']}: starting attempt {job['attempts']} for document {job['documentId']}")
+    heartbeat = asyncio.create_task(_heartbeat(job["id"]), name=f"job-heartbeat-{job['id']}")
+    try:
+        result = await _process(job)
+    except asyncio.CancelledError:
+        # shutting down: hand the job back so the next process picks it up
+        await asyncio.shield(_fail(job, "interrupted by shutdown", requeue=True))
+        raise
+    except Exception as e:
+        retry = job["attempts"] < settings.JOB_MAX_ATTEMPTS and not isinstance(e, FileTooLarge)
+        print(f"[ERROR] job {job['id']}: attempt {job['attempts']} failed: {e}")
+        await _fail(job, str(e), requeue=retry)
+        return
+    finally:
+        heartbeat.cancel()
+    await _finish(job, result)
+    print(f"[DEBUG] job {job['id']}: stored {result['chunks']} chunks")
+
+
+class JobRunner:
+    def __init__(self, workers: int, poll_interval: float):
+        self._workers = workers
+        self._poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        sweep_stale_downloads(settings.JOB_STALE_S)
+        self._tasks = [
+            asyncio.create_task(self._work(n), name=f"ingest-worker-{n}")
+            for n in range(self._workers)
+        ]
+        logger.info("ingestion job runner started with %s workers", self._workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self, n: int) -> None:
+        while True:
+            try:
+                job = await _claim_next()
+            except Exception as e:
+                logger.error("ingest-worker-%s: failed to claim a job: %s", n, e)
+                job = None
+            if job is not None:
+                try:
+                    await _run_one(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # bookkeeping failed; JOB_STALE_S will re-queue the row
+                    logger.error("ingest-worker-%s: job %s crashed: %s", n, job["id"], e)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+job_runner = JobRunner(settings.INGEST_WORKERS, settings.JOB_POLL_S)
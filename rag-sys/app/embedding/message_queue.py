@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, List, NamedTuple, Optional
+
+from app.config import settings
+from app.database import db
+from app.embedding.embedder import embed_uncached
+from app.embedding.store import embed_user_messages, insert_messages
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Write-behind persistence of chat messages. A finished turn only appends to
+# an in-memory queue; a background task embeds the queued messages in
+# batches and writes them in bulk, so neither the embedding call nor the
+# insert sits on the request path.
+#
+# Assistant answers are inserted (content + vector). User messages are
+# already stored by the web app before it calls /chat, so they only get
+# their vector filled in; one is inserted only if no stored copy is found.
+# If embedding a batch fails the messages are still written, without
+# vectors. Pending messages are flushed on shutdown.
+#
+# A turn's timestamps come from the request: the question is stamped when
+# it arrived and the answer strictly after it, so the two always sort in
+# order however quickly the answer came back.
+
+
+def utc_timestamp(when: Optional[datetime] = None) -> str:
+    """`when` (default: now) as the naive UTC ISO string Message.createdAt uses."""
+    when = when or datetime.now(timezone.utc)
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when.isoformat(timespec="milliseconds")
+
+
+class PendingMessage(NamedTuple):
+    conversation_id: str
+    role: str
+    content: str
+    # answers are timestamped when produced, not when flushed, so a delayed
+    # flush can't sort one after the user's next message
+    created_at: str
+
+
+class MessageQueue:
+    def __init__(self, batch_size: int, flush_interval_s: float, max_pending: int):
+        self._batch_size = batch_size
+        self._flush_interval_s = flush_interval_s
+        self._max_pending = max_pending
+        self._pending: Deque[PendingMessage] = deque()
+        # the batch being written; still unsaved as far as readers know
+        self._writing: List[PendingMessage] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: asyncio.Event | None = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="message-writer")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._pending:
+            if not await self._flush():
+                logger.error("dropping %s unsaved chat messages at shutdown", len(self._pending))
+                break
+
+    def enqueue(
+        self, conversation_id: str, role: str, content: str, created_at: Optional[str] = None,
+    ) -> Optional[str]:
+        """Queue a message; returns its createdAt (None if it was empty)."""
+        if not content:
+            return None
+        if len(self._pending) >= self._max_pending:
+            # the writer has been failing for a while; keep memory bounded
+            dropped = self._pending.popleft()
+            metrics.incr("message_queue.dropped")
+            logger.error("message queue full, dropping a %s message of %s", dropped.role, dropped.conversation_id)
+        created = created_at or utc_timestamp()
+        self._pending.append(PendingMessage(conversation_id, role, content, created))
+        metrics.incr("message_queue.enqueued")
+        if len(self._pending) >= self._batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return created
+
+    def enqueue_turn(
+        self, conversation_id: str, user_message: str, answer: str, asked_at: Optional[str] = None,
+    ) -> Optional[str]:
+        """Queue a turn; `asked_at` is when the question arrived (see
+        utc_timestamp). Returns the answer's createdAt."""
+        asked_at = asked_at or utc_timestamp()
+        answered_at = max(
+            utc_timestamp(),
+            utc_timestamp(datetime.fromisoformat(asked_at) + timedelta(milliseconds=1)),
+        )
+        self.enqueue(conversation_id, "user", user_message, asked_at)
+        return self.enqueue(conversation_id, "assistant", answer, answered_at)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def pending_for(self, conversation_id: str) -> List[PendingMessage]:
+        """Messages of a conversation not written to the database yet."""
+        return [m for m in (*self._writing, *self._pending) if m.conversation_id == conversation_id]
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            while self._pending:
+                if not await self._flush():
+                    break   # database trouble; retry on the next interval
+
+    async def _flush(self) -> bool:
+        batch: List[PendingMessage] = [
+            self._pending.popleft() for _ in range(min(self._batch_size, len(self._pending)))
+        ]
+        self._writing = batch
+        try:
+            return await self._write(batch)
+        finally:
+            self._writing = []
+
+    async def _write(self, batch: List[PendingMessage]) -> bool:
+        t0 = time.perf_counter()
+        try:
+            vectors = await embed_uncached([m.content for m in batch], "search_document")
+        except Exception as e:
+            logger.error("embedding %s chat messages failed, saving them without vectors: %s", len(batch), e)
+            metrics.incr("message_queue.embed_failures")
+            vectors = [None] * len(batch)
+
+        try:
+            # one transaction, so a retry can't find its user messages already
+            # embedded and insert them a second time
+            async with db.tx() as tx:
+                users = [(m.conversation_id, m.content, v) for m, v in zip(batch, vectors) if m.role == "user"]
+                matched = await embed_user_messages(tx, users)
+                # a user message with no stored copy is inserted, with or
+                # without its vector, rather than lost
+                inserts = [
+                    (m.conversation_id, m.role, m.content, v, m.created_at)
+                    for m, v in zip(batch, vectors)
+                    if m.role != "user" or (m.conversation_id, m.content) not in matched
+                ]
+                await insert_messages(tx, inserts, self._batch_size)
+        except Exception as e:
+            logger.error("writing %s chat messages failed, will retry: %s", len(batch), e)
+            metrics.incr("message_queue.write_failures")
+            self._pending.extendleft(reversed(batch))
+            return False
+
+        metrics.incr("message_queue.written", len(batch))
+        metrics.observe("message_queue.flush", (time.perf_counter() - t0) * 1000)
+        return True
+
+
+message_queue = MessageQueue(
+    settings.MESSAGE_EMBED_BATCH_SIZE,
+    settings.MESSAGE_FLUSH_INTERVAL_S,
+    settings.MESSAGE_QUEUE_MAX,
+)
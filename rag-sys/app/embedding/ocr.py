@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, Union
+
+from app.config import settings
+
+try:
+    from PIL import Image, ImageOps, ImageSequence  # type: ignore
+    import pytesseract  # type: ignore
+except ImportError:  # pragma: no cover
+    Image = ImageOps = ImageSequence = None  # type: ignore
+    pytesseract = None  # type: ignore
+
+# Pages are OCR'd on a thread pool: pytesseract shells out to the tesseract
+# binary, so threads give real parallelism (each tesseract is kept single
+# threaded via OMP_THREAD_LIMIT in the parser workers). Results come back in
+# page order, and at most 2 × OCR_WORKERS page images are in memory at once.
+
+# a page is either an image to OCR or text that is already known
+Page = Union["Image.Image", str]
+
+# never upscale a low-res scan by more than this
+_MAX_UPSCALE = 2.0
+
+
+def _require() -> None:
+    if Image is None or pytesseract is None:  # pragma: no cover
+        raise RuntimeError("pillow + pytesseract are required for OCR; `pip install pillow pytesseract`. ")
+
+
+def preprocess(img: "Image.Image") -> "Image.Image":
+    """Grayscale, rescale to OCR_DPI when the source DPI is known, and binarize."""
+    dpi = (img.info.get("dpi") or (0, 0))[0]
+    img = ImageOps.exif_transpose(img).convert("L")
+    if dpi:
+        scale = min(settings.OCR_DPI / float(dpi), _MAX_UPSCALE)
+        if abs(scale - 1.0) > 0.05:
+            img = img.resize((round(img.width * scale), round(img.height * scale)), Image.LANCZOS)
+    if settings.OCR_BINARIZE:
+        img = ImageOps.autocontrast(img).point(lambda px: 255 if px > 160 else 0, mode="1")
+    return img
+
+
+def ocr_image(img: "Image.Image", lang: str | None = None) -> str:
+    _require()
+    return pytesseract.image_to_string(preprocess(img), lang=lang or settings.OCR_LANG)
+
+
+def iter_frames(img: "Image.Image") -> Iterator["Image.Image"]:
+    """Every frame of a (possibly multi-page) image, detached from the file."""
+    _require()
+    for frame in ImageSequence.Iterator(img):
+        copy = frame.copy()
+        copy.info.setdefault("dpi", img.info.get("dpi"))
+        yield copy
+
+
+def rasterize_pdf_page(page) -> "Image.Image":
+    """Render a pdfplumber page at OCR_DPI."""
+    img = page.to_image(resolution=settings.OCR_DPI).original
+    img.info["dpi"] = (settings.OCR_DPI, settings.OCR_DPI)
+    return img
+
+
+def _done(text: str) -> Future:
+    future: Future = Future()
+    future.set_result(text)
+    return future
+
+
+def _workers() -> int:
+    if settings.OCR_WORKERS > 0:
+        return settings.OCR_WORKERS
+    from app.embedding.parser_pool import _parse_limits  # parser_pool imports this module
+
+    # every parser worker handling an image or PDF runs its own pool; split
+    # the cores between as many of them as PARSER_LIMITS lets run at once
+    limits = _parse_limits(settings.PARSER_LIMITS)
+    slots = sum(limits.get(group, settings.PARSER_WORKERS) for group in ("ocr", "pdf"))
+    slots = max(1, min(slots, settings.PARSER_WORKERS))
+    return max(1, (os.cpu_count() or 2) // slots)
+
+
+def ocr_pages(pages: Iterable[Page], lang: str | None = None) -> Iterator[str]:
+    """OCR `pages` in parallel, yielding their text in the original order.
+
+    String pages pass straight through, so callers can mix pages that already
+    have a text layer with ones that need OCR.
+    """
+    workers = _workers()
+    window = workers * 2
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as pool:
+        pending: deque[Future] = deque()
+        for page in pages:
+            pending.append(_done(page) if isinstance(page, str) else pool.submit(ocr_image, page, lang))
+            while len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
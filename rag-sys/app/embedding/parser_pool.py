@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from pathlib import Path
+from typing import AsyncIterator, Dict, List
+
+from app.config import settings
+from app.embedding.extractor import get_docling_converter, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+# Parsers (pdfplumber, python-pptx, pandas, docling, tesseract) are CPU bound
+# and some of them leak, so they run in worker processes instead of on the
+# event loop. Each worker parses one file at a time and is replaced after
+# PARSER_TASKS_PER_CHILD files. A parser that spends more than
+# PARSER_TIMEOUT_S producing a file's batches gets its own worker killed and
+# replaced; files in the other workers are unaffected. Time spent waiting on
+# the consumer (embedding / storage backpressure) doesn't count.
+
+_FORMAT_GROUPS: Dict[str, str] = {
+    ".pdf": "pdf",
+    ".pptx": "pptx",
+    ".xlsx": "spreadsheet",
+    ".xls": "spreadsheet",
+    ".csv": "spreadsheet",
+    ".txt": "text",
+    ".md": "text",
+    ".markdown": "text",
+    ".png": "ocr",
+    ".jpg": "ocr",
+    ".jpeg": "ocr",
+    ".tiff": "ocr",
+    ".tif": "ocr",
+    ".docx": "docx",
+}
+
+_POLL_S = 1.0
+
+
+class ParserTimeout(Exception):
+    pass
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        group, _, n = item.partition("=")
+        limits[group.strip()] = int(n)
+    return limits
+
+
+# ──────────────────────────  Worker side  ───────────────────────────────
+
+def _init_worker() -> None:
+    # the parent handles Ctrl-C / shutdown; keep native libs single threaded
+    # so N workers don't each spin up a thread per core
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    if settings.DOCLING_PRELOAD:
+        try:
+            get_docling_converter()
+        except Exception as e:  # a broken docling install shouldn't take the worker down
+            logger.warning("docling preload failed: %s", e)
+
+
+def _produce(path: str, out, cancel, batch_size: int) -> int:
+    chunks = iter_chunks(path)
+    produced = 0
+    while batch := list(itertools.islice(chunks, batch_size)):
+        while True:
+            if cancel.is_set():
+                return produced
+            try:
+                out.put(batch, timeout=_POLL_S)
+                break
+            except queue.Full:
+                continue
+        produced += len(batch)
+    out.put(None)
+    return produced
+
+
+def _worker_main(jobs, tasks_per_child: int) -> None:
+    _init_worker()
+    for _ in range(tasks_per_child) if tasks_per_child > 0 else itertools.count():
+        job = jobs.get()
+        if job is None:
+            return
+        path, out, cancel, batch_size = job
+        try:
+            _produce(path, out, cancel, batch_size)
+        except Exception as e:
+            # sent in place of the next batch and re-raised by the parent
+            try:
+                out.put(e)
+            except Exception:  # unpicklable exception
+                out.put(RuntimeError(f"{type(e).__name__}: {e}"))
+
+
+# ──────────────────────────  Parent side  ───────────────────────────────
+
+class _Worker:
+    def __init__(self, ctx, tasks_per_child: int):
+        self.jobs = ctx.Queue()
+        self.process = ctx.Process(
+            target=_worker_main, args=(self.jobs, tasks_per_child), daemon=True,
+        )
+        self.process.start()
+        self.tasks = 0
+
+
+class ParserPool:
+    def __init__(self, workers: int, tasks_per_child: int, timeout: float, limits: Dict[str, int]):
+        self._workers = workers
+        self._tasks_per_child = tasks_per_child
+        self._timeout = timeout
+        self._limits = limits
+        self._ctx = multiprocessing.get_context("spawn")
+        self._manager = None
+        self._idle: asyncio.Queue | None = None
+        self._procs: List[_Worker] = []
+        self._group_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def start(self) -> None:
+        if self._idle is not None:
+            return
+        self._manager = self._ctx.Manager()
+        # spawn the workers now so their initializer (docling preload) runs
+        # at startup instead of in front of the first upload
+        self._idle = asyncio.Queue()
+        for _ in range(self._workers):
+            self._idle.put_nowait(self._spawn())
+        self._group_slots = {
+            group: asyncio.Semaphore(n) for group, n in self._limits.items()
+        }
+        logger.info("parser pool started: workers=%s limits=%s", self._workers, self._limits)
+
+    def shutdown(self) -> None:
+        for worker in self._procs:
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._procs = []
+        self._idle = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx, self._tasks_per_child)
+        self._procs.append(worker)
+        return worker
+
+    def _retire(self, worker: _Worker) -> None:
+        if worker in self._procs:
+            self._procs.remove(worker)
+
+    def _release(self, worker: _Worker) -> None:
+        if self._idle is None:  # shut down meanwhile
+            return
+        spent = self._tasks_per_child > 0 and worker.tasks >= self._tasks_per_child
+        if spent or worker not in self._procs or not worker.process.is_alive():
+            # a spent worker exits on its own once its last job returns
+            self._retire(worker)
+            worker = self._spawn()
+        self._idle.put_nowait(worker)
+
+    async def iter_batches(self, path: str | Path, batch_size: int) -> AsyncIterator[List[str]]:
+        """Parse `path` in a worker process, yielding chunk batches as they're produced."""
+        if self._idle is None:
+            self.start()
+        group = _FORMAT_GROUPS.get(Path(path).suffix.lower(), "other")
+        group_slot = self._group_slots.get(group)
+
+        if group_slot is not None:
+            await group_slot.acquire()
+        try:
+            worker = await self._idle.get()
+            try:
+                async for batch in self._run(worker, str(path), batch_size):
+                    yield batch
+            finally:
+                self._release(worker)
+        finally:
+            if group_slot is not None:
+                group_slot.release()
+
+    async def _run(self, worker: _Worker, path: str, batch_size: int) -> AsyncIterator[List[str]]:
+        loop = asyncio.get_running_loop()
+        out = self._manager.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        cancel = self._manager.Event()
+        worker.jobs.put((path, out, cancel, batch_size))
+        worker.tasks += 1
+        # the deadline only runs while we're waiting on the parser, not while
+        # the caller holds a batch (suspended at `yield` under backpressure)
+        waited = 0.0
+        finished = False
+        try:
+            while True:
+                remaining = self._timeout - waited
+                if remaining <= 0:
+                    # a hung parser can't be interrupted from outside its
+                    # process; kill its worker (replaced on release) and
+                    # leave the others alone
+                    worker.process.terminate()
+                    self._retire(worker)
+                    logger.warning("parser worker killed after %s timed out", Path(path).name)
+                    raise ParserTimeout(f"parsing {Path(path).name} exceeded {self._timeout:.0f}s")
+                t0 = loop.time()
+                try:
+                    item = await asyncio.to_thread(out.get, True, min(remaining, _POLL_S))
+                except queue.Empty:
+                    if not worker.process.is_alive():
+                        self._retire(worker)
+                        raise RuntimeError(f"parser worker died while parsing {Path(path).name}")
+                    continue
+                finally:
+                    waited += loop.time() - t0
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item  # the parser's own exception
+                yield item
+            finished = True
+        finally:
+            if not finished:
+                # consumer went away (downstream error / cancellation) or the
+                # worker is gone: tell the parser to stop instead of blocking
+                # on a full queue
+                cancel.set()
+
+
+parser_pool = ParserPool(
+    workers=settings.PARSER_WORKERS,
+    tasks_per_child=settings.PARSER_TASKS_PER_CHILD,
+    timeout=settings.PARSER_TIMEOUT_S,
+    limits=_parse_limits(settings.PARSER_LIMITS),
+)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+from pathlib import Path
+from typing import AbstractSet, Awaitable, Callable, Optional
+
+from app.config import settings
+from app.database import db
+from app.embedding.embedder import embed_texts
+from app.embedding.parser_pool import parser_pool
+from app.embedding.store import (
+    content_hash,
+    delete_stale_chunks,
+    discard_new_chunks,
+    insert_document_chunks,
+    mark_chunks_current,
+)
+
+# parse ─▶ [queue] ─▶ embed ─▶ [queue] ─▶ store
+#
+# Each stage runs as its own task and the queues are bounded, so parsing can
+# only run INGEST_QUEUE_SIZE batches ahead of embedding (and embedding ahead
+# of storage). Memory stays flat however large the file is, and the first
+# batch is in the DB while later pages are still being parsed.
+#
+# Re-ingesting a document is incremental: chunks whose content hash already
+# exists for the document are kept (re-stamped with the new file hash)
+# instead of re-embedded, and whatever wasn't stamped is deleted at the end.
+#
+# Batches are committed as they are stored (there is no transaction around
+# the whole file), so retrieval can see a document's first chunks before the
+# rest. If any stage fails, the chunks this run inserted are deleted again
+# before the error propagates, so a failed file never stays half indexed:
+# it keeps its previous version's chunks, or none if it is new.
+
+_DONE = object()
+
+# called after every stored batch with (chunks_done, chunks_total); the total
+# is None until the parser has finished
+ProgressCallback = Callable[[int, Optional[int]], Awaitable[None]]
+
+
+async def ingest_file(
+    path: str | Path,
+    project_id: str,
+    document_id: str,
+    file_hash: str,
+    existing_hashes: AbstractSet[str] = frozenset(),
+    on_progress: ProgressCallback | None = None,
+) -> dict:
+    batch_size = settings.EMBED_BATCH_SIZE
+    to_embed: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+    to_store: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+    started = time.perf_counter()
+    stats = {
+        "chunks_processed": 0,
+        "chunks_parsed": 0,
+        "chunks_total": None,
+        "chunks_new": 0,
+        "chunks_kept": 0,
+        "chunks_deleted": 0,
+        "batches": 0,
+        "parse_ms": 0.0,
+        "embed_ms": 0.0,
+        "store_ms": 0.0,
+        "first_chunk_stored_ms": None,
+    }
+
+    def _ms(since: float) -> float:
+        return (time.perf_counter() - since) * 1000
+
+    async def parse() -> None:
+        # parsing happens in the parser pool; parse_ms is time spent waiting on it
+        t0 = time.perf_counter()
+        # aclosing: if this task is cancelled mid-file, the generator's
+        # cleanup (stop the parser, free its worker and PARSER_LIMITS slot)
+        # runs now rather than whenever the async generator is finalized
+        async with contextlib.aclosing(parser_pool.iter_batches(path, batch_size)) as batches:
+            async for batch in batches:
+                stats["parse_ms"] += _ms(t0)
+                stats["chunks_parsed"] += len(batch)
+                await to_embed.put(batch)
+                t0 = time.perf_counter()
+        stats["parse_ms"] += _ms(t0)
+        stats["chunks_total"] = stats["chunks_parsed"]
+        await to_embed.put(_DONE)
+
+    seen: set[str] = set()
+    inserted: list[str] = []
+
+    async def embed() -> None:
+        while (batch := await to_embed.get()) is not _DONE:
+            fresh, kept = [], []
+            for chunk in batch:
+                h = content_hash(chunk)
+                if h in seen:  # repeated text within the file is stored once
+                    continue
+                seen.add(h)
+                if h in existing_hashes:
+                    kept.append(h)
+                else:
+                    fresh.append(chunk)
+            t0 = time.perf_counter()
+            vectors = await embed_texts(fresh, "search_document") if fresh else []
+            stats["embed_ms"] += _ms(t0)
+            await to_store.put((fresh, vectors, kept))
+        await to_store.put(_DONE)
+
+    async def store() -> None:
+        while (item := await to_store.get()) is not _DONE:
+            fresh, vectors, kept = item
+            t0 = time.perf_counter()
+            inserted.extend(content_hash(chunk) for chunk in fresh)
+            stats["chunks_new"] += await insert_document_chunks(
+                db, project_id, document_id, fresh, vectors, batch_size, file_hash,
+            )
+            await mark_chunks_current(db, document_id, kept, file_hash)
+            stats["chunks_kept"] += len(kept)
+            stats["chunks_processed"] = stats["chunks_new"] + stats["chunks_kept"]
+            stats["store_ms"] += _ms(t0)
+            stats["batches"] += 1
+            if stats["first_chunk_stored_ms"] is None:
+                stats["first_chunk_stored_ms"] = _ms(started)
+            print(f"[DEBUG] stored batch {stats['batches']} ({stats['chunks_processed']} chunks so far)")
+            if on_progress is not None:
+                await on_progress(stats["chunks_processed"], stats["chunks_total"])
+
+    tasks = [asyncio.create_task(stage()) for stage in (parse, embed, store)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if inserted:
+            try:
+                deleted = await asyncio.shield(discard_new_chunks(db, document_id, file_hash, inserted))
+                print(f"[DEBUG] ingest of document {document_id} failed; removed {deleted} new chunks")
+            except Exception as e:
+                print(f"[ERROR] removing partial chunks of document {document_id} failed: {e}")
+        raise
+
+    stats["chunks_deleted"] = await delete_stale_chunks(db, document_id, file_hash)
+    stats["pipeline_ms"] = _ms(started)
+    for key, value in stats.items():
+        if isinstance(value, float):
+            stats[key] = round(value, 1)
+    return stats
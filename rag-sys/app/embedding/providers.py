@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Everything that needs vectors (chat queries, file ingestion, task
+# embedding) goes through one EmbeddingProvider, chosen by EMBEDDING_BACKEND:
+#
+#   nomic-api  hosted nomic embed.text API (default)
+#   local      nomic-embed-text-v1.5 (or LOCAL_EMBED_MODEL) run in-process
+#              on CPU with sentence-transformers; needs
+#              `pip install sentence-transformers einops`
+#
+# Providers report `model`, which is also the EmbeddingCache key, so vectors
+# from different backends are never mixed up in the cache.
+
+
+class EmbeddingProvider(ABC):
+    model: str
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def embed(self, texts: Sequence[str], task_type: str) -> List[List[float]]:
+        ...
+
+
+# ──────────────────────────  Hosted nomic API  ──────────────────────────
+
+class NomicAPIProvider(EmbeddingProvider):
+    model = "nomic-embed-text-v1.5"
+
+    def __init__(self, batch_size: int):
+        self._batch_size = batch_size
+        self._logged_in = False
+
+    def _embed_sync(self, texts: Sequence[str], task_type: str) -> List[List[float]]:
+        import nomic
+        from nomic import embed
+
+        if not self._logged_in:
+            nomic.login(settings.NOMIC_API_KEY)
+            self._logged_in = True
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self._batch_size):
+            result = embed.text(
+                texts=list(texts[start:start + self._batch_size]),
+                model=self.model,
+                task_type=task_type,
+            )
+            vectors.extend(result["embeddings"])
+        return vectors
+
+    async def embed(self, texts: Sequence[str], task_type: str) -> List[List[float]]:
+        return await asyncio.to_thread(self._embed_sync, texts, task_type)
+
+
+# ──────────────────────────  Local CPU model  ───────────────────────────
+
+class LocalSentenceTransformerProvider(EmbeddingProvider):
+    """In-process model with dynamic batching.
+
+    Concurrent callers put their texts on a queue; a single batcher task
+    drains up to `max_batch` texts (waiting at most `max_wait_ms` for more to
+    arrive) and encodes them in one forward pass on a dedicated thread.
+    """
+
+    def __init__(self, model_name: str, device: str, max_batch: int, max_wait_ms: float):
+        self.model = model_name
+        self._device = device
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+        self._st = None
+        self._queue: asyncio.Queue | None = None
+        self._batcher: asyncio.Task | None = None
+        # torch already uses every core per forward pass; one encode at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+    def _load(self) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer  # type: ignore
+        except ImportError:  # pragma: no cover
+            raise RuntimeError(
+                "sentence-transformers is required for EMBEDDING_BACKEND=local; "
+                "`pip install sentence-transformers einops`. "
+            )
+        self._st = SentenceTransformer(self.model, device=self._device, trust_remote_code=True)
+        logger.info("loaded local embedding model %s on %s", self.model, self._device)
+
+    async def start(self) -> None:
+        if self._batcher is not None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._load)
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run(), name="embed-batcher")
+
+    async def stop(self) -> None:
+        if self._batcher is not None:
+            self._batcher.cancel()
+            await asyncio.gather(self._batcher, return_exceptions=True)
+            self._batcher = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def embed(self, texts: Sequence[str], task_type: str) -> List[List[float]]:
+        if not texts:
+            return []
+        if self._batcher is None:
+            await self.start()
+        # nomic models expect the task as a text prefix, so requests for
+        # different task types can share a batch
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(([f"{task_type}: {t}" for t in texts], future))
+        return await future
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self._st.encode(
+            texts,
+            batch_size=self._max_batch,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).tolist()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            size = len(requests[0][0])
+            deadline = loop.time() + self._max_wait
+            while size < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            texts = [t for batch, _ in requests for t in batch]
+            try:
+                vectors = await loop.run_in_executor(self._executor, self._encode, texts)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            offset = 0
+            for batch, future in requests:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(batch)])
+                offset += len(batch)
+
+
+# ──────────────────────────  Selection  ─────────────────────────────────
+
+_provider: Optional[EmbeddingProvider] = None
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    global _provider
+    if _provider is None:
+        backend = settings.EMBEDDING_BACKEND.lower()
+        if backend == "local":
+            _provider = LocalSentenceTransformerProvider(
+                settings.LOCAL_EMBED_MODEL,
+                settings.LOCAL_EMBED_DEVICE,
+                settings.LOCAL_EMBED_MAX_BATCH,
+                settings.LOCAL_EMBED_MAX_WAIT_MS,
+            )
+        elif backend == "nomic-api":
+            _provider = NomicAPIProvider(settings.EMBED_BATCH_SIZE)
+        else:
+            raise ValueError(f"Unknown EMBEDDING_BACKEND: {settings.EMBEDDING_BACKEND}")
+    return _provider
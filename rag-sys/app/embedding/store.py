@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import uuid
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+
+def batched(items: Sequence, size: int) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def content_hash(data: str | bytes) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def parse_vector(value) -> List[float] | None:
+    """pgvector values arrive as their text form ("[0.1,0.2,...]")."""
+    if value is None or isinstance(value, list):
+        return value
+    return json.loads(value)
+
+
+def split_batch_rows(rows: Iterable[dict], n_queries: int, order_by: str = "similarity") -> List[List[dict]]:
+    """Per-query result lists from a retrieve_*_batch RPC (rows tagged with
+    the query's position in `query_ix`)."""
+    out: List[List[dict]] = [[] for _ in range(n_queries)]
+    for r in rows:
+        row = {k: v for k, v in r.items() if k != "query_ix"}
+        row["embedding"] = parse_vector(row.get("embedding"))
+        out[r["query_ix"]].append(row)
+    for results in out:
+        results.sort(key=lambda row: row.get(order_by) or 0.0, reverse=True)
+    return out
+
+
+def _placeholders(rows: int, casts: Sequence[str], offset: int = 0) -> str:
+    cols = len(casts)
+    return ",\n".join(
+        "(" + ", ".join(f"${offset + r * cols + c + 1}{casts[c]}" for c in range(cols)) + ")"
+        for r in range(rows)
+    )
+
+
+def _in_list(n: int, offset: int) -> str:
+    return ", ".join(f"${offset + i + 1}" for i in range(n))
+
+
+# ──────────────────────────  DocumentChunk  ─────────────────────────────
+
+async def insert_document_chunks(
+    client,
+    project_id: str,
+    document_id: str,
+    chunks: Sequence[str],
+    vectors: Sequence[Sequence[float]],
+    batch_size: int,
+    file_hash: str | None = None,
+) -> int:
+    """Write chunks with one multi-row INSERT per batch.
+
+    `client` is either `db` or a transaction opened with `db.tx()`.
+    """
+    rows = [
+        (str(uuid.uuid4()), project_id, document_id, chunk, list(vec), content_hash(chunk), file_hash)
+        for chunk, vec in zip(chunks, vectors)
+    ]
+    casts = ("", "", "", "", "::vector", "", "")
+    for batch in batched(rows, batch_size):
+        params = [value for row in batch for value in row]
+        await client.execute_raw(
+            f'''
+            INSERT INTO "DocumentChunk"
+              (id, "projectId", "documentId", content, embedding, "contentHash", "fileHash")
+            VALUES
+              {_placeholders(len(batch), casts)}
+            ''',
+            *params,
+        )
+    return len(rows)
+
+
+async def document_state(client, document_id: str, file_hash: str) -> dict:
+    """How many chunks the document has, and how many came from `file_hash`."""
+    rows = await client.query_raw(
+        '''
+        SELECT count(*)::int AS total,
+               count(*) FILTER (WHERE "fileHash" = $2)::int AS current
+        FROM "DocumentChunk"
+        WHERE "documentId" = $1
+        ''',
+        document_id, file_hash,
+    )
+    return rows[0]
+
+
+async def existing_chunk_hashes(client, document_id: str) -> set[str]:
+    rows = await client.query_raw(
+        '''
+        SELECT DISTINCT "contentHash" FROM "DocumentChunk"
+        WHERE "documentId" = $1 AND "contentHash" IS NOT NULL
+        ''',
+        document_id,
+    )
+    return {r["contentHash"] for r in rows}
+
+
+async def mark_chunks_current(client, document_id: str, hashes: Sequence[str], file_hash: str) -> None:
+    """Stamp unchanged chunks with the new file hash so they survive `delete_stale_chunks`."""
+    if not hashes:
+        return
+    await client.execute_raw(
+        f'''
+        UPDATE "DocumentChunk" SET "fileHash" = $2
+        WHERE "documentId" = $1 AND "contentHash" IN ({_in_list(len(hashes), 2)})
+        ''',
+        document_id, file_hash, *hashes,
+    )
+
+
+async def delete_stale_chunks(client, document_id: str, file_hash: str) -> int:
+    """Drop chunks that no longer exist in the current version of the file."""
+    return await client.execute_raw(
+        '''
+        DELETE FROM "DocumentChunk"
+        WHERE "documentId" = $1 AND "fileHash" IS DISTINCT FROM $2
+        ''',
+        document_id, file_hash,
+    )
+
+
+async def discard_new_chunks(client, document_id: str, file_hash: str, hashes: Sequence[str]) -> int:
+    """Undo a failed ingest: drop the chunks it inserted and clear the file
+    hash it stamped, leaving the previous version's chunks as they were."""
+    deleted = 0
+    for batch in batched(list(hashes), 1000):
+        deleted += await client.execute_raw(
+            f'''
+            DELETE FROM "DocumentChunk"
+            WHERE "documentId" = $1 AND "fileHash" = $2 AND "contentHash" IN ({_in_list(len(batch), 2)})
+            ''',
+            document_id, file_hash, *batch,
+        )
+    # otherwise a retry could find every remaining chunk "current" and skip
+    await client.execute_raw(
+        'UPDATE "DocumentChunk" SET "fileHash" = NULL WHERE "documentId" = $1 AND "fileHash" = $2',
+        document_id, file_hash,
+    )
+    return deleted
+
+
+# ──────────────────────────  EmbeddingCache  ────────────────────────────
+
+async def load_cached_embeddings(
+    client, model: str, task_type: str, hashes: Sequence[str],
+) -> Dict[str, List[float]]:
+    if not hashes:
+        return {}
+    rows = await client.query_raw(
+        f'''
+        SELECT "textHash", embedding::text AS embedding FROM "EmbeddingCache"
+        WHERE model = $1 AND "taskType" = $2 AND "textHash" IN ({_in_list(len(hashes), 2)})
+        ''',
+        model, task_type, *hashes,
+    )
+    return {r["textHash"]: parse_vector(r["embedding"]) for r in rows}
+
+
+async def save_cached_embeddings(
+    client, model: str, task_type: str, entries: Iterable[tuple[str, Sequence[float]]],
+) -> None:
+    rows = [(model, task_type, h, list(vec)) for h, vec in entries]
+    if not rows:
+        return
+    await client.execute_raw(
+        f'''
+        INSERT INTO "EmbeddingCache" (model, "taskType", "textHash", embedding)
+        VALUES
+          {_placeholders(len(rows), ("", "", "", "::vector"))}
+        ON CONFLICT DO NOTHING
+        ''',
+        *[value for row in rows for value in row],
+    )
+
+
+# ──────────────────────────  Message  ───────────────────────────────────
+
+async def embed_user_messages(client, rows: Sequence[tuple]) -> set[tuple[str, str]]:
+    """Set the embedding of user messages the web app already stored.
+
+    `rows` are (conversation_id, content, vector); each fills the newest
+    matching user message that has no embedding yet. A row whose vector is
+    None (embedding failed) only looks for a stored copy and changes
+    nothing. Returns the (conversation_id, content) pairs that found one.
+    """
+    if not rows:
+        return set()
+    params = [
+        value
+        for cid, content, vec in rows
+        for value in (cid, content, list(vec) if vec is not None else None)
+    ]
+    matched = await client.query_raw(
+        f'''
+        UPDATE "Message" m SET embedding = coalesce(v.embedding, m.embedding)
+        FROM (VALUES
+          {_placeholders(len(rows), ("", "", "::vector"))}
+        ) AS v(conversation_id, content, embedding)
+        WHERE m.id = (
+            SELECT id FROM "Message"
+            WHERE "conversationId" = v.conversation_id AND role = 'user'
+              AND content = v.content
+              AND (embedding IS NULL OR v.embedding IS NULL)
+            ORDER BY "createdAt" DESC
+            LIMIT 1
+        )
+        RETURNING m."conversationId", m.content
+        ''',
+        *params,
+    )
+    return {(r["conversationId"], r["content"]) for r in matched}
+
+
+async def insert_messages(client, rows: Sequence[tuple], batch_size: int) -> int:
+    """Multi-row INSERT of (conversation_id, role, content, vector | None, created_at)."""
+    casts = ("", "", "", "", "::vector", "::timestamp")
+    full = [(str(uuid.uuid4()), cid, role, content, list(vec) if vec is not None else None, created)
+            for cid, role, content, vec, created in rows]
+    for batch in batched(full, batch_size):
+        await client.execute_raw(
+            f'''
+            INSERT INTO "Message" (id, "conversationId", role, content, embedding, "createdAt")
+            VALUES
+              {_placeholders(len(batch), casts)}
+            ''',
+            *[value for row in batch for value in row],
+        )
+    conversations = sorted({row[1] for row in full})
+    if conversations:
+        await client.execute_raw(
+            f'''
+            UPDATE "Conversation" SET "updatedAt" = now()
+            WHERE id IN ({_in_list(len(conversations), 0)})
+            ''',
+            *conversations,
+        )
+    return len(full)
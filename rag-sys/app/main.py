@@ -6,7 +6,18 @@ import traceback
 from app.dependencies import verify_user
 from app.routers.chat import router as chat_router
 from app.routers.embedding import router as embedding_router
-from app.database import db
+from app.routers.admin import router as admin_router
+from app.routers.retrieval import router as retrieval_router
+from app.database import db, connect_supabase, disconnect_supabase
+from app.routing.groq_client import close_groq_client
+from app.embedding.parser_pool import parser_pool
+from app.embedding.jobs import job_runner
+from app.embedding.message_queue import message_queue
+from app.embedding.providers import get_embedding_provider
+from app.metrics import metrics
+from app.cache import close_caches, hit_rates, warn_if_unshared_versions
+from app.routing.sessions import session_stats
+from app.routing.model_policy import tier_summary
 
 
 # Configure logging
@@ -36,13 +47,29 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 app.include_router(chat_router)
 app.include_router(embedding_router)
+app.include_router(admin_router)
+app.include_router(retrieval_router)
 
 @app.on_event("startup")
 async def startup():
     await db.connect()
+    await connect_supabase()
+    await get_embedding_provider().start()
+    parser_pool.start()
+    job_runner.start()
+    message_queue.start()
+    warn_if_unshared_versions()
 
 @app.on_event("shutdown") 
 async def shutdown():
+    await job_runner.stop()
+    # flush unsaved chat messages while the embedder and DB are still up
+    await message_queue.stop()
+    parser_pool.shutdown()
+    await get_embedding_provider().stop()
+    await close_groq_client()
+    await close_caches()
+    await disconnect_supabase()
     await db.disconnect()
     
 @app.get("/health", tags=["internal"])
@@ -52,6 +79,21 @@ async def health_check():
     """
     return {"status": "ok"}
 
+@app.get("/metrics", tags=["internal"])
+async def get_metrics():
+    """
+    Process-local counters and recent latency percentiles.
+    """
+    snapshot = metrics.snapshot()
+    snapshot["routing_llm_skip_rate"] = round(metrics.ratio("routing.llm_skipped", "routing.requests"), 3)
+    snapshot["cache_hit_rates"] = hit_rates()
+    # streamed turns: request received → first answer token sent
+    snapshot["time_to_first_token"] = snapshot["latency"].get("chat.ttft")
+    snapshot["chat_sessions"] = session_stats()
+    snapshot["message_queue_pending"] = message_queue.pending
+    snapshot["model_tiers"] = tier_summary()
+    return snapshot
+
 @app.get('/')
 async def root():
     return {'message': 'RAG FastAPI running'}
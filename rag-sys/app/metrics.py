@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+# Process-local counters and latency samples, exposed on GET /metrics.
+# Latencies keep the last `_WINDOW` samples per name, so percentiles describe
+# recent traffic rather than everything since startup.
+
+_WINDOW = 1000
+
+
+def _percentile(sorted_samples: list, q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    idx = min(len(sorted_samples) - 1, max(0, round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[idx]
+
+
+class Metrics:
+    def __init__(self, window: int = _WINDOW):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, ms: float) -> None:
+        with self._lock:
+            self._samples[name].append(ms)
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        with self._lock:
+            total = self._counters.get(denominator, 0)
+            return self._counters.get(numerator, 0) / total if total else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                latencies[name] = {
+                    "n": len(ordered),
+                    "p50_ms": round(_percentile(ordered, 0.50), 1),
+                    "p95_ms": round(_percentile(ordered, 0.95), 1),
+                    "max_ms": round(ordered[-1], 1) if ordered else 0.0,
+                }
+            return {"counters": dict(self._counters), "latency": latencies}
+
+
+metrics = Metrics()
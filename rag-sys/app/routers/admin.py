@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+from app.database import db
+from app.dependencies import get_token_header
+from app.embedding.indexes import VECTOR_INDEXES, rebuild_vector_index, vector_index_stats
+from app.routing import vector_cache
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_token_header)],
+)
+
+
+@router.get("/vector-indexes")
+async def list_vector_indexes():
+    stats = await vector_index_stats(db)
+    missing = sorted(set(VECTOR_INDEXES) - {s["name"] for s in stats})
+    return jsonable_encoder({
+        "indexes": stats,
+        "missing": missing,
+        "efSearch": settings.HNSW_EF_SEARCH,
+    })
+
+
+@router.post("/vector-indexes/{name}/rebuild")
+async def rebuild_index(name: str):
+    if name not in VECTOR_INDEXES:
+        raise HTTPException(404, detail=f"Unknown vector index {name}; expected one of {sorted(VECTOR_INDEXES)}")
+    print(f"[DEBUG] rebuilding vector index {name}")
+    try:
+        await rebuild_vector_index(db, name)
+    except Exception as e:
+        print(f"[ERROR] rebuilding {name} failed: {e}")
+        raise HTTPException(500, detail=f"Failed to rebuild {name}: {e}")
+    stats = [s for s in await vector_index_stats(db) if s["name"] == name]
+    return jsonable_encoder(stats[0] if stats else {"name": name})
+
+
+@router.get("/vector-cache")
+async def vector_cache_stats():
+    return vector_cache.stats()
@@ -1,20 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.dependencies import get_token_header
-from app.tools.tool_call_utils import get_tools, AVAILABLE_FUNCTIONS, call_tool
-from app.routing.query_router import routed_rag_context
+from app.config import settings
+from app.tools.tool_call_utils import get_tools, call_tool
+from app.routing.query_router import cancel_prefetch, route, routed_rag_context, speculate
+from app.routing.answer_cache import lookup_answer, project_version, store_answer
 from app.routing.groq_client import groq_client
 from app.prompts.agent_prompt import AGENT_PROMPT
-from app.tools.messages import update_messages
-import os
+from app.embedding.message_queue import message_queue, utc_timestamp
+from app.routing.sessions import get_session, history_messages, record_turn
+from app.routing.context import estimate_tokens
+from app.routing.model_policy import Tier, choose_tier, model_for, record_tier_call, should_escalate
+from app.embedding.embedder import embed_query
+from app.metrics import metrics
 import json
-import nomic
-from nomic import embed
+import time
+import asyncio
+from typing import List, Optional
 from dotenv import load_dotenv
 
-nomic.login(os.getenv("NOMIC_API_KEY"))
-
 router = APIRouter(
     prefix='/chat',
     tags=['chatbot'],
@@ -22,13 +28,10 @@ router = APIRouter(
 )
 load_dotenv()
 
-REASONING_MODEL = "llama-3.3-70b-versatile"
+# large tier; simple lookups may be answered by settings.CHAT_SMALL_MODEL
+REASONING_MODEL = settings.CHAT_LARGE_MODEL
 TOOL_MODEL = "llama-3.3-70b-versatile"
 
-messages = [
-    {"role": "system", "content": AGENT_PROMPT}
-]
-
 class ChatRequest(BaseModel):
     conversationId: str
     projectId: str
@@ -38,93 +41,295 @@ class Message(BaseModel):
     role: str
     content: str
 
-@router.post('/message', response_model=Message)
-async def chat(request: ChatRequest):
-    print(f"[DEBUG] → Received chat request: conversationId={request.conversationId}, projectId={request.projectId}")
-    print(f"[DEBUG] → User message: {request.userMessage!r}")
+class _Turn:
+    """State carried from the shared part of a turn to the final reasoning call."""
+
+    def __init__(self, started: float):
+        self.started = started
+        # the question's createdAt; its answer is stamped after it
+        self.asked_at = utc_timestamp()
+        self.embedding: List[float] = []
+        self.cacheable = False
+        self.version = -1
+        self.prefetched = None
+        self.tool_calls = None
+        self.cached_answer: Optional[str] = None
+        # the tool model's reply when it answered without calling a tool
+        self.answer: Optional[str] = None
+        self.session = None
+        self.flags: dict = {}
+        self.context_tokens = 0
+        # this turn's messages for the reasoning model
+        self.prompt: List[dict] = []
+
+
+# cleanup started from a disconnected stream; keeps the tasks referenced
+_background = set()
+
+
+async def _begin_turn(request: ChatRequest) -> _Turn:
+    """Everything up to the reasoning call: embed, route, answer cache, RAG
+    context and the tool round (if any tools are registered). Leaves the
+    reasoning payload in `turn.prompt`, unless the answer is already known
+    (`turn.cached_answer` / `turn.answer`)."""
+    turn = _Turn(time.perf_counter())
     try:
-        # 1. Embedding
-        print("[DEBUG] → Calling embed.text()...")
-        embed_resp = embed.text(
-            texts=[request.userMessage],
-            model='nomic-embed-text-v1.5',
-            task_type='search_query'
+        # 1. Embedding, and the conversation's history (from the DB on its
+        #    first turn in this process)
+        print("[DEBUG] → Calling embed_query()...")
+        turn.embedding, turn.session = await asyncio.gather(
+            embed_query(request.userMessage),
+            get_session(request.conversationId, request.userMessage),
         )
-        print(f"[DEBUG] ← embed.text response keys: {list(embed_resp.keys())}")
-        embedding = embed_resp['embeddings'][0]
+        embedding = turn.embedding
         print(f"[DEBUG] ← Extracted embedding (first 5 dims): {embedding[:5]}... length={len(embedding)}")
 
-        # 2. RAG context
+        # 2. Route, then try the project's answer cache. The cache is shared
+        #    by every conversation of the project, so a turn whose prompt
+        #    carries this conversation's history (or whose route asks for
+        #    earlier messages) never reads from it or writes to it.
+        #    With SPECULATIVE_RETRIEVAL, retrieval is already running meanwhile.
+        if settings.SPECULATIVE_RETRIEVAL:
+            turn.prefetched = speculate(request.userMessage, embedding, request.projectId, request.conversationId)
+        turn.flags = flags = await route(request.userMessage, embedding)
+        has_history = bool(turn.session.turns or turn.session.summary)
+        turn.cacheable = settings.ANSWER_CACHE_ENABLED and not flags.get("messages") and not has_history
+        turn.version = await project_version(request.projectId)
+        if turn.cacheable:
+            turn.cached_answer = await lookup_answer(request.projectId, turn.version, request.userMessage, embedding)
+            if turn.cached_answer is not None:
+                print("[DEBUG] ← answer cache hit, skipping retrieval and reasoning")
+                cancel_prefetch(turn.prefetched)
+                return turn
+
+        # 3. RAG context
         print("[DEBUG] → Fetching RAG context...")
         rag_context = await routed_rag_context(
             request.userMessage,
             embedding,
             request.projectId,
-            request.conversationId
+            request.conversationId,
+            flags,
+            turn.prefetched,
         )
         print(f"[DEBUG] ← RAG context (truncated to 200 chars): {rag_context[:200]!r}...")
+        turn.context_tokens = estimate_tokens(rag_context) if rag_context else 0
 
-        # 3. Send to tool‐enabled model
+        # 4. Prompt: system prompt, bounded history, then this turn
+        messages = turn.prompt
+        messages.append({"role": "system", "content": AGENT_PROMPT})
+        messages.extend(history_messages(turn.session))
         messages.append({"role": "user", "content": "The following is the user request for this conversation: " + request.userMessage + "\n\n" + "The following is the context for this conversation: " + rag_context})
-        print(f"[DEBUG] → Messages payload to TOOL_MODEL (len={len(messages)}):")
+        print(f"[DEBUG] → Messages payload (len={len(messages)}):")
         for m in messages[-3:]:
             print("  ", m)
 
+        # 5. Tool round. With no tools registered it's skipped (one LLM call
+        #    per turn); if the model calls none, its reply is the answer.
+        tools = get_tools()
+        if not tools:
+            metrics.incr("chat.tool_round_skipped")
+            return turn
+
         print(f"[DEBUG] → Calling groq_client.chat.completions.create(model={TOOL_MODEL})")
-        tool_resp = groq_client.chat.completions.create(
+        tool_resp = await groq_client.chat.completions.create(
             model=TOOL_MODEL,
             messages=messages,
-            tools=get_tools(),
+            tools=tools,
             tool_choice='auto'
         )
         print(f"[DEBUG] ← Tool model raw response: {tool_resp}")
         tool_msg = tool_resp.choices[0].message
-        tool_calls = tool_msg.tool_calls
+        turn.tool_calls = tool_calls = tool_msg.tool_calls
         print(f"[DEBUG] ← tool_calls: {tool_calls}")
+        if not tool_calls and tool_msg.content and TOOL_MODEL == REASONING_MODEL:
+            metrics.incr("chat.tool_round_answered")
+            turn.answer = tool_msg.content
+            return turn
 
         messages.append(tool_msg)
-
-        # 4. Execute each tool call
-        tool_msgs = []
         if tool_calls:
-            for tc in tool_calls:
-                fn_name = tc.function.name
-                args = json.loads(tc.function.arguments)
-                print(f"[DEBUG] → Calling tool function '{fn_name}' with args: {args}")
-                fn = AVAILABLE_FUNCTIONS[fn_name]
-                result = fn(**args)
-                print(f"[DEBUG] ← Result from '{fn_name}': {result!r}")
-                tool_msgs.append({
-                    "role": "tool",
-                    "tool_call_id": tc.id,
-                    "content": str(result),
-                })
-
-        messages.extend(tool_msgs)
+            # independent calls: run together, each under TOOL_TIMEOUT_S
+            messages.extend(await asyncio.gather(*(call_tool(tc) for tc in tool_calls)))
 
         messages.append({
             "role": "user",
             "content": request.userMessage
         })
-        # 5. Send to reasoning model
         print(f"[DEBUG] → Messages payload to REASONING_MODEL (len={len(messages)}):")
         for m in messages[-3:]:
             print("  ", m)
-        print(f"[DEBUG] → Calling groq_client.chat.completions.create(model={REASONING_MODEL})")
-        reasoning_resp = groq_client.chat.completions.create(
-            model=REASONING_MODEL,
-            messages=messages
-        )
-        response_content = reasoning_resp.choices[0].message.content
+        return turn
+    except BaseException:
+        cancel_prefetch(turn.prefetched, count=False)
+        raise
+
+
+async def _finish_turn(request: ChatRequest, turn: _Turn, content: str, metric: str) -> None:
+    # cache (tool results may be live data), then persist: the answer is
+    # written, and both messages embedded, behind the response
+    if turn.cached_answer is None and turn.cacheable and not turn.tool_calls and content:
+        await store_answer(request.projectId, turn.version, request.userMessage, turn.embedding, content)
+    answered_at = message_queue.enqueue_turn(request.conversationId, request.userMessage, content, turn.asked_at)
+    record_turn(turn.session, request.userMessage, content, answered_at)
+    metrics.observe(metric, (time.perf_counter() - turn.started) * 1000)
+
+
+@router.post('/message', response_model=Message)
+async def chat(request: ChatRequest):
+    print(f"[DEBUG] → Received chat request: conversationId={request.conversationId}, projectId={request.projectId}")
+    print(f"[DEBUG] → User message: {request.userMessage!r}")
+    try:
+        turn = await _begin_turn(request)
+        if turn.cached_answer is not None:
+            await _finish_turn(request, turn, turn.cached_answer, "chat.answer_cached")
+            return jsonable_encoder(Message(role='assistant', content=turn.cached_answer))
+        if turn.answer is not None:
+            await _finish_turn(request, turn, turn.answer, "chat")
+            return jsonable_encoder(Message(role='assistant', content=turn.answer))
+
+        # 6. Send to the reasoning model of the chosen tier
+        tier = choose_tier(request.userMessage, turn.flags, turn.context_tokens, bool(turn.tool_calls))
+        print(f"[DEBUG] → model tier {tier.name} ({', '.join(tier.reasons)})")
+        response_content = await _complete(turn, tier)
         print(f"[DEBUG] ← Reasoning model response content: {response_content!r}")
 
-        # 6. Persist & return
-        await update_messages(
-            {'role': 'assistant', 'content': response_content},
-            request.conversationId
-        )
+        # 7. Persist, cache & return
+        await _finish_turn(request, turn, response_content, "chat")
         return jsonable_encoder(Message(role='assistant', content=response_content))
 
     except Exception as e:
         print(f"[ERROR] ✗ Exception in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _complete(turn: _Turn, tier: Tier) -> str:
+    """One reasoning call; a small-tier answer that failed or came back
+    unusable is redone by the large tier."""
+    print(f"[DEBUG] → Calling groq_client.chat.completions.create(model={tier.model})")
+    t0 = time.perf_counter()
+    try:
+        resp = await groq_client.chat.completions.create(
+            model=tier.model,
+            messages=turn.prompt
+        )
+        content = resp.choices[0].message.content
+        record_tier_call(tier.name, (time.perf_counter() - t0) * 1000, resp.usage)
+        reason = should_escalate(tier, content, turn.context_tokens)
+    except Exception as e:
+        if tier.name == "large":
+            raise
+        content, reason = None, f"small model failed: {e}"
+    if reason is None:
+        return content
+    metrics.incr("chat.tier.escalations")
+    print(f"[DEBUG] ↑ escalating to the large model: {reason}")
+    return await _complete(turn, Tier("large", model_for("large"), [reason]))
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post('/message/stream')
+async def chat_stream(request: ChatRequest):
+    """Same turn as /message, with the reasoning model's answer sent as
+    server-sent events while it is generated:
+
+        event: token   data: {"content": "<delta>"}      (repeated)
+        event: done    data: {"role": "assistant", "content": "<full answer>"}
+        event: error   data: {"detail": "..."}
+
+    The answer is persisted once the stream ends. If the client disconnects
+    mid-answer, generation is stopped and the partial answer is persisted
+    (but never cached).
+    """
+    print(f"[DEBUG] → Received streaming chat request: conversationId={request.conversationId}, projectId={request.projectId}")
+
+    async def events():
+        parts: List[str] = []
+        completed = False
+        stream = None
+        turn = None
+        try:
+            turn = await _begin_turn(request)
+            ready = turn.cached_answer if turn.cached_answer is not None else turn.answer
+            if ready is not None:
+                metrics.observe("chat.ttft", (time.perf_counter() - turn.started) * 1000)
+                yield _sse("token", {"content": ready})
+                metric = "chat.answer_cached" if turn.cached_answer is not None else "chat.stream"
+                await _finish_turn(request, turn, ready, metric)
+                completed = True
+                yield _sse("done", {"role": "assistant", "content": ready})
+                return
+
+            # once tokens are out there's nothing to escalate; only a small
+            # model that fails to start streaming falls back to the large one
+            tier = choose_tier(request.userMessage, turn.flags, turn.context_tokens, bool(turn.tool_calls))
+            print(f"[DEBUG] → model tier {tier.name} ({', '.join(tier.reasons)})")
+            t0 = time.perf_counter()
+            try:
+                stream = await groq_client.chat.completions.create(
+                    model=tier.model,
+                    messages=turn.prompt,
+                    stream=True,
+                )
+            except Exception as e:
+                if tier.name == "large":
+                    raise
+                metrics.incr("chat.tier.escalations")
+                print(f"[DEBUG] ↑ escalating to the large model: small model failed: {e}")
+                tier = Tier("large", model_for("large"), ["small model failed"])
+                t0 = time.perf_counter()
+                stream = await groq_client.chat.completions.create(
+                    model=tier.model,
+                    messages=turn.prompt,
+                    stream=True,
+                )
+            usage = None
+            async for chunk in stream:
+                # Groq reports usage on the last chunk
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not parts:
+                    ttft = (time.perf_counter() - turn.started) * 1000
+                    metrics.observe("chat.ttft", ttft)
+                    metrics.observe(f"chat.ttft.{tier.name}", ttft)
+                parts.append(delta)
+                yield _sse("token", {"content": delta})
+
+            record_tier_call(tier.name, (time.perf_counter() - t0) * 1000, usage)
+            response_content = "".join(parts)
+            print(f"[DEBUG] ← Streamed reasoning response ({len(response_content)} chars)")
+            await _finish_turn(request, turn, response_content, "chat.stream")
+            completed = True
+            yield _sse("done", {"role": "assistant", "content": response_content})
+        except (asyncio.CancelledError, GeneratorExit):
+            print("[DEBUG] ✗ client disconnected mid-stream")
+            metrics.incr("chat.stream.disconnects")
+            raise
+        except Exception as e:
+            print(f"[ERROR] ✗ Exception in streaming chat endpoint: {e}")
+            metrics.incr("chat.stream.errors")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            if stream is not None:
+                # stop generating (and paying for) tokens nobody will read
+                task = asyncio.create_task(stream.close())
+                _background.add(task)
+                task.add_done_callback(_background.discard)
+            if not completed and parts:
+                # queued, not awaited: the request's scope is already
+                # cancelled on disconnect
+                answered_at = message_queue.enqueue_turn(
+                    request.conversationId, request.userMessage, "".join(parts), turn.asked_at,
+                )
+                record_turn(turn.session, request.userMessage, "".join(parts), answered_at)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,26 +1,16 @@
-import mimetypes
-import tempfile
-from pathlib import Path
-from typing import List
-
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 
 from app.dependencies import get_token_header
-from app.config import settings
-from app.embedding.extractor import extract_chunks
-import nomic
-import uuid
+from app.embedding.jobs import enqueue_job, get_job, job_status, retry_job
+from app.embedding.embedder import embed_texts
+from app.routing.answer_cache import invalidate_project
 import logging
-from app.database import supabase, db
-import os
-from nomic import embed
+from app.database import db
 
 logger = logging.getLogger(__name__)
 
-nomic.login(os.getenv("NOMIC_API_KEY"))
-
 router = APIRouter(
     prefix="/embedding",
     tags=["embedding"],
@@ -35,75 +25,30 @@ class EmbedFileJob(BaseModel):
     key: str
     fileType: str       
 
-@router.post("/embed-file")
+@router.post("/embed-file", status_code=202)
 async def embed_uploaded_file(job: EmbedFileJob):
     print(f"[DEBUG] embed_uploaded_file called with: bucket={job.bucket}, key={job.key}, fileType={job.fileType}")
-
-    # 1 ── download bytes from Storage
-    try:
-        file_bytes = supabase.storage.from_(job.bucket).download(job.key)
-        print(f"[DEBUG] downloaded {len(file_bytes)} bytes")
-    except Exception as e:
-        print(f"[ERROR] download failed: {e}")
-        raise HTTPException(500, detail=f"Failed to download file from storage: {e}")
-
-    # 2 ── write to tmp file
-    suffix = mimetypes.guess_extension(job.fileType) or ""
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(file_bytes)
-            tmp_path = tmp.name
-        print(f"[DEBUG] wrote file to temp path: {tmp_path}")
-    except Exception as e:
-        print(f"[ERROR] writing temp file failed: {e}")
-        raise HTTPException(500, detail=f"Failed to write temp file: {e}")
-
-    # 3 ── extract → embed → store
     try:
-        print(f"[DEBUG] extracting chunks from {tmp_path}")
-        chunks = extract_chunks(tmp_path)
-        print(f"[DEBUG] extracted {len(chunks)} chunks")
-
-        for i, chunk in enumerate(chunks, start=1):
-            print(f"[DEBUG] chunk {i}/{len(chunks)} preview: {chunk[:60]!r}...")
-            embedding_result = embed.text(
-                texts=[chunk],
-                model="nomic-embed-text-v1.5",
-                task_type="search_document",
-            )
-            print(f"[DEBUG] embedding_result keys: {list(embedding_result.keys())}")
-
-            vec = embedding_result["embeddings"][0]
-            print(f"[DEBUG] vector length: {len(vec)}")
-
-            chunk_id = str(uuid.uuid4())
-            print(f"[DEBUG] storing chunk with id {chunk_id}")
-
-            #print("[DEBUG] available db models:",
-            #      [attr for attr in dir(db) if not attr.startswith("_")])
-            await db.execute_raw(
-                '''
-                INSERT INTO "DocumentChunk"
-                  (id, "projectId", "documentId", content, embedding)
-                VALUES
-                  ($1, $2, $3, $4, $5::vector)
-                ''',
-                chunk_id,
-                job.project_id,
-                job.document_id,
-                chunk,
-                vec,
-            )
-            print(f"[DEBUG] chunk {i} stored")
-
-        return jsonable_encoder({
-            "status": "success",
-            "chunks_processed": len(chunks),
-        })
-
+        record = await enqueue_job(job.project_id, job.document_id, job.bucket, job.key, job.fileType)
     except Exception as e:
-        print(f"[ERROR] processing or DB storage failed: {e}")
-        raise HTTPException(500, detail=f"Failed during processing or database storage: {e}")
+        print(f"[ERROR] enqueueing ingestion job failed: {e}")
+        raise HTTPException(500, detail=f"Failed to enqueue ingestion job: {e}")
+    print(f"[DEBUG] ingestion job {record['id']} is {record['status']}")
+    return jsonable_encoder(job_status(record))
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    record = await get_job(job_id)
+    if record is None:
+        raise HTTPException(404, detail=f"No ingestion job {job_id}")
+    return jsonable_encoder(job_status(record))
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_ingestion_job(job_id: str):
+    record = await retry_job(job_id)
+    if record is None:
+        raise HTTPException(404, detail=f"No ingestion job {job_id}")
+    return jsonable_encoder(job_status(record))
 
 class EmbedTaskJob(BaseModel):
     project_id: str
@@ -118,17 +63,22 @@ async def embed_task(job: EmbedTaskJob):
     task = await db.task.find_first_or_raise(
         where={ 'id': job.task_id, 'projectId': job.project_id },
     )
-    task_content = task_chunk.format(task_title=task.title, task_description=task.description, task_due_date=task.due_date, task_completed=task.completed)
-    vec = embed.text(
-        texts=[task_content],
-        model="nomic-embed-text-v1.5",
-        task_type="search_document",
-    )["embeddings"][0]
+    task_content = task_chunk.format(
+        task_title=task.title,
+        task_description=task.description,
+        task_due_date=task.dueDate,
+        task_status=task.status,
+    )
+    vec = (await embed_texts([task_content], "search_document"))[0]
     try:
-        await db.task.update(
-            where={ 'id': job.task_id },
-            data={ 'embedding': vec,
-                   'content': task_content }
+        # the embedding column is Unsupported("vector") to Prisma, so raw SQL
+        await db.execute_raw(
+            '''
+            UPDATE "Task" SET embedding = $2::vector, content = $3, "updatedAt" = now()
+            WHERE id = $1
+            ''',
+            job.task_id, list(vec), task_content,
         )
     except Exception as e:
-        raise HTTPException(500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(500, detail=str(e))
+    await invalidate_project(job.project_id)
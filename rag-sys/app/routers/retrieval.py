@@ -0,0 +1,75 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from app.config import settings
+from app.dependencies import get_token_header
+from app.embedding.embedder import embed_queries
+from app.metrics import metrics
+from app.tools.documents import retrieve_docs_batch
+from app.tools.messages import retrieve_messages_batch
+from app.tools.tasks import retrieve_tasks_batch
+
+router = APIRouter(
+    prefix="/retrieval",
+    tags=["retrieval"],
+    dependencies=[Depends(get_token_header)],
+)
+
+
+class BatchRetrievalRequest(BaseModel):
+    projectId: str
+    queries: List[str]
+    conversationId: Optional[str] = None
+    # defaults to docs + tasks, plus messages when conversationId is given
+    sources: Optional[List[str]] = None
+    limit: int = 5
+    includeEmbeddings: bool = False
+
+
+@router.post("/batch")
+async def retrieve_batch(request: BatchRetrievalRequest):
+    """Search several queries (reformulations, sub-questions) at once: one
+    embedding call for the uncached queries and one RPC per source."""
+    if not request.queries:
+        raise HTTPException(400, detail="queries must not be empty")
+    if len(request.queries) > settings.RETRIEVAL_BATCH_MAX:
+        raise HTTPException(400, detail=f"at most {settings.RETRIEVAL_BATCH_MAX} queries per batch")
+    sources = request.sources or (["docs", "tasks", "messages"] if request.conversationId else ["docs", "tasks"])
+    unknown = set(sources) - {"docs", "tasks", "messages"}
+    if unknown:
+        raise HTTPException(400, detail=f"unknown sources: {sorted(unknown)}")
+    if "messages" in sources and not request.conversationId:
+        raise HTTPException(400, detail="messages retrieval needs a conversationId")
+
+    started = time.perf_counter()
+    try:
+        embeddings = await embed_queries(request.queries)
+        calls = {
+            "docs": lambda: retrieve_docs_batch(
+                embeddings, request.projectId, request.limit, query_texts=request.queries
+            ),
+            "tasks": lambda: retrieve_tasks_batch(embeddings, request.projectId, request.limit),
+            "messages": lambda: retrieve_messages_batch(embeddings, request.conversationId, request.limit),
+        }
+        per_source = await asyncio.gather(*(calls[src]() for src in sources))
+    except Exception as e:
+        print(f"[ERROR] batch retrieval failed: {e}")
+        raise HTTPException(500, detail=f"Batch retrieval failed: {e}")
+
+    results = []
+    for i, query in enumerate(request.queries):
+        entry = {"query": query}
+        for src, rows in zip(sources, per_source):
+            entry[src] = [
+                row if request.includeEmbeddings else {k: v for k, v in row.items() if k != "embedding"}
+                for row in rows[i]
+            ]
+        results.append(entry)
+    metrics.incr("retrieval.batch.queries", len(request.queries))
+    metrics.observe("retrieval.batch", (time.perf_counter() - started) * 1000)
+    return jsonable_encoder({"results": results})
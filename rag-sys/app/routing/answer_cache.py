@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.cache import bump_data_version, data_version, get_cache, text_key
+from app.config import settings
+from app.metrics import metrics
+from app.routing.recent_index import RecentIndex
+
+# Project-scoped semantic answer cache. An answer is reused when a new query
+# in the same project is within ANSWER_CACHE_SIM (cosine, query embeddings)
+# of one answered before *and* the project's data version hasn't moved since.
+#
+# The version is part of every cache key, so bumping it (after an ingestion
+# job or a task embedding writes to the project) orphans all of the
+# project's answers at once; they then age out via the TTL. Near-duplicate
+# lookup goes through this process's index of recent query embeddings, the
+# answers themselves live in the configured cache backend.
+#
+# Versions are only shared between workers with CACHE_BACKEND=redis, which
+# is why the cache is off by default with the memory backend.
+
+_index: "OrderedDict[str, Tuple[int, RecentIndex]]" = OrderedDict()
+
+
+def _scope(project_id: str) -> str:
+    return f"project:{project_id}"
+
+
+def _answers():
+    return get_cache("answer", settings.ANSWER_CACHE_TTL_S, settings.ANSWER_CACHE_SIZE)
+
+
+def _project_index(project_id: str, version: int) -> RecentIndex:
+    entry = _index.get(project_id)
+    if entry is None or entry[0] != version:
+        entry = (version, RecentIndex(settings.ANSWER_CACHE_PER_PROJECT))
+        _index[project_id] = entry
+    _index.move_to_end(project_id)
+    while len(_index) > settings.ANSWER_CACHE_PROJECTS:
+        _index.popitem(last=False)
+    return entry[1]
+
+
+async def project_version(project_id: str) -> int:
+    """Read once per turn, before retrieval, and pass to both lookup_answer
+    and store_answer."""
+    return await data_version(_scope(project_id))
+
+
+async def lookup_answer(project_id: str, version: int, query: str, embedding: List[float]) -> Optional[str]:
+    if version < 0:
+        return None
+    cache = _answers()
+    answer = await cache.get(f"{project_id}:{version}:{text_key(query)}")
+    if answer is not None:
+        return answer
+    nearest = _project_index(project_id, version).nearest(embedding, settings.ANSWER_CACHE_SIM)
+    if nearest is None:
+        return None
+    best_key, best_sim = nearest
+    answer = await cache.get(f"{project_id}:{version}:{best_key}")
+    if answer is not None:
+        metrics.incr("cache.answer.similar_hits")
+        print(f"[DEBUG]    answer cache: near-duplicate hit (cos={best_sim:.3f})")
+    return answer
+
+
+async def store_answer(project_id: str, version: int, query: str, embedding: List[float], answer: str) -> None:
+    # an answer built while the project's data changed underneath it is stale
+    if version < 0 or version != await project_version(project_id):
+        return
+    key = text_key(query)
+    await _answers().set(f"{project_id}:{version}:{key}", answer)
+    _project_index(project_id, version).add(key, embedding)
+
+
+async def invalidate_project(project_id: str) -> None:
+    """Call after anything retrieval reads from (documents, tasks) changes."""
+    await bump_data_version(_scope(project_id))
+    _index.pop(project_id, None)
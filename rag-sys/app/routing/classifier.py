@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from app.config import settings
+from app.embedding.embedder import embed_texts
+
+# Local fast path for source routing. Obvious queries ("what's left to do?",
+# "what does the lease say about CAM?") are decided here from keywords and the
+# query embedding we already computed for retrieval; anything that lands in
+# the grey zone between ROUTER_SIM_LOW and ROUTER_SIM_HIGH for some source is
+# left to the LLM router.
+
+SOURCES = ("docs", "tasks", "messages")
+
+_KEYWORDS: Dict[str, re.Pattern] = {
+    "docs": re.compile(
+        r"\b(document|doc|file|pdf|contract|agreement|lease|psa|deed|title|cc&rs|estoppel|"
+        r"rent roll|p&l|balance sheet|appraisal|cash flow|capex|invoice|report|inspection|"
+        r"survey|permit|loi|snda|insurance|policy|loan|mortgage|ucc|escrow|tax return|"
+        r"environmental|clause|section|exhibit|addendum|amendment|schedule)s?\b",
+        re.IGNORECASE,
+    ),
+    "tasks": re.compile(
+        r"\b(task|to-?do|next steps?|what'?s next|what needs|needs to be done|pending|outstanding|"
+        r"overdue|due|deadline|completed?|finished|remaining|left to do|action items?|status|assigned)\b",
+        re.IGNORECASE,
+    ),
+    "messages": re.compile(
+        r"\b(earlier|previously|you said|you mentioned|we discussed|we talked|"
+        r"last time|as i said|i asked|remind me|our conversation|that again)\b",
+        re.IGNORECASE,
+    ),
+}
+
+# A handful of example questions per source; the query's best cosine
+# similarity against each set is that source's score.
+_PROTOTYPES: Dict[str, List[str]] = {
+    "docs": [
+        "What is the purchase price in the PSA?",
+        "When does the anchor tenant's lease expire?",
+        "Summarize the environmental report.",
+        "What does the title report say about easements?",
+        "What was NOI on last year's P&L?",
+        "Who is the lender on the loan commitment?",
+    ],
+    "tasks": [
+        "What needs to be done next on this project?",
+        "Which tasks are still pending?",
+        "What's overdue?",
+        "Has the inspection been completed yet?",
+        "What are my action items this week?",
+    ],
+    "messages": [
+        "What did you tell me earlier about that?",
+        "Can you repeat what we discussed before?",
+        "Go back to the previous answer.",
+        "As I mentioned before, what about the other one?",
+    ],
+}
+
+
+class Route(NamedTuple):
+    flags: Dict[str, bool]
+    confident: bool
+    scores: Dict[str, float]
+
+
+_prototype_vectors: Optional[Dict[str, List[List[float]]]] = None
+_prototype_lock = asyncio.Lock()
+
+
+async def _prototypes() -> Dict[str, List[List[float]]]:
+    global _prototype_vectors
+    if _prototype_vectors is None:
+        async with _prototype_lock:
+            if _prototype_vectors is None:
+                texts = [t for src in SOURCES for t in _PROTOTYPES[src]]
+                vectors = await embed_texts(texts, "search_query")
+                out: Dict[str, List[List[float]]] = {}
+                i = 0
+                for src in SOURCES:
+                    n = len(_PROTOTYPES[src])
+                    out[src] = vectors[i:i + n]
+                    i += n
+                _prototype_vectors = out
+    return _prototype_vectors
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+async def classify(query: str, embedding: List[float]) -> Route:
+    """Decide each source locally, and say whether the decision can be trusted."""
+    try:
+        prototypes = await _prototypes()
+    except Exception as e:
+        print(f"[ERROR] router prototypes unavailable, using keywords only: {e!r}")
+        prototypes = {}
+
+    flags: Dict[str, bool] = {}
+    scores: Dict[str, float] = {}
+    confident = True
+    for src in SOURCES:
+        keyword = bool(_KEYWORDS[src].search(query))
+        sim = max((cosine(embedding, p) for p in prototypes.get(src, [])), default=0.0)
+        scores[src] = round(sim, 3)
+        if keyword or sim >= settings.ROUTER_SIM_HIGH:
+            flags[src] = True
+        elif sim < settings.ROUTER_SIM_LOW:
+            flags[src] = False
+        else:
+            flags[src] = False
+            confident = False
+    # answering with no context at all is a big call; let the LLM make it
+    if not any(flags.values()):
+        confident = False
+    return Route(flags, confident, scores)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from app.config import settings
+from app.embedding.store import content_hash
+from app.metrics import metrics
+from app.routing.classifier import cosine
+
+# Context assembly for the reasoning prompt. Retrieved rows from every
+# routed source are ranked together, picked greedily with maximal marginal
+# relevance (so a chunk that repeats one already picked, e.g. from a
+# re-uploaded copy of a file, scores low or is dropped outright above
+# CONTEXT_DEDUP_SIM), and packed until the token budget is spent. Tokens are
+# estimated at ~4 characters each.
+#
+# Relevance is a row's rank within its own source, by the source's own
+# score (the fused RRF score for hybrid document search, cosine similarity
+# otherwise), normalised so each source's best row is 1. Ranking by cosine
+# alone would put exact-identifier full-text hits, which hybrid search
+# ranks first, last. Cosine between rows is only used for redundancy.
+
+_CHARS_PER_TOKEN = 4
+# "### source\n" headers and newlines between chunks
+_OVERHEAD_TOKENS = 4
+
+
+class Candidate(NamedTuple):
+    source: str
+    id: Optional[str]
+    content: str
+    similarity: float
+    embedding: Optional[List[float]]
+    relevance: float
+
+
+class Packed(NamedTuple):
+    context: str
+    tokens: int
+    kept: List[Candidate]
+    duplicates: List[Candidate]
+    over_budget: List[Candidate]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def _candidates(results: Dict[str, Sequence[dict]]) -> List[Candidate]:
+    depth = max((len(rows) for rows in results.values()), default=0)
+    out = []
+    for source, rows in results.items():
+        ranked = sorted(
+            rows,
+            key=lambda row: row["score"] if row.get("score") is not None else row.get("similarity") or 0.0,
+            reverse=True,
+        )
+        for rank, row in enumerate(ranked):
+            out.append(Candidate(
+                source,
+                row.get("id"),
+                row["content"],
+                row.get("similarity") or 0.0,
+                row.get("embedding"),
+                1.0 - rank / depth,
+            ))
+    return out
+
+
+def _redundancy(c: Candidate, picked: List[Candidate]) -> float:
+    if c.embedding is None:
+        return 0.0
+    return max((cosine(c.embedding, p.embedding) for p in picked if p.embedding is not None), default=0.0)
+
+
+def pack_context(
+    results: Dict[str, Sequence[dict]],
+    budget_tokens: int | None = None,
+    mmr_lambda: float | None = None,
+    dedup_sim: float | None = None,
+) -> Packed:
+    """Rank, de-duplicate and budget the retrieved rows of every source.
+
+    `results` maps source name → rows carrying content, similarity and
+    embedding, in the order the sources should appear in the prompt.
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    lam = settings.CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    dedup = settings.CONTEXT_DEDUP_SIM if dedup_sim is None else dedup_sim
+
+    remaining = _candidates(results)
+    picked: List[Candidate] = []
+    duplicates: List[Candidate] = []
+    over_budget: List[Candidate] = []
+    seen_text = set()
+    used = 0
+    while remaining:
+        best, best_score, best_redundancy = None, float("-inf"), 0.0
+        for c in remaining:
+            redundancy = _redundancy(c, picked)
+            score = lam * c.relevance - (1 - lam) * redundancy
+            if score > best_score:
+                best, best_score, best_redundancy = c, score, redundancy
+        remaining.remove(best)
+        text_key = content_hash(" ".join(best.content.split()))
+        if best_redundancy >= dedup or text_key in seen_text:
+            duplicates.append(best)
+            continue
+        cost = estimate_tokens(best.content) + _OVERHEAD_TOKENS
+        if used + cost > budget:
+            # a smaller, lower-ranked chunk may still fit
+            over_budget.append(best)
+            continue
+        seen_text.add(text_key)
+        picked.append(best)
+        used += cost
+
+    parts: List[str] = []
+    for source in results:
+        chunks = [c.content for c in picked if c.source == source]
+        if chunks:
+            parts.append(f"### {source}")
+            parts.extend(chunks)
+    context = "\n".join(parts) + "\n" if parts else ""
+
+    metrics.incr("context.chunks_kept", len(picked))
+    metrics.incr("context.chunks_dropped_duplicate", len(duplicates))
+    metrics.incr("context.chunks_dropped_budget", len(over_budget))
+    metrics.incr("context.tokens", used)
+    return Packed(context, used, picked, duplicates, over_budget)
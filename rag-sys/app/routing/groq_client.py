@@ -1,7 +1,27 @@
-from groq import Groq
+import httpx
+from groq import AsyncGroq
 from app.config import settings
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+# One AsyncGroq client for the whole process, on a pooled httpx client, so
+# concurrent chat turns share keep-alive connections instead of each paying a
+# TLS handshake, and a slow completion never blocks the event loop.
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+    ),
+    timeout=httpx.Timeout(settings.LLM_TIMEOUT_S, connect=5.0),
+)
+groq_client = AsyncGroq(
+    api_key=os.getenv("GROQ_API_KEY"),
+    http_client=_http_client,
+    max_retries=settings.LLM_MAX_RETRIES,
+)
+
+
+async def close_groq_client() -> None:
+    await groq_client.close()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from app.config import settings
+from app.metrics import metrics
+
+# Model tier for a chat answer. Lookups ("when is the estoppel due?") are
+# answered by the small model; anything that looks like it needs reasoning
+# goes to the large one. Signals, any one of which sends a turn to the large
+# tier:
+#   - routing: the answer depends on earlier conversation turns
+#   - retrieved context over TIER_SMALL_MAX_CONTEXT_TOKENS
+#   - a question longer than TIER_SMALL_MAX_QUERY_WORDS, or several questions
+#   - analytical wording (compare, why, explain, summarize, should, ...)
+#   - tool calls in the turn
+# A small-tier answer is escalated (non-streaming only) when the call fails
+# or the answer says the context doesn't cover the question even though
+# context was provided. MODEL_TIERING=large / small pins one tier.
+
+TIERS = ("small", "large")
+
+_ANALYTICAL = re.compile(
+    r"\b(why|explain|compare|comparison|versus|vs\.?|difference|differences|analy[sz]e|analysis|"
+    r"summari[sz]e|summary|overview|evaluate|assess|recommend|should|pros|cons|risks?|impact|"
+    r"implications?|strategy|calculate|estimate|forecast|walk me through|step by step)\b",
+    re.I,
+)
+_HEDGES = re.compile(
+    r"(i don'?t (have|know|see)|not (enough|sufficient) information|no information|"
+    r"(cannot|can'?t|unable to) (determine|find|answer|tell)|not (mentioned|specified|provided|available) in|"
+    r"i'?m not sure|unclear from)",
+    re.I,
+)
+
+
+class Tier(NamedTuple):
+    name: str
+    model: str
+    reasons: List[str]
+
+
+def model_for(tier: str) -> str:
+    return settings.CHAT_SMALL_MODEL if tier == "small" else settings.CHAT_LARGE_MODEL
+
+
+def choose_tier(query: str, flags: Dict[str, bool], context_tokens: int, used_tools: bool = False) -> Tier:
+    mode = settings.MODEL_TIERING.lower()
+    if mode in TIERS:
+        metrics.incr(f"chat.tier.{mode}.chosen")
+        return Tier(mode, model_for(mode), [f"MODEL_TIERING={mode}"])
+
+    reasons = []
+    if flags.get("messages"):
+        reasons.append("conversation history")
+    if context_tokens > settings.TIER_SMALL_MAX_CONTEXT_TOKENS:
+        reasons.append(f"context {context_tokens} tokens")
+    if len(query.split()) > settings.TIER_SMALL_MAX_QUERY_WORDS:
+        reasons.append("long question")
+    if query.count("?") > 1:
+        reasons.append("several questions")
+    match = _ANALYTICAL.search(query)
+    if match:
+        reasons.append(f"analytical ({match.group(0).lower()})")
+    if used_tools:
+        reasons.append("tool calls")
+    tier = "large" if reasons else "small"
+    metrics.incr(f"chat.tier.{tier}.chosen")
+    return Tier(tier, model_for(tier), reasons or ["simple lookup"])
+
+
+def should_escalate(tier: Tier, answer: Optional[str], context_tokens: int) -> Optional[str]:
+    """Why a small-tier answer should be redone by the large model, if it should."""
+    if tier.name != "small" or not settings.TIER_ESCALATE:
+        return None
+    if not answer or not answer.strip():
+        return "empty answer"
+    if context_tokens > 0 and _HEDGES.search(answer):
+        return "hedged despite context"
+    return None
+
+
+def record_tier_call(tier: str, ms: float, usage=None) -> None:
+    metrics.incr(f"chat.tier.{tier}.calls")
+    metrics.observe(f"chat.tier.{tier}", ms)
+    if usage is not None:
+        metrics.incr(f"chat.tier.{tier}.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        metrics.incr(f"chat.tier.{tier}.completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+def tier_summary() -> Dict[str, dict]:
+    """Per-tier usage for /metrics."""
+    snapshot = metrics.snapshot()
+    counters, latency = snapshot["counters"], snapshot["latency"]
+    chosen = {t: counters.get(f"chat.tier.{t}.chosen", 0) for t in TIERS}
+    total = sum(chosen.values())
+    summary = {}
+    for t in TIERS:
+        summary[t] = {
+            "model": model_for(t),
+            "turns": chosen[t],
+            "share": round(chosen[t] / total, 3) if total else 0.0,
+            "calls": counters.get(f"chat.tier.{t}.calls", 0),
+            "prompt_tokens": counters.get(f"chat.tier.{t}.prompt_tokens", 0),
+            "completion_tokens": counters.get(f"chat.tier.{t}.completion_tokens", 0),
+            "latency": latency.get(f"chat.tier.{t}"),
+        }
+    summary["escalations"] = counters.get("chat.tier.escalations", 0)
+    return summary
@@ -1,9 +1,15 @@
 from __future__ import annotations
-import asyncio, json, os
-from typing import Dict, List
+import asyncio, json, os, time
+from typing import Dict, List, Optional, Sequence
 
 from groq import Groq
 
+from app.cache import get_cache, text_key
+from app.config import settings
+from app.metrics import metrics
+from app.routing.classifier import SOURCES, classify
+from app.routing.context import pack_context
+from app.routing.recent_index import RecentIndex
 from app.tools.documents import retrieve_docs
 from app.tools.tasks import retrieve_tasks
 from app.tools.messages import retrieve_messages
@@ -13,7 +19,7 @@ import re
 ROUTING_MODEL = "llama-3.1-8b-instant"
 TOOL_MODEL = "llama-3.3-70b-versatile"
 
-GATE_PROMPT = """You are deciding whether to include the '{src}' source when answering a user’s query about a real-estate project’s current status, required actions, or stored documentation.
+ROUTER_PROMPT = """You are deciding which sources to include when answering a user’s query about a real-estate project’s current status, required actions, or stored documentation.
 
 Sources:
 
@@ -40,118 +46,231 @@ Decision rule:
 User's question:
 "{query}"
 
-Respond strictly with JSON: {{"include": "yes"}} or {{ "include": "no" }}."""
+Respond strictly with JSON: {{"docs": true|false, "tasks": true|false, "messages": true|false}}."""
 
+# used when the router call fails or its reply can't be parsed: the two
+# sources that are almost always relevant
+_FALLBACK_FLAGS = {"docs": True, "tasks": True, "messages": False}
 
-async def gate(src: str, query: str) -> bool:
-    print(f"[DEBUG] → gate(): checking source '{src}'")
 
+def _parse_flags(raw: str) -> Optional[Dict[str, bool]]:
+    # Strip wrapping quotes/backticks (and a ```json fence)
+    stripped = raw.strip().strip('`"').strip()
+    if stripped.lower().startswith("json"):
+        stripped = stripped[4:].strip()
     try:
-        formatted = GATE_PROMPT.format(src=src, query=query)
-        print(f"[DEBUG]    formatted prompt:\n{formatted!r}\n")
-    except KeyError as ke:
-        print(f"[ERROR]   KeyError during prompt formatting: missing key {ke!r}")
-        # Fallback: use a minimal prompt without formatting
-        formatted = f"Include source '{src}' for question: '{query}'? Respond yes or no."
-        print(f"[DEBUG]    fallback prompt:\n{formatted!r}\n")
-    
-    print(f"[DEBUG] → gate(): calling LLM...")
-    # Call to LLM
+        data = json.loads(stripped)
+        return {s: str(data.get(s, "")).lower() in ("true", "yes") for s in SOURCES}
+    except (json.JSONDecodeError, AttributeError) as e:
+        print(f"[DEBUG]    router JSON parse failed ({e}); trying regex")
+    flags = {}
+    for s in SOURCES:
+        m = re.search(rf'"?{s}"?\s*:\s*"?(true|yes|false|no)"?', stripped, re.IGNORECASE)
+        if m is None:
+            print("[DEBUG]    router reply unusable")
+            return None
+        flags[s] = m.group(1).lower() in ("true", "yes")
+    return flags
 
 
+async def route_llm(query: str) -> Optional[Dict[str, bool]]:
+    """One routing call that returns the include flag for every source, or
+    None when the call fails or its reply can't be used."""
+    print(f"[DEBUG] → route_llm(): calling {ROUTING_MODEL}")
     try:
-        response = groq_client.chat.completions.create(
-            model=ROUTING_MODEL,
-            messages=[
-                {"role": "user", "content": formatted},
-            ],
+        response = await asyncio.wait_for(
+            groq_client.chat.completions.create(
+                model=ROUTING_MODEL,
+                messages=[{"role": "user", "content": ROUTER_PROMPT.format(query=query)}],
+                response_format={"type": "json_object"},
+                temperature=0,
+            ),
+            settings.ROUTER_TIMEOUT_S,
         )
+    except asyncio.TimeoutError:
+        print(f"[ERROR]   router LLM timed out after {settings.ROUTER_TIMEOUT_S}s")
+        metrics.incr("routing.llm_timeouts")
+        return None
     except Exception as e:
         print(f"[ERROR]   Exception when calling Groq: {e!r}")
-    print(f"[DEBUG] ← gate(): LLM response: {response}")
-    raw = response.choices[0].message.content.strip()
+        return None
+    raw = response.choices[0].message.content or ""
     print(f"[DEBUG]    raw response: {raw!r}")
+    return _parse_flags(raw)
+
+
+# Routing decisions are cached on the normalized query text. Near-duplicates
+# ("what's outstanding on the PSA" vs "What is outstanding on the PSA?") are
+# matched by query-embedding similarity against this process's recent
+# entries; the decision itself is read from the (possibly shared) cache.
+_recent_routes = RecentIndex(settings.ROUTE_CACHE_SIZE)
+
+
+def _routing_cache():
+    return get_cache("routing", settings.ROUTE_CACHE_TTL_S, settings.ROUTE_CACHE_SIZE)
+
+
+async def _cached_route(query: str, embedding: List[float]) -> Optional[Dict[str, bool]]:
+    cache = _routing_cache()
+    key = text_key(query)
+    flags = await cache.get(key)
+    if flags is not None or settings.ROUTE_CACHE_SIM >= 1:
+        return flags
+    nearest = _recent_routes.nearest(embedding, settings.ROUTE_CACHE_SIM)
+    if nearest is None:
+        return None
+    best_key, best_sim = nearest
+    flags = await cache.get(best_key)
+    if flags is not None:
+        metrics.incr("cache.routing.similar_hits")
+        print(f"[DEBUG]    routing cache: near-duplicate hit (cos={best_sim:.3f})")
+    return flags
 
-    # Strip wrapping quotes/backticks
-    if (raw.startswith('"') and raw.endswith('"')) or (raw.startswith('`') and raw.endswith('`')):
-        stripped = raw[1:-1].strip()
-        print(f"[DEBUG]    stripped quotes/backticks → {stripped!r}")
+
+async def _remember_route(query: str, embedding: List[float], flags: Dict[str, bool]) -> None:
+    key = text_key(query)
+    await _routing_cache().set(key, flags)
+    _recent_routes.add(key, embedding)
+
+
+async def route(query: str, embedding: List[float]) -> Dict[str, bool]:
+    """Pick the sources for `query`, asking the LLM only when the local
+    classifier isn't confident (or ROUTER_MODE says to always ask)."""
+    t0 = time.perf_counter()
+    mode = settings.ROUTER_MODE.lower()
+    metrics.incr("routing.requests")
+    decided_by = "llm"
+    flags = await _cached_route(query, embedding) if settings.ROUTE_CACHE_ENABLED else None
+    if flags is not None:
+        decided_by = "cache"
+    elif mode in ("hybrid", "local"):
+        local = await classify(query, embedding)
+        print(f"[DEBUG]    local router: flags={local.flags} scores={local.scores} confident={local.confident}")
+        if local.confident or mode == "local":
+            flags, decided_by = local.flags, "local"
+    if decided_by == "llm":
+        metrics.incr("routing.llm_calls")
+        flags = await route_llm(query)
+        if flags is None:
+            print(f"[DEBUG]    falling back to {_FALLBACK_FLAGS}")
+            flags, decided_by = dict(_FALLBACK_FLAGS), "fallback"
     else:
-        stripped = raw
-        print(f"[DEBUG]    no wrapping quotes/backticks → {stripped!r}")
+        metrics.incr("routing.llm_skipped")
+    if decided_by in ("local", "llm") and settings.ROUTE_CACHE_ENABLED:
+        await _remember_route(query, embedding, flags)
+    elapsed = (time.perf_counter() - t0) * 1000
+    metrics.observe("routing", elapsed)
+    metrics.observe(f"routing.{decided_by}", elapsed)
+    print(
+        f"[DEBUG] ← route(): {flags} by {decided_by} in {elapsed:.1f} ms "
+        f"(llm skip rate {metrics.ratio('routing.llm_skipped', 'routing.requests'):.0%})"
+    )
+    return flags
 
-    include = False
+# — retrieval ---------------------------------------------------------------
+# each source gets its own deadline: a slow or failing one is dropped from the
+# context instead of holding up (or failing) the whole turn
+async def fetch(src: str, query: str, embedding: List[float], project_id: str, conversation_id: str) -> List[dict]:
+    print(f"[DEBUG] → fetch(): retrieving from '{src}'")
+    if src == "docs":
+        call = retrieve_docs(embedding, project_id, query_text=query)
+    elif src == "tasks":
+        call = retrieve_tasks(embedding, project_id)
+    elif src == "messages":
+        call = retrieve_messages(embedding, conversation_id)
+    else:
+        print(f"[DEBUG] ← fetch('{src}'): no handler, returning []")
+        return []
+    t0 = time.perf_counter()
     try:
-        data = json.loads(stripped)
-        print(f"[DEBUG]    parsed JSON: {data}")
-        include = str(data.get("include", "")).lower() == "yes"
-        print(f"[DEBUG]    include flag from JSON: {include}")
-    except json.JSONDecodeError as jde:
-        print(f"[DEBUG]    JSONDecodeError: {jde}")
-        # fallback regex check
-        if re.search(r'"?include"?\s*:\s*"?yes"?', stripped, re.IGNORECASE):
-            include = True
-            print(f"[DEBUG]    regex fallback matched 'yes' → include = {include}")
-        else:
-            print(f"[DEBUG]    regex fallback did not match → include = {include}")
+        chunks = await asyncio.wait_for(call, settings.RETRIEVAL_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        print(f"[ERROR] ← fetch('{src}'): timed out after {settings.RETRIEVAL_TIMEOUT_S}s")
+        metrics.incr(f"retrieval.{src}.timeouts")
+        return []
     except Exception as e:
-        print(f"[DEBUG]    Unexpected error parsing include flag: {e}")
-        include = False
+        print(f"[ERROR] ← fetch('{src}'): {e!r}")
+        metrics.incr(f"retrieval.{src}.errors")
+        return []
+    metrics.observe(f"retrieval.{src}", (time.perf_counter() - t0) * 1000)
+    print(f"[DEBUG] ← fetch('{src}'): got {len(chunks)} chunks")
+    return chunks
+
+
+# Speculative retrieval (SPECULATIVE_RETRIEVAL): start every source's vector
+# search as soon as the query embedding exists, in parallel with routing, so
+# the turn waits for max(routing, retrieval) rather than their sum. Sources
+# the router rejects are cancelled; the price is up to one extra RPC per
+# source per turn.
+Prefetch = Dict[str, "asyncio.Task[List[dict]]"]
+
+
+def speculate(query: str, embedding: List[float], project_id: str, conversation_id: str) -> Prefetch:
+    return {
+        src: asyncio.create_task(fetch(src, query, embedding, project_id, conversation_id), name=f"prefetch-{src}")
+        for src in SOURCES
+    }
+
+
+def cancel_prefetch(prefetched: Optional[Prefetch], keep: Sequence[str] = (), count: bool = True) -> None:
+    """Cancel the prefetches not in `keep`. retrieval.speculative_discarded
+    counts the ones still running; pass count=False when cleaning up after
+    a failed or cancelled turn, which isn't a routing decision."""
+    for src, task in (prefetched or {}).items():
+        if src in keep or task.done():
+            continue
+        if count:
+            metrics.incr("retrieval.speculative_discarded")
+        task.cancel()
 
-    print(f"[DEBUG] ← gate() for '{src}': include={include}")
-    return include
 
 async def routed_rag_context(
     query: str,
     embedding: List[float],
     project_id: str,
     conversation_id: str,
+    flags: Optional[Dict[str, bool]] = None,
+    prefetched: Optional[Prefetch] = None,
 ) -> str:
     print(f"[DEBUG] → routed_rag_context() start")
     print(f"         query='{query[:50]}'...")
     print(f"         embedding[0:5]={embedding[:5]}..., len={len(embedding)}")
     print(f"         project_id={project_id}, conversation_id={conversation_id}")
 
-    # — B. run gates in parallel -----------------------------------------
-    sources = ["docs", "tasks", "messages"]
-    print(f"[DEBUG] → Launching gates for sources: {sources}")
-    gate_flags = await asyncio.gather(*(gate(s, query) for s in sources))
-    print(f"[DEBUG] ← gate_flags: {dict(zip(sources, gate_flags))}")
+    if prefetched is None and flags is None and settings.SPECULATIVE_RETRIEVAL:
+        prefetched = speculate(query, embedding, project_id, conversation_id)
 
-    to_query = [s for s, ok in zip(sources, gate_flags) if ok]
-    print(f"[DEBUG] → Sources selected for retrieval: {to_query}")
+    # — B. route: local classifier, LLM only when it isn't sure ---------
+    if flags is None:
+        try:
+            flags = await route(query, embedding)
+        except BaseException:
+            cancel_prefetch(prefetched)
+            raise
 
-    # — C. retrieval fan-out ---------------------------------------------
-    async def fetch(src: str):
-        print(f"[DEBUG] → fetch(): retrieving from '{src}'")
-        if src == "docs":
-            docs = await retrieve_docs(embedding, project_id)
-            print(f"[DEBUG] ← retrieve_docs: got {len(docs)} chunks")
-            return docs
-        if src == "tasks":
-            tasks = await retrieve_tasks(embedding, project_id)
-            print(f"[DEBUG] ← retrieve_tasks: got {len(tasks)} chunks")
-            return tasks
-        if src == "messages":
-            msgs = await retrieve_messages(embedding, conversation_id)
-            print(f"[DEBUG] ← retrieve_messages: got {len(msgs)} chunks")
-            return msgs
-        print(f"[DEBUG] ← fetch('{src}'): no handler, returning []")
-        return []
+    to_query = [s for s in SOURCES if flags[s]]
+    print(f"[DEBUG] → Sources selected for retrieval: {to_query}")
 
-    print(f"[DEBUG] → launching parallel fetch for selected sources")
-    results_nested = await asyncio.gather(*(fetch(s) for s in to_query))
+    # — C. retrieval fan-out (or keep the speculative fetches we need) ----
+    cancel_prefetch(prefetched, keep=to_query)
+    if prefetched is not None:
+        metrics.incr("retrieval.speculative_used", len(to_query))
+        pending = [prefetched[s] for s in to_query]
+    else:
+        pending = [fetch(s, query, embedding, project_id, conversation_id) for s in to_query]
+    print(f"[DEBUG] → awaiting retrieval for selected sources")
+    results_nested = await asyncio.gather(*pending)
     print(f"[DEBUG] ← results_nested lengths: {[len(r) for r in results_nested]}")
 
-    # — D. assemble context -----------------------------------------------
-    context = ""
-    for src, chunks in zip(to_query, results_nested):
-        print(f"[DEBUG] → adding {len(chunks)} chunks from '{src}' to context")
-        context += f"### {src}\n"
-        for i, chunk in enumerate(chunks):
-            snippet = chunk.replace("\n", " ")[:100]
-            print(f"    chunk[{i}]: {snippet!r}...")
-            context += f"{chunk}\n"
-
-    print(f"[DEBUG] ← routed_rag_context() assembled context length={len(context)}")
-    return context
\ No newline at end of file
+    # — D. assemble context: rank across sources, drop near-duplicates,
+    #      stop at the token budget ----------------------------------------
+    packed = pack_context(dict(zip(to_query, results_nested)))
+    for c in packed.duplicates:
+        print(f"[DEBUG]    dropped near-duplicate {c.source} chunk {c.id}: {c.content[:60]!r}...")
+    for c in packed.over_budget:
+        print(f"[DEBUG]    dropped {c.source} chunk {c.id} (over budget): {c.content[:60]!r}...")
+    print(
+        f"[DEBUG] ← routed_rag_context() packed {len(packed.kept)} chunks, ~{packed.tokens} tokens "
+        f"({len(packed.duplicates)} duplicates, {len(packed.over_budget)} over budget dropped)"
+    )
+    return packed.context
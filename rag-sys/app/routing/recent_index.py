@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Near-duplicate lookup for the routing and answer caches: the most recently
+# added query embeddings, L2-normalised into the rows of one float32 matrix,
+# so finding the closest previous query is a single matrix-vector product
+# rather than a Python loop over every entry. The least recently added key
+# is evicted past `max_items`; its row is reused.
+
+
+class RecentIndex:
+    def __init__(self, max_items: int):
+        self.max_items = max(1, max_items)
+        self._rows: "OrderedDict[str, int]" = OrderedDict()
+        self._keys: List[Optional[str]] = []
+        self._matrix: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, key: str, embedding: List[float]) -> None:
+        vec = _normalized(embedding)
+        if self._matrix is not None and self._matrix.shape[1] != vec.shape[0]:
+            self.clear()  # the embedding model changed
+        row = self._rows.pop(key, None)
+        if row is None:
+            row = self._free_row(vec.shape[0])
+        self._matrix[row] = vec
+        self._keys[row] = key
+        self._rows[key] = row
+
+    def nearest(self, embedding: List[float], min_sim: float) -> Optional[Tuple[str, float]]:
+        """The closest key with cosine similarity >= `min_sim`, if any."""
+        if not self._rows:
+            return None
+        vec = _normalized(embedding)
+        if vec.shape[0] != self._matrix.shape[1]:
+            return None
+        scores = self._matrix[:len(self._keys)] @ vec
+        row = int(np.argmax(scores))
+        sim = float(scores[row])
+        if sim < min_sim or self._keys[row] is None:
+            return None
+        return self._keys[row], sim
+
+    def clear(self) -> None:
+        self._rows.clear()
+        self._keys = []
+        self._matrix = None
+
+    def _free_row(self, dim: int) -> int:
+        if len(self._rows) >= self.max_items:
+            _, row = self._rows.popitem(last=False)
+            return row
+        row = len(self._keys)
+        if self._matrix is None:
+            self._matrix = np.zeros((min(64, self.max_items), dim), dtype=np.float32)
+        elif row == self._matrix.shape[0]:
+            grown = np.zeros((min(2 * row, self.max_items), dim), dtype=np.float32)
+            grown[:row] = self._matrix
+            self._matrix = grown
+        self._keys.append(None)
+        return row
+
+
+def _normalized(embedding: List[float]) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
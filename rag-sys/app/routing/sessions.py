@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.embedding.message_queue import message_queue, utc_timestamp
+from app.metrics import metrics
+from app.routing.context import estimate_tokens
+from app.routing.groq_client import groq_client
+from app.tools.messages import get_messages, has_answers_after
+
+# Per-conversation chat history for the prompt. A session is loaded from the
+# Message table on a conversation's first turn in this process and then kept
+# up to date in memory; only plain user questions and assistant answers are
+# kept (retrieved context and tool output are per-turn).
+#
+# Each prompt carries the newest turns that fit CHAT_HISTORY_TOKEN_BUDGET.
+# Older turns are dropped once they pass twice the budget or, with
+# CHAT_SUMMARY_ENABLED, folded into a running summary by a small model in the
+# background. The least recently used sessions are evicted past
+# CHAT_SESSIONS_MAX.
+#
+# Another worker may serve some of a conversation's turns, so before a
+# session is reused the database is asked whether the conversation has an
+# answer newer than the last one the session knows; if it does (or the
+# session sat idle past CHAT_SESSION_IDLE_S) it is reloaded. A reload also
+# picks up this process's answers still waiting in the write-behind queue.
+
+SUMMARY_PROMPT = (
+    "Condense this earlier part of a conversation between a user and a real estate "
+    "project assistant into a short summary (at most 150 words). Keep names, "
+    "numbers, dates, decisions and open questions; drop pleasantries."
+)
+
+
+class Session:
+    def __init__(self, conversation_id: str, turns: List[dict]):
+        self.conversation_id = conversation_id
+        self.turns = turns
+        self.summary = ""
+        self.last_used = time.monotonic()
+        self.unsummarized: List[dict] = []
+        self.summarizing = False
+        # createdAt of the newest answer in `turns` (or already summarized)
+        self.latest_answer: Optional[str] = None
+
+
+_sessions: "OrderedDict[str, Session]" = OrderedDict()
+_background = set()
+
+
+def _tokens(turns: List[dict]) -> int:
+    return sum(estimate_tokens(t["content"]) for t in turns)
+
+
+async def _is_current(session: Session) -> bool:
+    if time.monotonic() - session.last_used > settings.CHAT_SESSION_IDLE_S:
+        return False
+    try:
+        newer = await has_answers_after(session.conversation_id, session.latest_answer)
+    except Exception as e:
+        print(f"[WARN] checking conversation {session.conversation_id} for newer answers failed: {e}")
+        return True
+    if newer:
+        metrics.incr("sessions.stale")
+    return not newer
+
+
+async def _load(conversation_id: str, current_message: str, user_id: Optional[str]) -> Session:
+    stored = [
+        {"role": m["role"], "content": m["content"], "createdAt": utc_timestamp(m["createdAt"])}
+        for m in await get_messages(user_id, conversation_id)
+        if m["role"] in ("user", "assistant") and m["content"]
+    ]
+    # answers this process hasn't written yet (user messages are stored by
+    # the web app before it asks for an answer)
+    seen = {(m["role"], m["content"], m["createdAt"]) for m in stored}
+    pending = [
+        {"role": m.role, "content": m.content, "createdAt": m.created_at}
+        for m in message_queue.pending_for(conversation_id)
+        if m.role == "assistant" and (m.role, m.content, m.created_at) not in seen
+    ]
+    messages = sorted(stored + pending, key=lambda m: m["createdAt"])
+    history = [{"role": m["role"], "content": m["content"]} for m in messages]
+    # the web app stores the user's message before asking for an answer
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == current_message:
+        history.pop()
+    session = Session(conversation_id, history)
+    session.latest_answer = max((m["createdAt"] for m in messages if m["role"] == "assistant"), default=None)
+    return session
+
+
+async def get_session(conversation_id: str, current_message: str, user_id: Optional[str] = None) -> Session:
+    session = _sessions.get(conversation_id)
+    if session is not None and not await _is_current(session):
+        session = None
+    if session is None:
+        session = await _load(conversation_id, current_message, user_id)
+        _sessions[conversation_id] = session
+        metrics.incr("sessions.loads")
+        _compact(session)
+    session.last_used = time.monotonic()
+    _sessions.move_to_end(conversation_id)
+    while len(_sessions) > settings.CHAT_SESSIONS_MAX:
+        _sessions.popitem(last=False)
+        metrics.incr("sessions.evictions")
+    return session
+
+
+def history_messages(session: Session) -> List[dict]:
+    """The summary (if any) plus the newest turns within the token budget."""
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET
+    window: List[dict] = []
+    used = 0
+    for turn in reversed(session.turns):
+        cost = estimate_tokens(turn["content"])
+        if used + cost > budget:
+            break
+        window.append(turn)
+        used += cost
+    window.reverse()
+    metrics.incr("sessions.history_tokens", used)
+    if session.summary:
+        return [{"role": "system", "content": "Summary of the earlier conversation: " + session.summary}] + window
+    return window
+
+
+def record_turn(session: Session, user_message: str, answer: str, answered_at: Optional[str] = None) -> None:
+    """`answered_at` is the answer's createdAt, as returned by
+    message_queue.enqueue_turn."""
+    session.turns.append({"role": "user", "content": user_message})
+    session.turns.append({"role": "assistant", "content": answer})
+    if answered_at is not None:
+        session.latest_answer = max(session.latest_answer or answered_at, answered_at)
+    _compact(session)
+
+
+def _compact(session: Session) -> None:
+    overflow = _tokens(session.turns) - 2 * settings.CHAT_HISTORY_TOKEN_BUDGET
+    if overflow <= 0:
+        return
+    # oldest turns covering the overflow; history then restarts at a user turn
+    cut, dropped = 0, 0
+    while cut < len(session.turns) and dropped < overflow:
+        dropped += estimate_tokens(session.turns[cut]["content"])
+        cut += 1
+    while cut < len(session.turns) and session.turns[cut]["role"] != "user":
+        cut += 1
+    old, session.turns = session.turns[:cut], session.turns[cut:]
+    if not settings.CHAT_SUMMARY_ENABLED:
+        metrics.incr("sessions.turns_dropped", len(old))
+        return
+    session.unsummarized.extend(old)
+    if not session.summarizing:
+        session.summarizing = True
+        task = asyncio.create_task(_summarize(session))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+async def _summarize(session: Session) -> None:
+    try:
+        # turns dropped while a summary is being written are folded in next
+        while session.unsummarized:
+            old, session.unsummarized = session.unsummarized, []
+            await _fold(session, old)
+    finally:
+        session.summarizing = False
+
+
+async def _fold(session: Session, old: List[dict]) -> None:
+    # a long history loaded from the database is summarized from its tail
+    limit = 4 * settings.CHAT_HISTORY_TOKEN_BUDGET
+    while len(old) > 1 and _tokens(old) > limit:
+        old = old[1:]
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in old)
+    if session.summary:
+        transcript = f"Earlier summary: {session.summary}\n\n{transcript}"
+    t0 = time.perf_counter()
+    try:
+        resp = await groq_client.chat.completions.create(
+            model=settings.CHAT_SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript},
+            ],
+            temperature=0,
+            max_tokens=300,
+        )
+        session.summary = (resp.choices[0].message.content or "").strip()
+        metrics.incr("sessions.summaries")
+        metrics.observe("sessions.summary", (time.perf_counter() - t0) * 1000)
+    except Exception as e:
+        # the turns are gone either way; losing them beats an unbounded prompt
+        print(f"[WARN] summarizing conversation {session.conversation_id} failed: {e}")
+        metrics.incr("sessions.turns_dropped", len(old))
+
+
+def session_stats() -> Dict[str, int]:
+    return {
+        "sessions": len(_sessions),
+        "turns": sum(len(s.turns) for s in _sessions.values()),
+        "history_tokens": sum(_tokens(s.turns) for s in _sessions.values()),
+    }
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.database import db
+from app.metrics import metrics
+from app.routing.answer_cache import project_version
+
+# In-process copy of a project's document-chunk / task embeddings, so hot
+# projects are searched with one matrix-vector product instead of a
+# retrieve_* RPC. Rows are L2-normalised when loaded, which makes
+# `matrix @ query` the cosine similarity the RPCs compute.
+#
+# A miss never blocks a turn: the caller falls back to the RPC and the
+# project is loaded in the background for the next one. Entries are tagged
+# with the project's data version (bumped whenever an ingestion job or
+# embed_task writes), so a write makes them stale on the next lookup; the TTL
+# bounds staleness for writes that bypass this service (e.g. tasks deleted
+# from the web app). Projects are evicted least-recently-used once the
+# matrices and their text exceed VECTOR_CACHE_MAX_MB.
+#
+# The version a hit is checked against is remembered for _VERSION_TTL_S, so
+# one turn's searches (docs, tasks, every query of a batch) share a single
+# lookup instead of a round trip each.
+
+_TABLES = {"docs": "DocumentChunk", "tasks": "Task"}
+_PAGE_SIZE = 2000
+_VERSION_TTL_S = 1.0
+
+
+class _Entry(NamedTuple):
+    version: int
+    loaded_at: float
+    ids: List[str]
+    contents: List[str]
+    matrix: np.ndarray
+    nbytes: int
+
+
+_entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+_loading: Dict[Tuple[str, str], asyncio.Task] = {}
+_versions: Dict[str, Tuple[float, "asyncio.Task[int]"]] = {}
+_used_bytes = 0
+
+
+def _dtype() -> np.dtype:
+    # float16 halves the memory per project at some cost in search speed
+    # (numpy has no BLAS kernel for it) and ~3 significant digits of similarity
+    return np.dtype(settings.VECTOR_CACHE_DTYPE)
+
+
+def _cap_bytes() -> int:
+    return int(settings.VECTOR_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _drop(key: Tuple[str, str]) -> None:
+    global _used_bytes
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        _used_bytes -= entry.nbytes
+
+
+def _put(key: Tuple[str, str], entry: _Entry) -> None:
+    global _used_bytes
+    _drop(key)
+    _entries[key] = entry
+    _used_bytes += entry.nbytes
+    while _used_bytes > _cap_bytes() and len(_entries) > 1:
+        evicted, _ = next(iter(_entries.items()))
+        _drop(evicted)
+        metrics.incr("vector_cache.evictions")
+
+
+async def _current_version(project_id: str) -> int:
+    checked = _versions.get(project_id)
+    if checked is None or time.monotonic() - checked[0] > _VERSION_TTL_S:
+        # concurrent searches wait on the same lookup
+        checked = (time.monotonic(), asyncio.ensure_future(project_version(project_id)))
+        _versions[project_id] = checked
+        if len(_versions) > 1024:
+            now = time.monotonic()
+            for pid in [p for p, (t, _) in _versions.items() if now - t > _VERSION_TTL_S]:
+                del _versions[pid]
+    try:
+        return await asyncio.shield(checked[1])
+    except Exception:
+        _versions.pop(project_id, None)
+        raise
+
+
+def _parse_page(rows: List[dict]) -> np.ndarray:
+    # embeddings arrive as pgvector text ("[0.1,0.2,...]")
+    page = np.stack([np.fromstring(r["embedding"].strip("[]"), dtype=np.float32, sep=",") for r in rows])
+    norms = np.linalg.norm(page, axis=1, keepdims=True)
+    return (page / np.where(norms == 0, 1, norms)).astype(_dtype())
+
+
+async def _load(source: str, project_id: str) -> None:
+    version = await project_version(project_id)
+    if version < 0:
+        return
+    table = _TABLES[source]
+    t0 = time.perf_counter()
+    ids: List[str] = []
+    contents: List[str] = []
+    pages: List[np.ndarray] = []
+    nbytes = 0
+    after = ""
+    while True:
+        # keyset pagination keeps each result set (768 floats/row as text) small
+        rows = await db.query_raw(
+            f'''
+            SELECT id, content, embedding::text AS embedding
+            FROM "{table}"
+            WHERE "projectId" = $1 AND embedding IS NOT NULL AND id > $2
+            ORDER BY id
+            LIMIT {_PAGE_SIZE}
+            ''',
+            project_id,
+            after,
+        )
+        if not rows:
+            break
+        # parsing a page of vectors takes long enough to stall the event loop
+        page = await asyncio.to_thread(_parse_page, rows)
+        pages.append(page)
+        ids.extend(r["id"] for r in rows)
+        contents.extend(r["content"] for r in rows)
+        nbytes += page.nbytes + sum(len(r["content"]) for r in rows)
+        if nbytes > _cap_bytes():
+            print(f"[vector cache] {source} of project {project_id} exceeds VECTOR_CACHE_MAX_MB; not cached")
+            metrics.incr("vector_cache.too_large")
+            return
+        after = rows[-1]["id"]
+        if len(rows) < _PAGE_SIZE:
+            break
+
+    # rows written while loading would be missing from this snapshot
+    if version != await project_version(project_id):
+        return
+    matrix = np.vstack(pages) if pages else np.zeros((0, 0), dtype=_dtype())
+    _put((source, project_id), _Entry(version, time.monotonic(), ids, contents, matrix, nbytes))
+    metrics.observe(f"vector_cache.load.{source}", (time.perf_counter() - t0) * 1000)
+    print(f"[vector cache] loaded {len(ids)} {source} rows of project {project_id} ({nbytes / 1e6:.1f} MB)")
+
+
+def _schedule_load(source: str, project_id: str) -> None:
+    key = (source, project_id)
+    if key in _loading:
+        return
+
+    async def run() -> None:
+        try:
+            await _load(source, project_id)
+        except Exception as e:
+            print(f"[vector cache] loading {source} of project {project_id} failed: {e}")
+        finally:
+            _loading.pop(key, None)
+
+    _loading[key] = asyncio.create_task(run())
+
+
+async def search(
+    source: str,
+    project_id: str,
+    embedding: List[float],
+    limit: int,
+    threshold: float,
+) -> Optional[List[dict]]:
+    """Top-`limit` rows above `threshold` in the shape the retrieve_* RPCs
+    return, or None when the project isn't cached (yet) and the caller
+    should query the database."""
+    if not settings.VECTOR_CACHE_ENABLED:
+        return None
+    key = (source, project_id)
+    entry = _entries.get(key)
+    if entry is not None and (
+        time.monotonic() - entry.loaded_at > settings.VECTOR_CACHE_TTL_S
+        or entry.version != await _current_version(project_id)
+    ):
+        _drop(key)
+        entry = None
+    if entry is None:
+        metrics.incr(f"vector_cache.{source}.misses")
+        _schedule_load(source, project_id)
+        return None
+    _entries.move_to_end(key)
+    metrics.incr(f"vector_cache.{source}.hits")
+
+    t0 = time.perf_counter()
+    if not entry.ids or limit <= 0:
+        return []
+    q = np.asarray(embedding, dtype=np.float32)
+    q /= np.linalg.norm(q) or 1.0
+    scores = (entry.matrix @ q.astype(entry.matrix.dtype)).astype(np.float32)
+    k = min(limit, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    rows = [
+        {
+            "id": entry.ids[i],
+            "content": entry.contents[i],
+            "similarity": float(scores[i]),
+            "embedding": entry.matrix[i].astype(np.float32).tolist(),
+        }
+        for i in top
+        if scores[i] > threshold
+    ]
+    metrics.observe(f"vector_cache.search.{source}", (time.perf_counter() - t0) * 1000)
+    return rows
+
+
+def stats() -> dict:
+    return {
+        "enabled": settings.VECTOR_CACHE_ENABLED,
+        "dtype": str(_dtype()),
+        "used_mb": round(_used_bytes / 1024 / 1024, 1),
+        "max_mb": settings.VECTOR_CACHE_MAX_MB,
+        "entries": [
+            {"source": source, "projectId": pid, "rows": len(e.ids), "version": e.version}
+            for (source, pid), e in _entries.items()
+        ],
+    }
@@ -1,13 +1,82 @@
-from app.database import supabase
+from app.config import settings
+from app.embedding.store import parse_vector, split_batch_rows
+from app.database import connect_supabase
+from app.routing import vector_cache
 
-async def retrieve_docs(embedded_query: list[float], project_id: str, limit: int = 5):
-    # in your FastAPI / anywhere you have supabase client
-    res = supabase.rpc('retrieve_document_chunks', {
+async def retrieve_docs(
+    embedded_query: list[float],
+    project_id: str,
+    limit: int = 5,
+    ef_search: int | None = None,
+    query_text: str | None = None,
+):
+    hybrid = bool(query_text) and settings.RETRIEVAL_MODE.lower() == "hybrid"
+    if not hybrid:
+        # the in-process cache has no full-text index, so hybrid always goes to the DB
+        cached = await vector_cache.search('docs', project_id, embedded_query, limit, 0.2)
+        if cached is not None:
+            return cached
+    supabase = await connect_supabase()
+    if hybrid:
+        # full-text + vector candidates fused by reciprocal rank, in one RPC
+        res = await supabase.rpc('retrieve_document_chunks_hybrid', {
+            'query_embedding': embedded_query,
+            'query_text': query_text,
+            'match_count': limit,
+            'project_id': project_id,
+            'ef_search': ef_search or settings.HNSW_EF_SEARCH,
+            'candidate_count': settings.HYBRID_CANDIDATES,
+            'rrf_k': settings.HYBRID_RRF_K,
+            'full_text_weight': settings.HYBRID_FULL_TEXT_WEIGHT,
+            'semantic_weight': settings.HYBRID_SEMANTIC_WEIGHT,
+            'match_threshold': 0.2,
+        }).execute()
+        return [{**r, 'embedding': parse_vector(r.get('embedding'))} for r in res.data]
+    res = await supabase.rpc('retrieve_document_chunks', {
         'query_embedding': embedded_query,
         'match_threshold': 0.2,
         'match_count': limit,
-        'project_id': project_id
+        'project_id': project_id,
+        'ef_search': ef_search or settings.HNSW_EF_SEARCH,
     }).execute()
-    return [r['content'] for r in res.data]
+    return [{**r, 'embedding': parse_vector(r.get('embedding'))} for r in res.data]
 
 
+async def retrieve_docs_batch(
+    embedded_queries: list[list[float]],
+    project_id: str,
+    limit: int = 5,
+    ef_search: int | None = None,
+    query_texts: list[str] | None = None,
+) -> list[list[dict]]:
+    """retrieve_docs for several queries in one RPC; one result list per query."""
+    if not embedded_queries:
+        return []
+    hybrid = bool(query_texts) and settings.RETRIEVAL_MODE.lower() == "hybrid"
+    if not hybrid:
+        cached = [await vector_cache.search('docs', project_id, e, limit, 0.2) for e in embedded_queries]
+        if all(c is not None for c in cached):
+            return cached
+    supabase = await connect_supabase()
+    if hybrid:
+        res = await supabase.rpc('retrieve_document_chunks_hybrid_batch', {
+            'query_embeddings': embedded_queries,
+            'query_texts': query_texts,
+            'match_count': limit,
+            'project_id': project_id,
+            'ef_search': ef_search or settings.HNSW_EF_SEARCH,
+            'candidate_count': settings.HYBRID_CANDIDATES,
+            'rrf_k': settings.HYBRID_RRF_K,
+            'full_text_weight': settings.HYBRID_FULL_TEXT_WEIGHT,
+            'semantic_weight': settings.HYBRID_SEMANTIC_WEIGHT,
+            'match_threshold': 0.2,
+        }).execute()
+        return split_batch_rows(res.data, len(embedded_queries), order_by='score')
+    res = await supabase.rpc('retrieve_document_chunks_batch', {
+        'query_embeddings': embedded_queries,
+        'match_threshold': 0.2,
+        'match_count': limit,
+        'project_id': project_id,
+        'ef_search': ef_search or settings.HNSW_EF_SEARCH,
+    }).execute()
+    return split_batch_rows(res.data, len(embedded_queries))
@@ -1,19 +1,44 @@
-from app.database import supabase, db
+from fastapi import HTTPException
 
+from app.config import settings
+from app.embedding.store import parse_vector, split_batch_rows
+from app.database import connect_supabase, db
 
 
-async def get_messages(user_id: str, conversation_id: str):
+
+async def get_messages(user_id: str | None, conversation_id: str):
+    """A conversation's messages, oldest first. Without `user_id` the owner
+    isn't checked (the chat endpoints are already behind the service token)."""
+    where = { 'id': conversation_id }
+    if user_id:
+        where['userId'] = user_id
     try:
         conv = await db.conversation.find_first_or_raise(
-            where={ 'id': conversation_id, 'userId': user_id },
-            include={ 'messages': True }
+            where=where,
+            include={ 'messages': { 'order_by': { 'createdAt': 'asc' } } }
         )
-        return [{'role': m.role, 'content': m.content} for m in conv.messages]
+        return [{'role': m.role, 'content': m.content, 'createdAt': m.createdAt} for m in conv.messages]
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
 
 
+async def has_answers_after(conversation_id: str, since: str | None) -> bool:
+    """Whether the conversation has an assistant message newer than `since`
+    (a naive UTC ISO timestamp; None means any)."""
+    rows = await db.query_raw(
+        '''
+        SELECT EXISTS (
+            SELECT 1 FROM "Message"
+            WHERE "conversationId" = $1 AND role = 'assistant'
+              AND "createdAt" > coalesce($2::timestamp, '-infinity'::timestamp)
+        ) AS newer
+        ''',
+        conversation_id, since,
+    )
+    return bool(rows[0]["newer"])
+
+
 async def update_messages(new_msg: dict, conversation_id: str):
     try:
         # wrap your single message in a list:
@@ -28,11 +53,33 @@ async def update_messages(new_msg: dict, conversation_id: str):
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
-async def retrieve_messages(embedded_query: list[float], conversation_id: str, limit: int = 5):
-    res = supabase.rpc('retrieve_messages', {
+async def retrieve_messages(embedded_query: list[float], conversation_id: str, limit: int = 5, ef_search: int | None = None):
+    supabase = await connect_supabase()
+    res = await supabase.rpc('retrieve_messages', {
         'query_embedding': embedded_query,
         'match_threshold': 0.7,
         'match_count': limit,
-        'conversation_id': conversation_id
+        'conversation_id': conversation_id,
+        'ef_search': ef_search or settings.HNSW_EF_SEARCH,
+    }).execute()
+    return [{**r, 'embedding': parse_vector(r.get('embedding'))} for r in res.data]
+
+
+async def retrieve_messages_batch(
+    embedded_queries: list[list[float]],
+    conversation_id: str,
+    limit: int = 5,
+    ef_search: int | None = None,
+) -> list[list[dict]]:
+    """retrieve_messages for several queries in one RPC; one result list per query."""
+    if not embedded_queries:
+        return []
+    supabase = await connect_supabase()
+    res = await supabase.rpc('retrieve_messages_batch', {
+        'query_embeddings': embedded_queries,
+        'match_threshold': 0.7,
+        'match_count': limit,
+        'conversation_id': conversation_id,
+        'ef_search': ef_search or settings.HNSW_EF_SEARCH,
     }).execute()
-    return [r['content'] for r in res.data]
+    return split_batch_rows(res.data, len(embedded_queries))
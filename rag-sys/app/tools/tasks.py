@@ -1,10 +1,41 @@
-from app.database import supabase
+from app.config import settings
+from app.embedding.store import parse_vector, split_batch_rows
+from app.database import connect_supabase
+from app.routing import vector_cache
 
-async def retrieve_tasks(embedded_query: list[float], project_id: str, limit: int = 5):
-    res = supabase.rpc('retrieve_tasks', {
+async def retrieve_tasks(embedded_query: list[float], project_id: str, limit: int = 5, ef_search: int | None = None):
+    cached = await vector_cache.search('tasks', project_id, embedded_query, limit, 0.7)
+    if cached is not None:
+        return cached
+    supabase = await connect_supabase()
+    res = await supabase.rpc('retrieve_tasks', {
         'query_embedding': embedded_query,
         'match_threshold': 0.7,
         'match_count': limit,
         'project_id': project_id,
+        'ef_search': ef_search or settings.HNSW_EF_SEARCH,
     }).execute()
-    return [r['content'] for r in res.data]
\ No newline at end of file
+    return [{**r, 'embedding': parse_vector(r.get('embedding'))} for r in res.data]
+
+
+async def retrieve_tasks_batch(
+    embedded_queries: list[list[float]],
+    project_id: str,
+    limit: int = 5,
+    ef_search: int | None = None,
+) -> list[list[dict]]:
+    """retrieve_tasks for several queries in one RPC; one result list per query."""
+    if not embedded_queries:
+        return []
+    cached = [await vector_cache.search('tasks', project_id, e, limit, 0.7) for e in embedded_queries]
+    if all(c is not None for c in cached):
+        return cached
+    supabase = await connect_supabase()
+    res = await supabase.rpc('retrieve_tasks_batch', {
+        'query_embeddings': embedded_queries,
+        'match_threshold': 0.7,
+        'match_count': limit,
+        'project_id': project_id,
+        'ef_search': ef_search or settings.HNSW_EF_SEARCH,
+    }).execute()
+    return split_batch_rows(res.data, len(embedded_queries))
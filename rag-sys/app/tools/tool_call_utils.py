@@ -1,5 +1,8 @@
 import json
 import asyncio
+import inspect
+from app.config import settings
+from app.metrics import metrics
 from app.tools.documents import retrieve_docs
 from app.tools.tasks import retrieve_tasks
 from app.tools.messages import retrieve_messages
@@ -97,12 +100,31 @@ TOOLS = []
 #     },
 # ]
 
-async def call_tool(tool_call):
-    fn = available_functions[tool_call.function.name]
-    args = json.loads(tool_call.function.arguments)
-    loop = asyncio.get_running_loop()
-    # run sync function in thread; replace with HTTP call if it’s an async API
-    result = await loop.run_in_executor(None, fn, **args)
+async def call_tool(tool_call, timeout_s: float | None = None):
+    """Run one tool call from the model and wrap its result as a tool message.
+
+    Async tools are awaited, sync ones run in a worker thread; failures and
+    timeouts are reported back to the model as the tool's output.
+    """
+    name = tool_call.function.name
+    timeout_s = settings.TOOL_TIMEOUT_S if timeout_s is None else timeout_s
+    fn = AVAILABLE_FUNCTIONS.get(name)
+    try:
+        if fn is None:
+            raise LookupError(f"unknown tool {name!r}")
+        args = json.loads(tool_call.function.arguments or "{}")
+        if inspect.iscoroutinefunction(fn):
+            call = fn(**args)
+        else:
+            call = asyncio.to_thread(fn, **args)
+        result = await asyncio.wait_for(call, timeout_s)
+    except asyncio.TimeoutError:
+        metrics.incr("tools.timeouts")
+        result = f"error: {name} timed out after {timeout_s:g}s"
+    except Exception as e:
+        metrics.incr("tools.errors")
+        result = f"error: {name} failed: {e}"
+    print(f"[DEBUG] ← Result from '{name}': {str(result)[:200]!r}")
     return {
         "role": "tool",
         "content": str(result),
@@ -0,0 +1,83 @@
+"""Routing + retrieval latency of a chat turn, with and without speculative retrieval.
+
+    python -m benchmarks.bench_chat_latency PROJECT_ID CONVERSATION_ID queries.txt \\
+        [--runs 5] [--router-mode llm]
+
+queries.txt holds one question per line. Each query is embedded once up
+front; every run then times routed_rag_context() (route → retrieve →
+assemble) against the live Groq / Supabase configured in app/.env, once
+with SPECULATIVE_RETRIEVAL off ("sequential", the old critical path:
+routing + slowest retrieval) and once with it on ("speculative":
+max(routing, retrieval)). The routing cache is disabled so every run
+really routes; --router-mode llm shows the worst case, where every turn
+waits on the router LLM.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.database import connect_supabase, db, disconnect_supabase
+from app.embedding.embedder import embed_query
+from app.routing.groq_client import close_groq_client
+from app.routing.query_router import routed_rag_context
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def _report(name: str, samples: list[float]) -> None:
+    print(
+        f"{name:<12} p50={statistics.median(samples):8.1f} ms   "
+        f"p95={_percentile(samples, 0.95):8.1f} ms   "
+        f"max={max(samples):8.1f} ms   (n={len(samples)})"
+    )
+
+
+async def _run(args: argparse.Namespace) -> None:
+    queries = [q.strip() for q in args.queries.read_text().splitlines() if q.strip()]
+    settings.ROUTE_CACHE_ENABLED = False
+    if args.router_mode:
+        settings.ROUTER_MODE = args.router_mode
+
+    await db.connect()
+    await connect_supabase()
+    try:
+        embeddings = [await embed_query(q) for q in queries]
+        # warm the pooled connections so neither mode pays the handshakes
+        for query, embedding in zip(queries, embeddings):
+            await routed_rag_context(query, embedding, args.project_id, args.conversation_id)
+        for name, speculative in (("sequential", False), ("speculative", True)):
+            settings.SPECULATIVE_RETRIEVAL = speculative
+            samples = []
+            for _ in range(args.runs):
+                for query, embedding in zip(queries, embeddings):
+                    t0 = time.perf_counter()
+                    await routed_rag_context(query, embedding, args.project_id, args.conversation_id)
+                    samples.append((time.perf_counter() - t0) * 1000)
+            _report(name, samples)
+    finally:
+        await close_groq_client()
+        await disconnect_supabase()
+        await db.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project_id")
+    parser.add_argument("conversation_id")
+    parser.add_argument("queries", type=Path)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--router-mode", choices=["hybrid", "llm", "local"])
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""First-document vs steady-state latency of .docx parsing.
+
+    python -m benchmarks.bench_docling path/to/file.docx [--runs 10]
+
+"cold" builds a new DocumentConverter for every document (the old
+_parse_docx behaviour); "warm" reuses the per-process converter that the
+parser workers keep, optionally built up front like DOCLING_PRELOAD does.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from docling.document_converter import DocumentConverter
+
+from app.embedding import extractor
+from app.embedding.extractor import _iter_docling_text, _parse_docx, get_docling_converter
+
+
+def _cold(path: Path) -> None:
+    result = DocumentConverter().convert(str(path))
+    for _ in _iter_docling_text(result.document):
+        pass
+
+
+def _warm(path: Path) -> None:
+    for _ in _parse_docx(path):
+        pass
+
+
+def _time(fn, path: Path) -> float:
+    t0 = time.perf_counter()
+    fn(path)
+    return (time.perf_counter() - t0) * 1000
+
+
+def _report(name: str, samples: list[float]) -> None:
+    steady = samples[1:] or samples
+    print(
+        f"{name:<14} first={samples[0]:8.1f} ms   "
+        f"steady p50={statistics.median(steady):8.1f} ms   "
+        f"max={max(steady):8.1f} ms   (n={len(samples)})"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("docx", type=Path)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    _report("cold", [_time(_cold, args.docx) for _ in range(args.runs)])
+
+    extractor._docling_converter = None
+    _report("warm", [_time(_warm, args.docx) for _ in range(args.runs)])
+
+    extractor._docling_converter = None
+    t0 = time.perf_counter()
+    get_docling_converter()
+    preload_ms = (time.perf_counter() - t0) * 1000
+    _report("warm+preload", [_time(_warm, args.docx) for _ in range(args.runs)])
+    print(f"{'':<14} (preload itself took {preload_ms:.1f} ms, paid once per worker at startup)")
+
+
+if __name__ == "__main__":
+    main()
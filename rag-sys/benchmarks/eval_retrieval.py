@@ -0,0 +1,113 @@
+"""Recall@k of document retrieval, vector-only vs hybrid (full-text + vector, RRF).
+
+    python -m benchmarks.eval_retrieval [--k 1 3 5] [--keep]
+    python -m benchmarks.eval_retrieval --project-id PROJECT --eval my_eval.jsonl
+
+By default the small labelled corpus in benchmarks/eval/corpus is ingested
+into a scratch project (deleted afterwards unless --keep) and the queries in
+benchmarks/eval/retrieval_eval.jsonl are run against it. Each eval line is
+
+    {"query": "...", "relevant": ["text that must be retrieved", ...], "kind": "identifier"}
+
+A relevant passage counts as found at k when it appears (case-insensitive)
+in one of the top k chunks; recall@k is the found fraction averaged over
+queries. "ctx chars" is the mean size of the top-k context handed to the LLM.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+from collections import defaultdict
+from pathlib import Path
+
+from app.config import settings
+from app.database import connect_supabase, db, disconnect_supabase
+from app.embedding.embedder import embed_query
+from app.embedding.parser_pool import parser_pool
+from app.embedding.pipeline import ingest_file
+from app.embedding.providers import get_embedding_provider
+from app.embedding.store import content_hash
+from app.routing.groq_client import close_groq_client
+from app.tools.documents import retrieve_docs
+
+EVAL_DIR = Path(__file__).parent / "eval"
+
+
+async def _ingest_corpus(corpus: Path) -> str:
+    project = await db.project.create(data={"name": "retrieval-eval (scratch)"})
+    for path in sorted(corpus.glob("*.txt")):
+        document = await db.document.create(
+            data={
+                "name": path.name,
+                "storagePath": f"eval/{path.name}",
+                "mimeType": "text/plain",
+                "project": {"connect": {"id": project.id}},
+            }
+        )
+        stats = await ingest_file(path, project.id, document.id, content_hash(path.read_bytes()))
+        print(f"ingested {path.name}: {stats['chunks_processed']} chunks")
+    return project.id
+
+
+def _recall(relevant: list[str], chunks: list[str]) -> float:
+    text = [c.lower() for c in chunks]
+    found = sum(any(r.lower() in c for c in text) for r in relevant)
+    return found / len(relevant)
+
+
+async def _run(args: argparse.Namespace) -> None:
+    cases = [json.loads(line) for line in args.eval.read_text().splitlines() if line.strip()]
+    max_k = max(args.k)
+
+    await db.connect()
+    await connect_supabase()
+    await get_embedding_provider().start()
+    parser_pool.start()
+    scratch = args.project_id is None
+    project_id = args.project_id or await _ingest_corpus(args.corpus)
+    try:
+        embeddings = [await embed_query(c["query"]) for c in cases]
+        for mode in ("vector", "hybrid"):
+            settings.RETRIEVAL_MODE = mode
+            recall = defaultdict(list)      # (kind, k) → per-query recall
+            ctx_chars = defaultdict(list)   # k → context size
+            for case, embedding in zip(cases, embeddings):
+                rows = await retrieve_docs(embedding, project_id, limit=max_k, query_text=case["query"])
+                chunks = [r["content"] for r in rows]
+                for k in args.k:
+                    r = _recall(case["relevant"], chunks[:k])
+                    recall[("all", k)].append(r)
+                    recall[(case.get("kind", "other"), k)].append(r)
+                    ctx_chars[k].append(sum(len(c) for c in chunks[:k]))
+            print(f"\n{mode}")
+            for kind in sorted({kind for kind, _ in recall}):
+                cells = "   ".join(f"recall@{k}={statistics.mean(recall[(kind, k)]):.2f}" for k in args.k)
+                print(f"  {kind:<12} {cells}   (n={len(recall[(kind, args.k[0])])})")
+            print("  " + " " * 12 + "   ".join(f"ctx chars@{k}={statistics.mean(ctx_chars[k]):7.0f}" for k in args.k))
+    finally:
+        if scratch and not args.keep:
+            await db.project.delete(where={"id": project_id})
+        elif scratch:
+            print(f"\nkept scratch project {project_id}")
+        parser_pool.shutdown()
+        await get_embedding_provider().stop()
+        await close_groq_client()
+        await disconnect_supabase()
+        await db.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", type=Path, default=EVAL_DIR / "retrieval_eval.jsonl")
+    parser.add_argument("--corpus", type=Path, default=EVAL_DIR / "corpus")
+    parser.add_argument("--project-id", help="evaluate an existing project instead of ingesting the corpus")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--keep", action="store_true", help="don't delete the scratch project")
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
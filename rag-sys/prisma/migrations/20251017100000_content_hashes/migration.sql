@@ -0,0 +1,17 @@
+-- AlterTable
+ALTER TABLE "DocumentChunk" ADD COLUMN "contentHash" TEXT,
+ADD COLUMN "fileHash" TEXT;
+
+-- CreateTable
+CREATE TABLE "EmbeddingCache" (
+    "model" TEXT NOT NULL,
+    "taskType" TEXT NOT NULL,
+    "textHash" TEXT NOT NULL,
+    "embedding" vector NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "EmbeddingCache_pkey" PRIMARY KEY ("model","taskType","textHash")
+);
+
+-- CreateIndex
+CREATE INDEX "DocumentChunk_documentId_contentHash_idx" ON "DocumentChunk"("documentId", "contentHash");
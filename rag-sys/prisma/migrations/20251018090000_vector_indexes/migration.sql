@@ -0,0 +1,121 @@
+-- Fix the embedding dimension so the columns can carry an HNSW index.
+-- nomic-embed-text-v1.5 produces 768-d vectors; anything else stored here
+-- could never have matched a 768-d query, so it is cleared for re-embedding.
+UPDATE "DocumentChunk" SET "embedding" = NULL WHERE "embedding" IS NOT NULL AND vector_dims("embedding") <> 768;
+UPDATE "Task" SET "embedding" = NULL WHERE "embedding" IS NOT NULL AND vector_dims("embedding") <> 768;
+UPDATE "Message" SET "embedding" = NULL WHERE "embedding" IS NOT NULL AND vector_dims("embedding") <> 768;
+
+-- AlterTable
+ALTER TABLE "DocumentChunk" ALTER COLUMN "embedding" TYPE vector(768);
+ALTER TABLE "Task" ALTER COLUMN "embedding" TYPE vector(768);
+ALTER TABLE "Message" ALTER COLUMN "embedding" TYPE vector(768);
+
+-- CreateIndex (the RPCs rank by cosine distance, <=>)
+CREATE INDEX "DocumentChunk_embedding_hnsw_idx" ON "DocumentChunk" USING hnsw ("embedding" vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX "Task_embedding_hnsw_idx" ON "Task" USING hnsw ("embedding" vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX "Message_embedding_hnsw_idx" ON "Message" USING hnsw ("embedding" vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- CreateIndex
+CREATE INDEX "DocumentChunk_projectId_idx" ON "DocumentChunk"("projectId");
+CREATE INDEX "Task_projectId_idx" ON "Task"("projectId");
+CREATE INDEX "Message_conversationId_idx" ON "Message"("conversationId");
+
+-- Replace the retrieval RPCs so they can use the HNSW indexes and take a
+-- per-query search breadth. Older overloads are dropped first, otherwise
+-- PostgREST can't pick between them.
+DO $$
+DECLARE f regprocedure;
+BEGIN
+    FOR f IN
+        SELECT p.oid::regprocedure FROM pg_proc p
+        WHERE p.pronamespace = 'public'::regnamespace
+          AND p.proname IN ('retrieve_document_chunks', 'retrieve_tasks', 'retrieve_messages')
+    LOOP
+        EXECUTE 'DROP FUNCTION ' || f;
+    END LOOP;
+END $$;
+
+-- hnsw.ef_search is the candidate list size: higher finds more of the true
+-- nearest neighbours (and more rows that survive the project filter) at the
+-- cost of latency. On pgvector >= 0.8 the scan also keeps going until
+-- match_count rows pass the filter (iterative_scan); older versions ignore it.
+CREATE FUNCTION retrieve_document_chunks(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (id text, content text, similarity float)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    SELECT c.id, c.content, (1 - (c.embedding <=> query_embedding))::float AS similarity
+    FROM "DocumentChunk" c
+    WHERE c."projectId" = retrieve_document_chunks.project_id
+      AND 1 - (c.embedding <=> query_embedding) > match_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+CREATE FUNCTION retrieve_tasks(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (id text, content text, similarity float)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    SELECT t.id, t.content, (1 - (t.embedding <=> query_embedding))::float AS similarity
+    FROM "Task" t
+    WHERE t."projectId" = retrieve_tasks.project_id
+      AND 1 - (t.embedding <=> query_embedding) > match_threshold
+    ORDER BY t.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+CREATE FUNCTION retrieve_messages(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    conversation_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (id text, content text, similarity float)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    SELECT m.id, m.content, (1 - (m.embedding <=> query_embedding))::float AS similarity
+    FROM "Message" m
+    WHERE m."conversationId" = retrieve_messages.conversation_id
+      AND 1 - (m.embedding <=> query_embedding) > match_threshold
+    ORDER BY m.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,78 @@
+-- Batch variants of the retrieval RPCs: several query embeddings in, one
+-- round trip out. Every query runs through the single-query function, so
+-- thresholds and HNSW settings are the same; query_ix is the query's 0-based
+-- position in the input. Embeddings (and texts) are passed as JSON arrays,
+-- which PostgREST hands over unchanged.
+CREATE FUNCTION retrieve_document_chunks_batch(
+    query_embeddings jsonb,
+    match_threshold float,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (query_ix int, id text, content text, similarity float, embedding vector(768))
+LANGUAGE sql
+AS $$
+    SELECT (e.ord - 1)::int, r.id, r.content, r.similarity, r.embedding
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS e(vec, ord)
+    CROSS JOIN LATERAL retrieve_document_chunks(
+        (e.vec #>> '{}')::vector(768), match_threshold, match_count, project_id, ef_search
+    ) r;
+$$;
+
+CREATE FUNCTION retrieve_tasks_batch(
+    query_embeddings jsonb,
+    match_threshold float,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (query_ix int, id text, content text, similarity float, embedding vector(768))
+LANGUAGE sql
+AS $$
+    SELECT (e.ord - 1)::int, r.id, r.content, r.similarity, r.embedding
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS e(vec, ord)
+    CROSS JOIN LATERAL retrieve_tasks(
+        (e.vec #>> '{}')::vector(768), match_threshold, match_count, project_id, ef_search
+    ) r;
+$$;
+
+CREATE FUNCTION retrieve_messages_batch(
+    query_embeddings jsonb,
+    match_threshold float,
+    match_count int,
+    conversation_id text,
+    ef_search int DEFAULT 100
+)
+RETURNS TABLE (query_ix int, id text, content text, similarity float, embedding vector(768))
+LANGUAGE sql
+AS $$
+    SELECT (e.ord - 1)::int, r.id, r.content, r.similarity, r.embedding
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS e(vec, ord)
+    CROSS JOIN LATERAL retrieve_messages(
+        (e.vec #>> '{}')::vector(768), match_threshold, match_count, conversation_id, ef_search
+    ) r;
+$$;
+
+CREATE FUNCTION retrieve_document_chunks_hybrid_batch(
+    query_embeddings jsonb,
+    query_texts jsonb,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100,
+    candidate_count int DEFAULT 40,
+    rrf_k int DEFAULT 60,
+    full_text_weight float DEFAULT 1.0,
+    semantic_weight float DEFAULT 1.0
+)
+RETURNS TABLE (query_ix int, id text, content text, similarity float, score float, embedding vector(768))
+LANGUAGE sql
+AS $$
+    SELECT (e.ord - 1)::int, r.id, r.content, r.similarity, r.score, r.embedding
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS e(vec, ord)
+    JOIN jsonb_array_elements_text(query_texts) WITH ORDINALITY AS t(txt, ord) ON t.ord = e.ord
+    CROSS JOIN LATERAL retrieve_document_chunks_hybrid(
+        (e.vec #>> '{}')::vector(768), t.txt, match_count, project_id, ef_search,
+        candidate_count, rrf_k, full_text_weight, semantic_weight
+    ) r;
+$$;
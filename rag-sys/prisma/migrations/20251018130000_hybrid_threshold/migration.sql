@@ -0,0 +1,90 @@
+-- Hybrid retrieval had no similarity floor on its semantic side, so every
+-- query came back with match_count chunks, however unrelated. Semantic
+-- candidates now have to clear match_threshold, like retrieve_document_chunks;
+-- full-text matches still qualify on their own. The new parameter comes last
+-- so positional callers keep working.
+DROP FUNCTION IF EXISTS retrieve_document_chunks_hybrid_batch(jsonb, jsonb, int, text, int, int, int, float, float);
+DROP FUNCTION IF EXISTS retrieve_document_chunks_hybrid(vector, text, int, text, int, int, int, float, float);
+
+CREATE FUNCTION retrieve_document_chunks_hybrid(
+    query_embedding vector(768),
+    query_text text,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100,
+    candidate_count int DEFAULT 40,
+    rrf_k int DEFAULT 60,
+    full_text_weight float DEFAULT 1.0,
+    semantic_weight float DEFAULT 1.0,
+    match_threshold float DEFAULT 0.2
+)
+RETURNS TABLE (id text, content text, similarity float, score float, embedding vector(768))
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    q tsquery := replace(plainto_tsquery('english', query_text)::text, ' & ', ' | ')::tsquery;
+BEGIN
+    PERFORM set_config('hnsw.ef_search', greatest(ef_search, candidate_count)::text, true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN others THEN NULL;
+    END;
+    RETURN QUERY
+    WITH full_text AS (
+        SELECT c.id, row_number() OVER (ORDER BY ts_rank_cd(c."contentTsv", q) DESC) AS rank_ix
+        FROM "DocumentChunk" c
+        WHERE c."projectId" = retrieve_document_chunks_hybrid.project_id
+          AND c."contentTsv" @@ q
+        ORDER BY rank_ix
+        LIMIT candidate_count
+    ),
+    semantic AS (
+        SELECT c.id, row_number() OVER (ORDER BY c.embedding <=> query_embedding) AS rank_ix
+        FROM "DocumentChunk" c
+        WHERE c."projectId" = retrieve_document_chunks_hybrid.project_id
+          AND c.embedding IS NOT NULL
+          AND 1 - (c.embedding <=> query_embedding) > match_threshold
+        ORDER BY c.embedding <=> query_embedding
+        LIMIT candidate_count
+    ),
+    fused AS (
+        SELECT coalesce(f.id, s.id) AS id,
+               coalesce(full_text_weight / (rrf_k + f.rank_ix), 0.0)
+             + coalesce(semantic_weight / (rrf_k + s.rank_ix), 0.0) AS score
+        FROM full_text f
+        FULL OUTER JOIN semantic s ON f.id = s.id
+        ORDER BY score DESC
+        LIMIT match_count
+    )
+    SELECT c.id, c.content, (1 - (c.embedding <=> query_embedding))::float AS similarity,
+           fused.score::float, c.embedding
+    FROM fused
+    JOIN "DocumentChunk" c ON c.id = fused.id
+    ORDER BY fused.score DESC;
+END;
+$$;
+
+CREATE FUNCTION retrieve_document_chunks_hybrid_batch(
+    query_embeddings jsonb,
+    query_texts jsonb,
+    match_count int,
+    project_id text,
+    ef_search int DEFAULT 100,
+    candidate_count int DEFAULT 40,
+    rrf_k int DEFAULT 60,
+    full_text_weight float DEFAULT 1.0,
+    semantic_weight float DEFAULT 1.0,
+    match_threshold float DEFAULT 0.2
+)
+RETURNS TABLE (query_ix int, id text, content text, similarity float, score float, embedding vector(768))
+LANGUAGE sql
+AS $$
+    SELECT (e.ord - 1)::int, r.id, r.content, r.similarity, r.score, r.embedding
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS e(vec, ord)
+    JOIN jsonb_array_elements_text(query_texts) WITH ORDINALITY AS t(txt, ord) ON t.ord = e.ord
+    CROSS JOIN LATERAL retrieve_document_chunks_hybrid(
+        (e.vec #>> '{}')::vector(768), t.txt, match_count, project_id, ef_search,
+        candidate_count, rrf_k, full_text_weight, semantic_weight, match_threshold
+    ) r;
+$$;
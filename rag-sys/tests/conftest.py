@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# app.database creates its Supabase client at import time; the tests never
+# call it, they only need the import to succeed
+os.environ.setdefault("NEXT_PUBLIC_SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test.service.role")
@@ -0,0 +1,86 @@
+from app.routing.context import estimate_tokens, pack_context
+
+
+def _row(id, content, embedding=None, similarity=0.5, score=None):
+    return {"id": id, "content": content, "embedding": embedding, "similarity": similarity, "score": score}
+
+
+def _ids(candidates):
+    return [c.id for c in candidates]
+
+
+def test_mmr_prefers_a_new_topic_over_a_near_copy():
+    results = {"docs": [
+        _row("a", "lease term", [1.0, 0.0], similarity=0.9),
+        _row("a-copy", "lease term, re-uploaded", [0.99, 0.14], similarity=0.85),
+        _row("b", "parking", [0.0, 1.0], similarity=0.6),
+    ]}
+    packed = pack_context(results, budget_tokens=1000, mmr_lambda=0.5, dedup_sim=1.01)
+    assert _ids(packed.kept) == ["a", "b", "a-copy"]
+
+
+def test_near_duplicates_above_dedup_sim_are_dropped():
+    results = {"docs": [
+        _row("a", "lease term", [1.0, 0.0], similarity=0.9),
+        _row("a-copy", "lease term, re-uploaded", [0.99, 0.14], similarity=0.85),
+    ]}
+    packed = pack_context(results, budget_tokens=1000, mmr_lambda=0.5, dedup_sim=0.95)
+    assert _ids(packed.kept) == ["a"]
+    assert _ids(packed.duplicates) == ["a-copy"]
+
+
+def test_identical_text_is_dropped_across_sources():
+    results = {
+        "docs": [_row("d1", "Rent is due on the 1st.")],
+        "messages": [_row("m1", "Rent is  due on the 1st.\n")],
+    }
+    packed = pack_context(results, budget_tokens=1000)
+    assert _ids(packed.kept) == ["d1"]
+    assert _ids(packed.duplicates) == ["m1"]
+    assert packed.context == "### docs\nRent is due on the 1st.\n"
+
+
+def test_hybrid_score_outranks_cosine():
+    results = {"docs": [
+        _row("semantic", "about leases", similarity=0.9, score=0.01),
+        _row("exact-id", "clause 14.2(b)", similarity=0.2, score=0.03),
+    ]}
+    packed = pack_context(results, budget_tokens=1000, mmr_lambda=1.0)
+    assert _ids(packed.kept) == ["exact-id", "semantic"]
+
+
+def test_budget_stops_packing_but_smaller_chunks_still_fit():
+    big, small = "x" * 400, "y" * 40
+    results = {"docs": [
+        _row("big", big, similarity=0.9),
+        _row("small", small, similarity=0.8),
+    ]}
+    packed = pack_context(results, budget_tokens=50)
+    assert _ids(packed.kept) == ["small"]
+    assert _ids(packed.over_budget) == ["big"]
+    assert packed.tokens == estimate_tokens(small) + 4 <= 50
+
+
+def test_budget_cut_keeps_the_best_ranked_rows():
+    rows = [_row(str(i), f"chunk {i} " + "z" * 32, similarity=1 - i / 10) for i in range(4)]
+    cost = estimate_tokens(rows[0]["content"]) + 4
+    packed = pack_context({"docs": rows}, budget_tokens=2 * cost)
+    assert _ids(packed.kept) == ["0", "1"]
+    assert _ids(packed.over_budget) == ["2", "3"]
+    assert packed.tokens == 2 * cost
+
+
+def test_sources_keep_their_order_in_the_prompt():
+    results = {
+        "tasks": [_row("t1", "Sign the lease", similarity=0.3)],
+        "docs": [_row("d1", "The lease runs ten years", similarity=0.9)],
+    }
+    packed = pack_context(results, budget_tokens=1000)
+    assert packed.context == "### tasks\nSign the lease\n### docs\nThe lease runs ten years\n"
+
+
+def test_empty_results():
+    packed = pack_context({"docs": [], "tasks": []}, budget_tokens=1000)
+    assert packed.context == ""
+    assert packed.tokens == 0
+    assert packed.kept == []
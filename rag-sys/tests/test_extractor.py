@@ -0,0 +1,87 @@
+import re
+
+import pytest
+from semantic_text_splitter import TextSplitter
+
+from app.embedding import extractor
+from app.embedding.extractor import _row_chunks, _split_stream
+
+LIMIT = 120
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(extractor, "max_characters", LIMIT)
+    monkeypatch.setattr(extractor, "splitter", TextSplitter(LIMIT))
+
+
+# ──────────────────────────  _row_chunks  ───────────────────────────────
+
+def test_header_is_repeated_on_every_row_aligned_chunk():
+    rows = [["name", "qty"]] + [[f"item{i}", i] for i in range(20)]
+    chunks = list(_row_chunks("Sheet1", rows))
+    prefix = "Sheet1\n| name | qty |\n| --- | --- |\n"
+
+    assert len(chunks) > 1
+    body = []
+    for chunk in chunks:
+        assert len(chunk) <= LIMIT
+        assert chunk.startswith(prefix)
+        lines = chunk[len(prefix):].split("\n")
+        assert all(re.fullmatch(r"\| item\d+ \| \d+ \|", line) for line in lines)
+        body += lines
+    assert body == [f"| item{i} | {i} |" for i in range(20)]
+
+
+def test_blank_rows_skipped_and_short_rows_padded():
+    rows = [["a", "b", "c"], [], [None, ""], ["1", None], ["2", "x", "y", None]]
+    assert list(_row_chunks("T", rows)) == [
+        "T\n| a | b | c |\n| --- | --- | --- |\n| 1 |  |  |\n| 2 | x | y |"
+    ]
+
+
+def test_pipes_in_cells_are_escaped():
+    rows = [["expr"], ["a|b"]]
+    assert list(_row_chunks("T", rows)) == ["T\n| expr |\n| --- |\n| a\\|b |"]
+
+
+def test_header_only_sheet():
+    assert list(_row_chunks("T", [["a", "b"]])) == ["T\n| a | b |\n| --- | --- |"]
+
+
+def test_empty_sheet():
+    assert list(_row_chunks("T", [[], [None]])) == []
+
+
+def test_row_wider_than_a_chunk_is_split_under_the_header():
+    rows = [["notes"], [" ".join(["word"] * 60)]]
+    chunks = list(_row_chunks("T", rows))
+    prefix = "T\n| notes |\n| --- |\n"
+
+    assert len(chunks) > 1
+    assert all(chunk.startswith(prefix) for chunk in chunks)
+    assert " ".join(c[len(prefix):] for c in chunks).split() == ["|"] + ["word"] * 60 + ["|"]
+
+
+# ──────────────────────────  _split_stream  ─────────────────────────────
+
+def test_short_segments_are_carried_into_one_chunk():
+    segments = [f"segment {i}" for i in range(5)]
+    assert list(_split_stream(segments)) == ["\n\n".join(segments)]
+
+
+def test_tail_is_carried_across_segments():
+    words = [f"w{i}" for i in range(300)]
+    segments = [" ".join(words[i:i + 10]) for i in range(0, len(words), 10)]
+    chunks = list(_split_stream(segments))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= LIMIT for chunk in chunks)
+    # nothing lost or reordered, and chunks span segment boundaries
+    assert " ".join(chunks).split() == words
+    assert any("\n\n" in chunk for chunk in chunks)
+
+
+def test_empty_segments_are_skipped():
+    assert list(_split_stream(["", "only", ""])) == ["only"]
+    assert list(_split_stream([])) == []
@@ -0,0 +1,32 @@
+from app.embedding.store import split_batch_rows
+
+
+def test_rows_are_regrouped_by_query_ix():
+    rows = [
+        {"query_ix": 1, "id": "b1", "similarity": 0.4, "embedding": None},
+        {"query_ix": 0, "id": "a1", "similarity": 0.7, "embedding": None},
+        {"query_ix": 2, "id": "c1", "similarity": 0.1, "embedding": None},
+        {"query_ix": 1, "id": "b2", "similarity": 0.8, "embedding": None},
+    ]
+    out = split_batch_rows(rows, 4)
+    assert [[r["id"] for r in results] for results in out] == [["a1"], ["b2", "b1"], ["c1"], []]
+
+
+def test_query_ix_is_stripped_and_embeddings_parsed():
+    rows = [{"query_ix": 0, "id": "a", "similarity": 0.5, "embedding": "[0.5,-1.0]"}]
+    assert split_batch_rows(rows, 1) == [[{"id": "a", "similarity": 0.5, "embedding": [0.5, -1.0]}]]
+    assert "query_ix" in rows[0]  # the caller's rows are left alone
+
+
+def test_order_by_another_column():
+    rows = [
+        {"query_ix": 0, "id": "cosine-best", "similarity": 0.9, "score": 0.01},
+        {"query_ix": 0, "id": "no-score", "similarity": 0.5, "score": None},
+        {"query_ix": 0, "id": "fused-best", "similarity": 0.3, "score": 0.03},
+    ]
+    out = split_batch_rows(rows, 1, order_by="score")
+    assert [r["id"] for r in out[0]] == ["fused-best", "cosine-best", "no-score"]
+
+
+def test_no_rows():
+    assert split_batch_rows([], 2) == [[], []]